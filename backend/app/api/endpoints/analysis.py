@@ -1,69 +1,486 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import uuid
 import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 
 from app.models.schemas import (
     AnalysisRequest, AnalysisTask, AnalysisStatus, 
     AnalysisResult, ApiResponse, FilterDetailResponse,
     FilteredRecord
 )
-from app.services.analyzer import analyzer
-from app.api.endpoints.upload import get_file_path
+from app.core.config import settings
+from app.services.analyzer import analyzer, summarize_counters
+from app.api.endpoints.upload import get_file_path, get_content_hash, lookup_file
+from app.services.frame_cache import frame_cache
+from app.services.result_cache import result_cache, make_result_key
+from app.services.row_source import RowSource
+from app.services.cancellation import CancellationToken, AnalysisCancelled
+from app.services.task_scheduler import scheduler, priority_for_size, PRIORITY_NAMES, QueueFullError
+from app.services import analysis_process
+from app.services import deep_validator
+from app.services.task_queue import task_queue, QueueWatcher
+from app.services.metadata_store import metadata_store
+from app.services.progress_events import progress_hub
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# 存储分析任务的内存字典（生产环境应使用数据库和消息队列）
+# 分析任务的内存缓存：进行中的任务和最近访问的任务（完整记录和结果保存在元数据数据库中）
 analysis_tasks = {}
-executor = ThreadPoolExecutor(max_workers=3)  # 限制并发分析任务数
+# 内存中已结束任务的访问顺序，超过TASK_MEMORY_CACHE_SIZE时淘汰最久未访问的任务
+finished_tasks: 'OrderedDict[str, None]' = OrderedDict()
+_finished_lock = threading.Lock()
+# 未结束任务的取消令牌
+cancel_tokens: Dict[str, CancellationToken] = {}
+# 调度器中未结束任务的结果缓存键，排队中被取消时用于结束进行中登记
+task_cache_keys: Dict[str, str] = {}
+# 附加到进行中任务的请求：任务ID -> (结果缓存键, 配置快照)，执行的任务被取消或超时时改为独立执行
+follower_snapshots: Dict[str, tuple] = {}
+# 持久化队列（TASK_QUEUE_BACKEND为sqlite）中本进程提交的任务的状态跟踪
+queue_watcher = QueueWatcher(task_queue)
+
+def _use_task_queue() -> bool:
+    return settings.TASK_QUEUE_BACKEND == "sqlite"
+
+_FINISHED_STATUSES = (AnalysisStatus.COMPLETED, AnalysisStatus.FAILED, AnalysisStatus.CANCELLED)
+
+def recover_tasks() -> None:
+    """
+    服务启动时处理上次运行遗留的任务
+    
+    API进程内执行的任务随进程结束而中断，标记为失败；
+    使用持久化队列时任务由工作进程继续执行，查询时从队列读取最新状态。
+    """
+    if _use_task_queue():
+        return
+    interrupted = metadata_store.interrupt_unfinished_tasks("服务重启，任务已中断")
+    if interrupted:
+        logger.warning("服务重启，%d 个未完成的分析任务已标记为失败", interrupted)
+
+def _task_changed(task_id: str) -> None:
+    """任务状态变化：写入元数据数据库（结果已由_store_result保存）并通知进度订阅者"""
+    task_info = analysis_tasks.get(task_id)
+    if task_info is None:
+        return
+    try:
+        metadata_store.save_task(task_info)
+    except Exception as e:
+        logger.error("保存任务 %s 出错: %s", task_id, e)
+    if task_info["status"] == AnalysisStatus.PENDING:
+        progress_hub.publish(task_id)
+    else:
+        # 任务开始或结束时其他排队任务的位置也会变化
+        progress_hub.publish_all()
+    if task_info["status"] in _FINISHED_STATUSES:
+        _touch_finished(task_id)
+
+def _touch_finished(task_id: str) -> None:
+    """
+    记录已结束任务的访问，内存中的已结束任务超过上限时淘汰最久未访问的任务
+    
+    淘汰的任务（含结果）之后从元数据数据库读取；
+    已取消但分析尚未停止的任务还会更新，暂不淘汰。
+    """
+    with _finished_lock:
+        finished_tasks[task_id] = None
+        finished_tasks.move_to_end(task_id)
+        for evicted in list(finished_tasks)[:max(0, len(finished_tasks) - settings.TASK_MEMORY_CACHE_SIZE)]:
+            if evicted in cancel_tokens or queue_watcher.is_watching(evicted):
+                continue
+            del finished_tasks[evicted]
+            task_info = analysis_tasks.get(evicted)
+            if task_info is not None and task_info["status"] in _FINISHED_STATUSES:
+                del analysis_tasks[evicted]
+
+def _store_result(result, result_id: str) -> None:
+    """保存分析结果（共享的结果只保存一次，由各任务通过结果ID引用）"""
+    try:
+        if result._result_id is not None and metadata_store.has_result(result._result_id):
+            return
+        result._result_id = metadata_store.save_result(result_id, result)
+    except Exception as e:
+        logger.error("保存分析结果 %s 出错: %s", result_id, e)
+
+async def _with_raw_data(result, records: List[FilteredRecord]) -> List[FilteredRecord]:
+    """为过滤记录按需加载原始数据（首次加载需读取源文件，在线程池中执行）"""
+    row_source = getattr(result, "_row_source", None)
+    if row_source is None or not records:
+        return records
+    
+    raw_rows = await run_in_threadpool(
+        row_source.get_raw_data_many, [record.record_index for record in records]
+    )
+    return [
+        record.model_copy(update={"raw_data": raw_data})
+        for record, raw_data in zip(records, raw_rows)
+    ]
 
 class ProgressTracker:
-    """进度跟踪器"""
-    def __init__(self, task_id: str):
+    """进度跟踪器（同时更新附加到该任务的重复请求）"""
+    def __init__(self, task_id: str, cache_key: Optional[str] = None):
         self.task_id = task_id
+        self.cache_key = cache_key
     
     def update_progress(self, progress: float, message: str = ""):
         """更新任务进度"""
-        if self.task_id in analysis_tasks:
-            analysis_tasks[self.task_id]["progress"] = progress
-            analysis_tasks[self.task_id]["status_message"] = message
-            print(f"任务 {self.task_id}: {progress}% - {message}")
+        followers = result_cache.followers_of(self.cache_key) if self.cache_key else []
+        for task_id in [self.task_id, *followers]:
+            if task_id in analysis_tasks:
+                analysis_tasks[task_id]["progress"] = progress
+                analysis_tasks[task_id]["status_message"] = message
+                progress_hub.publish(task_id)
+        logger.debug("任务 %s: %s%% - %s", self.task_id, progress, message)
+
+def _bind_result(result, task_id: str):
+    """为共享的分析结果绑定本任务文件的行访问器（内容相同的文件可能是不同的上传）"""
+    file_id = analysis_tasks[task_id]["file_id"]
+    row_source = getattr(result, "_row_source", None)
+    if row_source is not None and row_source.file_id == file_id:
+        return result
+    try:
+        file_path = get_file_path(file_id)
+    except ValueError:
+        return result
+    bound = result.model_copy()
+    bound._row_source = RowSource(file_path, file_id)
+    return bound
+
+def _complete_task(task_id: str, result, message: str = "分析完成") -> None:
+    """更新任务完成状态（已取消的任务不再更新）"""
+    task_info = analysis_tasks.get(task_id)
+    if task_info is None or task_info["status"] == AnalysisStatus.CANCELLED:
+        return
+    # 先绑定结果再更新状态，查询到completed时结果一定可读
+    _store_result(result, task_id)
+    task_info["result"] = _bind_result(result, task_id)
+    task_info["started_time"] = task_info.get("started_time") or datetime.now()
+    task_info["completed_time"] = datetime.now()
+    task_info["progress"] = 100.0
+    task_info["status_message"] = message
+    task_info["status"] = AnalysisStatus.COMPLETED
+    _task_changed(task_id)
+
+def _fail_task(task_id: str, error: Exception) -> None:
+    """更新任务失败状态（已取消的任务不再更新）"""
+    task_info = analysis_tasks.get(task_id)
+    if task_info is None or task_info["status"] == AnalysisStatus.CANCELLED:
+        return
+    task_info["status"] = AnalysisStatus.FAILED
+    task_info["completed_time"] = datetime.now()
+    task_info["error_message"] = str(error)
+    task_info["status_message"] = f"分析失败: {str(error)}"
+    _task_changed(task_id)
 
-def run_analysis_sync(task_id: str, file_path: str) -> None:
-    """同步执行分析任务"""
+def _abort_task(task_id: str, error: AnalysisCancelled) -> None:
+    """更新任务中止状态：取消为cancelled，超时为failed，保留已处理部分的计数器"""
+    task_info = analysis_tasks.get(task_id)
+    if task_info is None:
+        return
+    task_info["status"] = AnalysisStatus.FAILED if error.timed_out else AnalysisStatus.CANCELLED
+    task_info["completed_time"] = datetime.now()
+    task_info["error_message"] = error.reason
+    task_info["status_message"] = f"分析已中止: {error.reason}"
+    if error.counters is not None:
+        task_info["partial_result"] = summarize_counters(error.counters)
+    _task_changed(task_id)
+
+def run_analysis_sync(task_id: str, file_path: str, task_analyzer=None,
+                      cache_key: Optional[str] = None,
+                      cancel_token: Optional[CancellationToken] = None) -> Optional[int]:
+    """
+    同步执行分析任务，完成后写入结果缓存并通知附加的重复请求
+    
+    Returns:
+        Optional[int]: 分析完成时为处理的记录数（供调度器估算吞吐量）
+    """
+    result = None
+    error: Optional[Exception] = None
+    cancel_token = cancel_token or CancellationToken(settings.ANALYSIS_TIMEOUT)
     try:
+        # 排队期间已取消的任务直接结束，执行槽位交给下一个任务
+        cancel_token.check()
+        cancel_token.start()
+        
         # 更新任务状态
         analysis_tasks[task_id]["status"] = AnalysisStatus.PROCESSING
         analysis_tasks[task_id]["started_time"] = datetime.now()
+        _task_changed(task_id)
         
         # 创建进度跟踪器
-        progress_tracker = ProgressTracker(task_id)
+        progress_tracker = ProgressTracker(task_id, cache_key)
         
-        # 执行分析
-        result = analyzer.analyze_excel(
+        # 执行分析（使用任务创建时的配置快照，开启进程隔离时在工作进程中执行）
+        task_analyzer = task_analyzer or analyzer.snapshot()
+        result = analysis_process.execute_analysis(
+            task_analyzer,
             file_path, 
-            progress_callback=progress_tracker.update_progress
+            progress_callback=progress_tracker.update_progress,
+            file_id=analysis_tasks[task_id]["file_id"],
+            cancel_token=cancel_token
         )
         
-        # 更新任务完成状态
-        analysis_tasks[task_id]["status"] = AnalysisStatus.COMPLETED
-        analysis_tasks[task_id]["completed_time"] = datetime.now()
-        analysis_tasks[task_id]["progress"] = 100.0
-        analysis_tasks[task_id]["result"] = result
-        analysis_tasks[task_id]["status_message"] = "分析完成"
-        
+    except AnalysisCancelled as e:
+        # 取消或超时：保留已处理部分的计数器
+        error = e
+        logger.info("分析任务 %s 已中止: %s", task_id, e.reason)
+    
     except Exception as e:
-        # 更新任务失败状态
-        analysis_tasks[task_id]["status"] = AnalysisStatus.FAILED
-        analysis_tasks[task_id]["completed_time"] = datetime.now()
-        analysis_tasks[task_id]["error_message"] = str(e)
-        analysis_tasks[task_id]["status_message"] = f"分析失败: {str(e)}"
-        print(f"分析任务 {task_id} 失败: {e}")
+        error = e
+        logger.error("分析任务 %s 失败: %s", task_id, e)
+    
+    finally:
+        _settle_task(task_id, cache_key, result, error)
+    
+    return result.total_records if result is not None else None
+
+def _settle_task(task_id: str, cache_key: Optional[str], result, error: Optional[Exception]) -> None:
+    """更新任务的最终状态，写入结果缓存并通知附加的重复请求"""
+    cancel_tokens.pop(task_id, None)
+    task_cache_keys.pop(task_id, None)
+    if result is not None:
+        _complete_task(task_id, result)
+    elif isinstance(error, AnalysisCancelled):
+        _abort_task(task_id, error)
+    elif error is not None:
+        _fail_task(task_id, error)
+    
+    if not cache_key:
+        return
+    if result is None and isinstance(error, AnalysisCancelled):
+        # 取消和超时只针对本任务，附加的请求由其中一个接替执行
+        _hand_off(task_id, cache_key)
+        return
+    for follower_id in result_cache.finish(cache_key, result):
+        follower_snapshots.pop(follower_id, None)
+        if result is not None:
+            _complete_task(follower_id, result, f"分析完成（与任务 {task_id} 共享结果）")
+        else:
+            _fail_task(follower_id, error or RuntimeError("分析任务已中断"))
+
+def _hand_off(task_id: str, cache_key: str) -> None:
+    """执行的任务未得到结果就结束：第一个未结束的附加任务使用自己的配置快照接替执行，其余附加任务改为等待它"""
+    while True:
+        leader_id = result_cache.handoff(cache_key)
+        if leader_id is None:
+            return
+        _, task_analyzer = follower_snapshots.pop(leader_id, (None, None))
+        task_info = analysis_tasks.get(leader_id)
+        if task_analyzer is None or task_info is None or task_info["status"] != AnalysisStatus.PENDING:
+            continue
+        try:
+            file_path = get_file_path(task_info["file_id"])
+            task_info["coalesced_with"] = None
+            task_info["status_message"] = f"共享的分析任务 {task_id} 已结束，改为独立执行"
+            for follower_id in result_cache.followers_of(cache_key):
+                follower_info = analysis_tasks.get(follower_id)
+                if follower_info is not None:
+                    follower_info["coalesced_with"] = leader_id
+                    follower_info["status_message"] = f"相同文件的分析正在进行，等待任务 {leader_id} 完成"
+                    _task_changed(follower_id)
+            # 请求已被接受，不受排队上限限制
+            _submit_task(leader_id, file_path, task_analyzer, cache_key, bounded=False)
+            logger.info("任务 %s 未完成，附加的任务 %s 接替执行", task_id, leader_id)
+            return
+        except Exception as e:
+            logger.error("附加的任务 %s 接替执行失败: %s", leader_id, e)
+            _fail_task(leader_id, e)
+
+def _submit_task(task_id: str, file_path: str, task_analyzer, cache_key: Optional[str],
+                 bounded: bool = True) -> int:
+    """
+    提交任务到调度队列（小文件优先；超过ANALYSIS_TIMEOUT秒自动中止）
+    
+    Returns:
+        int: 排队位置
+    
+    Raises:
+        QueueFullError: 排队任务数已达上限
+    """
+    task_info = analysis_tasks[task_id]
+    file_id = task_info["file_id"]
+    file_info = lookup_file(file_id) or {}
+    priority = priority_for_size(file_info.get("file_size", 0))
+    estimated_rows = (file_info.get("validation_info") or {}).get("total_rows") or 0
+    task_info["priority"] = PRIORITY_NAMES[priority]
+    _task_changed(task_id)
+    
+    if _use_task_queue():
+        # 写入持久化队列，由独立的工作进程执行
+        queue_position = task_queue.enqueue(
+            task_id, file_id, file_path, {
+                "filter_rules": task_analyzer.get_filter_rules(),
+                "rule_overrides": task_info["filter_rules"],
+                "staff_list": task_analyzer.get_staff_list(),
+                "timeout": settings.ANALYSIS_TIMEOUT
+            }, priority, estimated_rows, deep_validator.get_skippable_rows(file_id), bounded=bounded
+        )
+        _watch_queued_task(task_id, cache_key)
+        return queue_position
+    
+    cancel_token = CancellationToken(settings.ANALYSIS_TIMEOUT)
+    cancel_tokens[task_id] = cancel_token
+    if cache_key:
+        task_cache_keys[task_id] = cache_key
+    try:
+        return scheduler.submit(
+            task_id, priority, estimated_rows,
+            run_analysis_sync, task_id, file_path, task_analyzer, cache_key, cancel_token,
+            bounded=bounded
+        )
+    except QueueFullError:
+        cancel_tokens.pop(task_id, None)
+        task_cache_keys.pop(task_id, None)
+        raise
+
+def _job_outcome(job: Dict) -> tuple:
+    """由持久化队列中已结束的任务得到(分析结果, 错误)"""
+    if job["status"] == AnalysisStatus.COMPLETED:
+        result = task_queue.load_result(job["task_id"])
+        if result is None:
+            return None, RuntimeError("分析结果不存在")
+        result._row_source = RowSource(job["file_path"], job["file_id"])
+        return result, None
+    if job["status"] == AnalysisStatus.CANCELLED or job["timed_out"]:
+        error = AnalysisCancelled(job["error_message"] or "任务已取消", bool(job["timed_out"]))
+        error.counters = job["partial_result"]
+        return None, error
+    return None, RuntimeError(job["error_message"] or "分析失败")
+
+def _watch_queued_task(task_id: str, cache_key: Optional[str]) -> None:
+    """跟踪提交到持久化队列的任务：同步状态和进度，结束时读取结果"""
+    progress_tracker = ProgressTracker(task_id, cache_key)
+    
+    def on_progress(job: Dict) -> None:
+        task_info = analysis_tasks.get(task_id)
+        if task_info is None or task_info["status"] == AnalysisStatus.CANCELLED:
+            return
+        # 工作进程失联后任务可能重新排队
+        status = AnalysisStatus(job["status"])
+        if status != task_info["status"]:
+            task_info["status"] = status
+            task_info["started_time"] = job["started_time"]
+            _task_changed(task_id)
+        if (job["progress"], job["status_message"]) != (task_info["progress"], task_info.get("status_message")):
+            progress_tracker.update_progress(job["progress"], job["status_message"] or "")
+    
+    def on_finished(job: Dict) -> None:
+        result, error = _job_outcome(job)
+        if task_id in analysis_tasks:
+            analysis_tasks[task_id]["started_time"] = job["started_time"]
+        _settle_task(task_id, cache_key, result, error)
+    
+    queue_watcher.watch(task_id, on_progress, on_finished)
+
+def _task_info_from_job(job: Dict) -> Dict:
+    """由持久化队列中的任务（其他API进程提交）创建任务信息"""
+    status = AnalysisStatus(job["status"])
+    task = AnalysisTask(
+        task_id=job["task_id"],
+        file_id=job["file_id"],
+        filename=f"文件_{job['file_id']}",
+        status=status,
+        created_time=job["created_time"],
+        started_time=job["started_time"],
+        completed_time=job["completed_time"],
+        progress=job["progress"],
+        error_message=job["error_message"]
+    )
+    task_info = {
+        **task.dict(),
+        "status_message": job["status_message"] or "",
+        "filter_rules": job["payload"].get("rule_overrides"),
+        "cache_hit": False,
+        "coalesced_with": None,
+        "priority": PRIORITY_NAMES.get(job["priority"])
+    }
+    if job["partial_result"] is not None:
+        task_info["partial_result"] = summarize_counters(job["partial_result"])
+    if status == AnalysisStatus.COMPLETED:
+        task_info["result"], _ = _job_outcome(job)
+    return task_info
+
+def _task_info_from_record(record: Dict) -> Dict:
+    """由元数据数据库中的任务记录创建任务信息（读取分析结果）"""
+    task = AnalysisTask(
+        task_id=record["task_id"],
+        file_id=record["file_id"],
+        filename=record["filename"],
+        status=AnalysisStatus(record["status"]),
+        created_time=record["created_time"],
+        started_time=record["started_time"],
+        completed_time=record["completed_time"],
+        progress=record["progress"],
+        error_message=record["error_message"]
+    )
+    task_info = {
+        **task.dict(),
+        "status_message": record["status_message"] or "",
+        "filter_rules": record["filter_rules"],
+        "cache_hit": record["cache_hit"],
+        "coalesced_with": record["coalesced_with"],
+        "priority": record["priority"]
+    }
+    if record["partial_result"] is not None:
+        task_info["partial_result"] = record["partial_result"]
+    if record["result_id"]:
+        result = metadata_store.load_result(record["result_id"])
+        if result is not None:
+            try:
+                result._row_source = RowSource(get_file_path(record["file_id"]), record["file_id"])
+            except ValueError:
+                pass
+            task_info["result"] = result
+    return task_info
+
+async def _get_task_info(task_id: str) -> Dict:
+    """
+    获取任务信息
+    
+    本进程没有缓存的任务从元数据数据库读取（服务重启前或其他API进程的任务），
+    使用持久化队列时未结束的任务从队列读取最新状态；已结束的任务读取后缓存在本进程中。
+    
+    Raises:
+        HTTPException: 任务不存在
+    """
+    task_info = analysis_tasks.get(task_id)
+    if task_info is not None and task_info["status"] in _FINISHED_STATUSES:
+        _touch_finished(task_id)
+    if task_info is None:
+        record = await run_in_threadpool(metadata_store.get_task, task_id)
+        if record is not None:
+            task_info = await run_in_threadpool(_task_info_from_record, record)
+        if _use_task_queue() and (task_info is None or task_info["status"] not in _FINISHED_STATUSES):
+            job = await run_in_threadpool(task_queue.get, task_id)
+            if job is not None:
+                task_info = await run_in_threadpool(_task_info_from_job, job)
+                if task_info["status"] in _FINISHED_STATUSES:
+                    # 提交任务的API进程在任务结束前已退出：保存队列中的结果
+                    analysis_tasks[task_id] = task_info
+                    if task_info.get("result") is not None:
+                        await run_in_threadpool(_store_result, task_info["result"], task_id)
+                    await run_in_threadpool(_task_changed, task_id)
+        if task_info is not None and task_info["status"] in _FINISHED_STATUSES:
+            analysis_tasks[task_id] = task_info
+            _touch_finished(task_id)
+    if task_info is None:
+        raise HTTPException(
+            status_code=404,
+            detail="任务不存在"
+        )
+    return task_info
 
 @router.post("/start", response_model=ApiResponse)
 async def start_analysis(
@@ -74,7 +491,7 @@ async def start_analysis(
     开始分析任务
     
     - **file_id**: 要分析的文件ID
-    - **filter_rules**: 可选的过滤规则配置
+    - **filter_rules**: 可选的过滤规则启用设置（规则ID -> 是否启用），只对本次任务生效
     """
     try:
         # 验证文件是否存在
@@ -83,6 +500,12 @@ async def start_analysis(
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
         
+        # 创建本次任务的配置快照（应用请求中的规则启用设置）
+        try:
+            task_analyzer = analyzer.snapshot(request.filter_rules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # 生成任务ID
         task_id = str(uuid.uuid4())
         
@@ -99,27 +522,56 @@ async def start_analysis(
         # 存储任务信息
         analysis_tasks[task_id] = {
             **task.dict(),
-            "status_message": "等待开始分析"
+            "status_message": "等待开始分析",
+            "filter_rules": request.filter_rules,
+            "cache_hit": False,
+            "coalesced_with": None
         }
         
-        # 如果提供了自定义过滤规则，更新分析器配置
-        if request.filter_rules:
-            # 这里可以临时更新过滤规则，或者为每个任务创建独立的分析器实例
-            pass
+        # 按(文件内容, 过滤规则, 售后名单版本)查找缓存结果或进行中的相同分析
+        content_hash = get_content_hash(request.file_id)
+        cache_key = None
+        if content_hash:
+            cache_key = make_result_key(
+                content_hash, task_analyzer.get_filter_rules(), task_analyzer.get_staff_list_version()
+            )
+            cached_result, leader_task_id = result_cache.lookup(cache_key, task_id)
+            
+            if cached_result is not None:
+                analysis_tasks[task_id]["cache_hit"] = True
+                await run_in_threadpool(_complete_task, task_id, cached_result, "分析完成（命中结果缓存）")
+                return ApiResponse(
+                    success=True,
+                    message="分析完成（命中结果缓存）",
+                    data={"task_id": task_id, "status": "completed", "cache_hit": True}
+                )
+            
+            if leader_task_id is not None:
+                follower_snapshots[task_id] = (cache_key, task_analyzer)
+                analysis_tasks[task_id]["coalesced_with"] = leader_task_id
+                analysis_tasks[task_id]["status_message"] = f"相同文件的分析正在进行，等待任务 {leader_task_id} 完成"
+                await run_in_threadpool(_task_changed, task_id)
+                return ApiResponse(
+                    success=True,
+                    message="相同文件的分析正在进行，已附加到进行中的任务",
+                    data={"task_id": task_id, "status": "pending", "coalesced_with": leader_task_id}
+                )
         
-        # 提交后台任务
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(
-            executor,
-            run_analysis_sync,
-            task_id,
-            file_path
-        )
+        # 提交到调度队列（小文件优先；超过ANALYSIS_TIMEOUT秒自动中止）
+        try:
+            queue_position = await run_in_threadpool(_submit_task, task_id, file_path, task_analyzer, cache_key)
+        except QueueFullError as e:
+            # 撤销任务登记，调用方稍后重试（期间附加的请求由其中一个接替执行）
+            del analysis_tasks[task_id]
+            await run_in_threadpool(metadata_store.delete_task, task_id)
+            if cache_key:
+                await run_in_threadpool(_hand_off, task_id, cache_key)
+            raise HTTPException(status_code=429, detail=str(e))
         
         return ApiResponse(
             success=True,
             message="分析任务已启动",
-            data={"task_id": task_id, "status": "pending"}
+            data={"task_id": task_id, "status": "pending", "queue_position": queue_position}
         )
         
     except HTTPException:
@@ -130,17 +582,61 @@ async def start_analysis(
             detail=f"启动分析任务失败: {str(e)}"
         )
 
+async def _queue_info(task_id: str, task_info: Dict) -> Dict:
+    """未结束任务的排队位置和预计完成时间"""
+    if task_info["status"] not in (AnalysisStatus.PENDING, AnalysisStatus.PROCESSING):
+        return {}
+    leader_task_id = task_info.get("coalesced_with") or task_id
+    if _use_task_queue():
+        return await run_in_threadpool(task_queue.get_queue_info, leader_task_id)
+    return scheduler.get_queue_info(leader_task_id)
+
+async def _progress_event(task_id: str) -> Dict:
+    """
+    推送给进度订阅者的任务状态（不含分析结果）
+    
+    Raises:
+        HTTPException: 任务不存在
+    """
+    task_info = await _get_task_info(task_id)
+    event = {
+        "task_id": task_id,
+        "status": task_info["status"],
+        "progress": task_info["progress"],
+        "status_message": task_info.get("status_message", ""),
+        "error_message": task_info.get("error_message"),
+        "started_time": task_info.get("started_time"),
+        "completed_time": task_info.get("completed_time"),
+        "cache_hit": task_info.get("cache_hit", False),
+        "coalesced_with": task_info.get("coalesced_with")
+    }
+    if task_info.get("partial_result") is not None:
+        event["partial_result"] = task_info["partial_result"]
+    event.update(await _queue_info(task_id, task_info))
+    return jsonable_encoder(event)
+
+def _wait_timeout(task_ids) -> float:
+    """
+    等待进度通知的超时时间
+    
+    其他进程执行的任务（使用持久化队列时）本进程收不到通知，
+    按工作进程写入进度的间隔重新读取状态。
+    """
+    if all(task_id in analysis_tasks for task_id in task_ids):
+        return settings.PROGRESS_STREAM_KEEPALIVE
+    return settings.TASK_HEARTBEAT_SECONDS
+
+def _sse_message(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.get("/tasks/{task_id}", response_model=ApiResponse)
 async def get_task_status(task_id: str):
     """获取分析任务状态"""
     try:
-        if task_id not in analysis_tasks:
-            raise HTTPException(
-                status_code=404,
-                detail="任务不存在"
-            )
+        task_info = (await _get_task_info(task_id)).copy()
         
-        task_info = analysis_tasks[task_id].copy()
+        # 排队中的任务返回排队位置和预计完成时间
+        task_info.update(await _queue_info(task_id, task_info))
         
         return ApiResponse(
             success=True,
@@ -156,24 +652,157 @@ async def get_task_status(task_id: str):
             detail=f"获取任务状态失败: {str(e)}"
         )
 
+@router.get("/tasks/{task_id}/events")
+async def stream_task_progress(task_id: str):
+    """
+    以Server-Sent Events推送任务进度
+    
+    连接后立即推送当前状态，之后状态或进度变化时推送progress事件（不超过PROGRESS_STREAM_INTERVAL一次），
+    推送结束状态（completed/failed/cancelled）后关闭；任务被删除时推送deleted事件后关闭。
+    """
+    try:
+        await _get_task_info(task_id)
+        subscription = progress_hub.subscribe([task_id])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"订阅任务进度失败: {str(e)}"
+        )
+    
+    async def event_stream():
+        last_event = None
+        last_sent = 0.0
+        try:
+            while True:
+                try:
+                    event = await _progress_event(task_id)
+                except HTTPException:
+                    yield _sse_message("deleted", {"task_id": task_id})
+                    return
+                
+                if event != last_event:
+                    yield _sse_message("progress", event)
+                    last_event, last_sent = event, time.monotonic()
+                if event["status"] in _FINISHED_STATUSES:
+                    return
+                
+                if not await subscription.wait(_wait_timeout([task_id])) and \
+                        time.monotonic() - last_sent >= settings.PROGRESS_STREAM_KEEPALIVE:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                
+                # 合并推送间隔内的多次更新
+                await asyncio.sleep(max(0.0, last_sent + settings.PROGRESS_STREAM_INTERVAL - time.monotonic()))
+        finally:
+            progress_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def task_progress_socket(websocket: WebSocket):
+    """
+    在一个WebSocket连接上推送多个任务的进度
+    
+    客户端发送 {"subscribe": [任务ID, ...]} 或 {"unsubscribe": [任务ID, ...]}，
+    服务端推送 {"event": "progress", "data": 任务状态}；任务结束后推送最终状态并自动取消订阅，
+    不存在或已删除的任务推送 {"event": "deleted", "data": {"task_id": 任务ID}}。
+    """
+    await websocket.accept()
+    subscription = progress_hub.subscribe()
+    
+    async def receive_commands():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if not isinstance(message, dict):
+                    continue
+                subscription.add(str(task_id) for task_id in message.get("subscribe") or [])
+                subscription.remove(str(task_id) for task_id in message.get("unsubscribe") or [])
+        except (WebSocketDisconnect, ValueError):
+            return
+    
+    receiver = asyncio.create_task(receive_commands())
+    last_events: Dict[str, Dict] = {}
+    last_sent = 0.0
+    try:
+        while True:
+            waiter = asyncio.create_task(subscription.wait(_wait_timeout(subscription.task_ids)))
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                waiter.cancel()
+                break
+            
+            # 其他进程执行的任务收不到通知，每次都重新读取
+            changed = waiter.result() | {task_id for task_id in subscription.task_ids if task_id not in analysis_tasks}
+            
+            # 合并推送间隔内的多次更新
+            await asyncio.sleep(max(0.0, last_sent + settings.PROGRESS_STREAM_INTERVAL - time.monotonic()))
+            for task_id in changed:
+                try:
+                    event = await _progress_event(task_id)
+                except HTTPException:
+                    subscription.remove([task_id])
+                    last_events.pop(task_id, None)
+                    await websocket.send_json({"event": "deleted", "data": {"task_id": task_id}})
+                    continue
+                
+                if event != last_events.get(task_id):
+                    await websocket.send_json({"event": "progress", "data": event})
+                    last_events[task_id] = event
+                    last_sent = time.monotonic()
+                if event["status"] in _FINISHED_STATUSES:
+                    subscription.remove([task_id])
+                    last_events.pop(task_id, None)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        progress_hub.unsubscribe(subscription)
+
 @router.get("/tasks", response_model=ApiResponse)
 async def list_analysis_tasks():
     """获取所有分析任务列表"""
     try:
+        # 按创建时间倒序从元数据数据库读取，进行中的任务使用内存中的最新进度
         tasks_list = []
-        for task_id, task_info in analysis_tasks.items():
+        listed = set()
+        for record in await run_in_threadpool(metadata_store.list_tasks):
+            task_info = analysis_tasks.get(record["task_id"], record)
+            listed.add(record["task_id"])
             tasks_list.append({
-                "task_id": task_id,
+                "task_id": record["task_id"],
                 "file_id": task_info["file_id"],
                 "filename": task_info["filename"],
                 "status": task_info["status"],
                 "created_time": task_info["created_time"],
                 "progress": task_info["progress"],
-                "status_message": task_info.get("status_message", "")
+                "status_message": task_info.get("status_message") or "",
+                "cache_hit": task_info.get("cache_hit", False)
             })
         
-        # 按创建时间倒序排列
-        tasks_list.sort(key=lambda x: x["created_time"], reverse=True)
+        # 使用持久化队列时包括其他API进程提交的任务
+        if _use_task_queue():
+            for job in await run_in_threadpool(task_queue.list_jobs):
+                if job["task_id"] not in listed:
+                    tasks_list.append({
+                        "task_id": job["task_id"],
+                        "file_id": job["file_id"],
+                        "filename": f"文件_{job['file_id']}",
+                        "status": job["status"],
+                        "created_time": job["created_time"],
+                        "progress": job["progress"],
+                        "status_message": job["status_message"] or "",
+                        "cache_hit": False
+                    })
+        
+            # 按创建时间倒序排列
+            tasks_list.sort(key=lambda x: x["created_time"], reverse=True)
         
         return ApiResponse(
             success=True,
@@ -191,13 +820,7 @@ async def list_analysis_tasks():
 async def get_analysis_result(task_id: str):
     """获取分析结果"""
     try:
-        if task_id not in analysis_tasks:
-            raise HTTPException(
-                status_code=404,
-                detail="任务不存在"
-            )
-        
-        task_info = analysis_tasks[task_id]
+        task_info = await _get_task_info(task_id)
         
         if task_info["status"] != AnalysisStatus.COMPLETED:
             raise HTTPException(
@@ -211,12 +834,18 @@ async def get_analysis_result(task_id: str):
                 detail="分析结果不存在"
             )
         
+        # 过滤记录详情以紧凑形式存储，返回时再创建模型
+        result = task_info["result"]
+        record_store = getattr(result, "_record_store", None)
+        if record_store is not None:
+            result = result.model_copy(update={"filtered_records_details": list(record_store)})
+        
         return ApiResponse(
             success=True,
             message="获取分析结果成功",
             data={
                 "task_id": task_id,
-                "result": task_info["result"],
+                "result": result,
                 "completed_time": task_info["completed_time"]
             }
         )
@@ -233,25 +862,45 @@ async def get_analysis_result(task_id: str):
 async def cancel_or_delete_task(task_id: str):
     """取消或删除分析任务"""
     try:
-        if task_id not in analysis_tasks:
-            raise HTTPException(
-                status_code=404,
-                detail="任务不存在"
-            )
+        task_info = await _get_task_info(task_id)
         
-        task_info = analysis_tasks[task_id]
-        
-        # 如果任务正在运行，这里应该实现取消逻辑
-        # 由于使用了ThreadPoolExecutor，取消正在运行的任务比较复杂
-        # 在生产环境中，建议使用Celery等支持任务取消的队列系统
-        
-        if task_info["status"] == AnalysisStatus.PROCESSING:
-            # 标记为取消状态（实际的取消逻辑需要在分析函数中检查这个状态）
-            analysis_tasks[task_id]["status"] = "cancelled"
-            analysis_tasks[task_id]["status_message"] = "任务已取消"
+        if task_info["status"] in (AnalysisStatus.PENDING, AnalysisStatus.PROCESSING):
+            # 未结束的任务只取消不删除：分析在下一批记录前结束并释放执行槽位
+            # （工作进程超过宽限时间未结束时强制终止），
+            # 已处理部分的计数器保留在任务信息中，再次删除时才移除任务记录
+            cancel_token = cancel_tokens.get(task_id)
+            if cancel_token is not None:
+                cancel_token.cancel("任务已被用户取消")
+            follower = follower_snapshots.pop(task_id, None)
+            if follower is not None:
+                # 附加的请求只取消自己，执行的任务继续
+                result_cache.detach(follower[0], task_id)
+            if scheduler.cancel(task_id):
+                # 排队中的任务不会再执行：在这里结束，解除进行中登记并由附加的任务接替
+                await run_in_threadpool(
+                    _settle_task, task_id, task_cache_keys.get(task_id), None,
+                    AnalysisCancelled("任务已被用户取消")
+                )
+            if _use_task_queue():
+                await run_in_threadpool(task_queue.request_cancel, task_id)
+            task_info["status"] = AnalysisStatus.CANCELLED
+            task_info["completed_time"] = datetime.now()
+            task_info["status_message"] = "任务已取消"
+            await run_in_threadpool(_task_changed, task_id)
+            
+            return ApiResponse(
+                success=True,
+                message="任务已取消",
+                data={"task_id": task_id, "status": AnalysisStatus.CANCELLED}
+            )
         
         # 删除任务记录
-        del analysis_tasks[task_id]
+        analysis_tasks.pop(task_id, None)
+        with _finished_lock:
+            finished_tasks.pop(task_id, None)
+        await run_in_threadpool(metadata_store.delete_task, task_id)
+        if _use_task_queue():
+            await run_in_threadpool(task_queue.delete, task_id)
         
         return ApiResponse(
             success=True,
@@ -271,28 +920,26 @@ async def cancel_or_delete_task(task_id: str):
 async def get_analysis_stats():
     """获取分析统计信息"""
     try:
-        total_tasks = len(analysis_tasks)
-        completed_tasks = sum(1 for task in analysis_tasks.values() 
-                            if task["status"] == AnalysisStatus.COMPLETED)
-        processing_tasks = sum(1 for task in analysis_tasks.values() 
-                             if task["status"] == AnalysisStatus.PROCESSING)
-        failed_tasks = sum(1 for task in analysis_tasks.values() 
-                         if task["status"] == AnalysisStatus.FAILED)
-        
-        # 计算平均过滤率
-        completed_results = [task["result"] for task in analysis_tasks.values() 
-                           if task["status"] == AnalysisStatus.COMPLETED and "result" in task]
-        avg_filter_rate = 0.0
-        if completed_results:
-            avg_filter_rate = sum(result.filter_rate for result in completed_results) / len(completed_results)
+        # 各状态任务数和平均过滤率由元数据数据库汇总
+        task_stats = await run_in_threadpool(metadata_store.get_task_stats)
+        status_counts = task_stats["status_counts"]
         
         stats = {
-            "total_tasks": total_tasks,
-            "completed_tasks": completed_tasks,
-            "processing_tasks": processing_tasks,
-            "failed_tasks": failed_tasks,
-            "average_filter_rate": round(avg_filter_rate, 2)
+            "total_tasks": sum(status_counts.values()),
+            "completed_tasks": status_counts.get(AnalysisStatus.COMPLETED.value, 0),
+            "processing_tasks": status_counts.get(AnalysisStatus.PROCESSING.value, 0),
+            "failed_tasks": status_counts.get(AnalysisStatus.FAILED.value, 0),
+            "cancelled_tasks": status_counts.get(AnalysisStatus.CANCELLED.value, 0),
+            "average_filter_rate": round(task_stats["average_filter_rate"], 2),
+            "frame_cache": frame_cache.get_stats(),
+            "result_cache": result_cache.get_stats(),
+            "scheduler": scheduler.get_stats(),
+            "worker_processes": analysis_process.get_stats(),
+            "metadata_store": await run_in_threadpool(metadata_store.get_storage_stats),
+            "progress_streams": progress_hub.get_stats()
         }
+        if _use_task_queue():
+            stats["task_queue"] = await run_in_threadpool(task_queue.get_stats)
         
         return ApiResponse(
             success=True,
@@ -306,17 +953,73 @@ async def get_analysis_stats():
             detail=f"获取统计信息失败: {str(e)}"
         )
 
-@router.get("/tasks/{task_id}/filter-details/{filter_type}", response_model=ApiResponse)
-async def get_filter_details(task_id: str, filter_type: str, page: int = 1, page_size: int = 50):
-    """获取特定过滤类型的详细记录"""
+@router.post("/tasks/{task_id}/what-if", response_model=ApiResponse)
+async def evaluate_what_if(task_id: str, rules_update: Dict[str, Dict]):
+    """
+    按调整后的过滤规则重新计算分析结果（不重新读取源文件）
+    
+    请求体格式与更新过滤规则接口相同，只需给出要调整的字段，
+    如 {"staff_filter": {"enabled": false}, "early_morning_filter": {"end_hour": 7}}
+    """
     try:
-        if task_id not in analysis_tasks:
+        task_info = await _get_task_info(task_id)
+        
+        if task_info["status"] != AnalysisStatus.COMPLETED:
+            raise HTTPException(
+                status_code=409,
+                detail=f"任务尚未完成，当前状态: {task_info['status']}"
+            )
+        
+        feature_table = getattr(task_info.get("result"), "_feature_table", None)
+        if feature_table is None:
             raise HTTPException(
                 status_code=404,
-                detail="任务不存在"
+                detail="规则特征数据不存在"
             )
         
-        task_info = analysis_tasks[task_id]
+        # 在分析时的规则配置上应用调整
+        filter_rules = copy.deepcopy(feature_table.filter_rules)
+        for rule_id, rule_config in rules_update.items():
+            if rule_id not in filter_rules:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"未知的过滤规则: {rule_id}"
+                )
+            for hour_key in ("start_hour", "end_hour"):
+                hour = rule_config.get(hour_key)
+                if hour is not None and (not isinstance(hour, int) or not 0 <= hour <= 24):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"规则 {rule_id} 的 {hour_key} 应为0-24的整数"
+                    )
+            filter_rules[rule_id].update(rule_config)
+        
+        counters = feature_table.evaluate(filter_rules)
+        
+        return ApiResponse(
+            success=True,
+            message="规则调整结果计算成功",
+            data={
+                "task_id": task_id,
+                "filter_rules": filter_rules,
+                "result": AnalysisResult(**summarize_counters(counters)),
+                "rule_overlap": feature_table.rule_overlap(filter_rules)
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"计算规则调整结果失败: {str(e)}"
+        )
+
+@router.get("/tasks/{task_id}/filter-details/{filter_type}", response_model=ApiResponse)
+async def get_filter_details(task_id: str, filter_type: str, page: int = 1, page_size: int = 50):
+    """获取特定过滤类型的详细记录"""
+    try:
+        task_info = await _get_task_info(task_id)
         
         if task_info["status"] != AnalysisStatus.COMPLETED:
             raise HTTPException(
@@ -324,27 +1027,28 @@ async def get_filter_details(task_id: str, filter_type: str, page: int = 1, page
                 detail=f"任务尚未完成，当前状态: {task_info['status']}"
             )
         
-        if "result" not in task_info or not hasattr(task_info["result"], "filtered_records_details"):
+        record_store = getattr(task_info.get("result"), "_record_store", None)
+        if record_store is None:
             raise HTTPException(
                 status_code=404,
                 detail="过滤详情数据不存在"
             )
         
-        # 获取所有过滤记录
-        all_filtered_records = task_info["result"].filtered_records_details
-        
         # 按过滤类型筛选
-        filtered_by_type = [
-            record for record in all_filtered_records 
-            if record.filter_type == filter_type
-        ]
+        positions = record_store.positions_of_type(filter_type)
         
         # 计算分页
-        total_count = len(filtered_by_type)
+        total_count = len(positions)
         total_pages = (total_count + page_size - 1) // page_size
         start_idx = (page - 1) * page_size
         end_idx = start_idx + page_size
-        page_records = filtered_by_type[start_idx:end_idx]
+        page_records = record_store.records(positions[start_idx:end_idx])
+        
+        # 只为当前页加载原始数据；源文件已删除时返回不含原始数据的记录
+        try:
+            page_records = await _with_raw_data(task_info["result"], page_records)
+        except FileNotFoundError:
+            pass
         
         # 构建响应
         filter_detail_response = FilterDetailResponse(
@@ -374,34 +1078,31 @@ async def get_filter_details(task_id: str, filter_type: str, page: int = 1, page
 async def get_chat_record_detail(task_id: str, record_id: str):
     """获取具体聊天记录的完整内容"""
     try:
-        if task_id not in analysis_tasks:
-            raise HTTPException(
-                status_code=404,
-                detail="任务不存在"
-            )
-        
-        task_info = analysis_tasks[task_id]
+        task_info = await _get_task_info(task_id)
         
-        if "result" not in task_info or not hasattr(task_info["result"], "filtered_records_details"):
+        record_store = getattr(task_info.get("result"), "_record_store", None)
+        if record_store is None:
             raise HTTPException(
                 status_code=404,
                 detail="记录详情数据不存在"
             )
         
         # 查找具体记录
-        all_filtered_records = task_info["result"].filtered_records_details
-        target_record = None
-        
-        for record in all_filtered_records:
-            if record.record_id == record_id:
-                target_record = record
-                break
-        
-        if not target_record:
+        position = record_store.position_of(record_id)
+        if position is None:
             raise HTTPException(
                 status_code=404,
                 detail="记录不存在"
             )
+        target_record = record_store.get(position)
+        
+        try:
+            target_record = (await _with_raw_data(task_info["result"], [target_record]))[0]
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=404,
+                detail="源文件已删除，无法加载原始聊天记录"
+            )
         
         return ApiResponse(
             success=True,
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import logging
 from typing import List, Dict
 from fastapi import APIRouter, HTTPException, UploadFile, File
 import pandas as pd
@@ -8,8 +9,11 @@ import json
 import io
 from app.models.schemas import ApiResponse, FilterRule, StaffMember
 from app.services.analyzer import analyzer
+from app.core.json_backend import json_loads
+from app.services.excel_reader import read_excel_sample
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get("/filter-rules", response_model=ApiResponse)
 async def get_filter_rules():
@@ -232,7 +236,7 @@ async def remove_staff_member(nick_name: str):
 async def upload_staff_excel(file: UploadFile = File(...)):
     """上传Excel文件解析售后人员名单"""
     try:
-        print(f"开始处理Excel文件: {file.filename}")
+        logger.info("开始处理售后人员Excel文件: %s", file.filename)
         
         # 验证文件类型
         if not file.filename:
@@ -249,15 +253,14 @@ async def upload_staff_excel(file: UploadFile = File(...)):
         
         # 读取文件内容
         content = await file.read()
-        print(f"文件大小: {len(content)} bytes")
+        logger.debug("文件大小: %d bytes", len(content))
         
         try:
             # 使用pandas读取Excel文件
             df = pd.read_excel(io.BytesIO(content))
-            print(f"Excel文件读取成功，形状: {df.shape}")
-            print(f"列名: {list(df.columns)}")
+            logger.debug("Excel文件读取成功，形状: %s，列名: %s", df.shape, list(df.columns))
         except Exception as e:
-            print(f"Excel文件解析失败: {str(e)}")
+            logger.warning("Excel文件解析失败: %s", e)
             raise HTTPException(
                 status_code=400,
                 detail=f"Excel文件格式错误，无法解析: {str(e)}"
@@ -271,18 +274,13 @@ async def upload_staff_excel(file: UploadFile = File(...)):
         
         if 'nick_name' in df.columns:
             # 格式1：专门的售后人员名单文件
-            print("检测到nick_name列，开始解析售后人员名单...")
             nick_names = df['nick_name'].dropna().astype(str).tolist()
-            print(f"从nick_name列读取到 {len(nick_names)} 个条目")
+            logger.debug("从nick_name列读取到 %d 个条目", len(nick_names))
             
-            for i, name in enumerate(nick_names):
+            for name in nick_names:
                 name = name.strip()
-                print(f"  处理第{i+1}个: '{name}'")
                 if name and name not in valid_names:
                     valid_names.append(name)
-                    print(f"    ✓ 添加到有效名单: '{name}'")
-                else:
-                    print(f"    ✗ 跳过（空值或重复）: '{name}'")
                     
         elif 'messages' in df.columns:
             # 格式2：聊天记录文件，从messages中提取售后人员昵称
@@ -293,7 +291,7 @@ async def upload_staff_excel(file: UploadFile = File(...)):
                     messages_value = row['messages']
                     if pd.notna(messages_value):
                         if isinstance(messages_value, str):
-                            messages = json.loads(messages_value)
+                            messages = json_loads(messages_value)
                         else:
                             messages = messages_value
                         
@@ -321,21 +319,18 @@ async def upload_staff_excel(file: UploadFile = File(...)):
                 detail="Excel格式错误：文件必须包含 'nick_name' 列（售后人员名单）或 'messages' 列（聊天记录文件）。"
             )
         
-        print(f"解析完成，共找到 {len(valid_names)} 个有效售后人员:")
-        for i, name in enumerate(valid_names):
-            print(f"  {i+1}: {name}")
+        logger.info("解析完成，共找到 %d 个有效售后人员", len(valid_names))
+        logger.debug("有效售后人员: %s", valid_names)
             
         if not valid_names:
-            print("❌ 没有找到有效的售后人员昵称数据")
             raise HTTPException(
                 status_code=400,
                 detail="Excel文件中没有找到有效的售后人员昵称数据"
             )
         
         # 更新售后人员名单
-        print(f"开始更新售后人员名单，共 {len(valid_names)} 个人员...")
         analyzer.update_staff_list(valid_names)
-        print("✅ 售后人员名单更新成功")
+        logger.info("售后人员名单更新成功，共 %d 个人员", len(valid_names))
         
         return ApiResponse(
             success=True,
@@ -376,8 +371,8 @@ async def validate_chat_excel(file: UploadFile = File(...)):
         content = await file.read()
         
         try:
-            # 使用pandas读取Excel文件
-            df = pd.read_excel(io.BytesIO(content))
+            # 只读取表头和前100行样本，总行数取自工作表元数据
+            df, total_rows = read_excel_sample(io.BytesIO(content), 100, file.filename)
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -408,7 +403,7 @@ async def validate_chat_excel(file: UploadFile = File(...)):
                 messages_value = df.iloc[idx]['messages']
                 if pd.notna(messages_value):
                     if isinstance(messages_value, str):
-                        json.loads(messages_value)
+                        json_loads(messages_value)
                     elif not isinstance(messages_value, list):
                         validation_errors.append(f"第{idx+2}行messages格式错误：应为JSON字符串或数组")
             except json.JSONDecodeError:
@@ -431,7 +426,7 @@ async def validate_chat_excel(file: UploadFile = File(...)):
             message="Excel文件格式验证通过",
             data={
                 "filename": file.filename,
-                "total_rows": len(df),
+                "total_rows": total_rows,
                 "columns": list(df.columns),
                 "validated_rows": sample_size
             }
@@ -449,7 +444,7 @@ async def validate_chat_excel(file: UploadFile = File(...)):
 async def validate_staff_excel(file: UploadFile = File(...)):
     """验证售后人员Excel文件格式并预览导入信息"""
     try:
-        print(f"开始验证售后人员Excel文件: {file.filename}")
+        logger.info("开始验证售后人员Excel文件: %s", file.filename)
         
         # 验证文件类型
         if not file.filename:
@@ -466,15 +461,14 @@ async def validate_staff_excel(file: UploadFile = File(...)):
         
         # 读取文件内容
         content = await file.read()
-        print(f"文件大小: {len(content)} bytes")
+        logger.debug("文件大小: %d bytes", len(content))
         
         try:
             # 使用pandas读取Excel文件
             df = pd.read_excel(io.BytesIO(content))
-            print(f"Excel文件读取成功，形状: {df.shape}")
-            print(f"列名: {list(df.columns)}")
+            logger.debug("Excel文件读取成功，形状: %s，列名: %s", df.shape, list(df.columns))
         except Exception as e:
-            print(f"Excel文件解析失败: {str(e)}")
+            logger.warning("Excel文件解析失败: %s", e)
             raise HTTPException(
                 status_code=400,
                 detail=f"Excel文件格式错误，无法解析: {str(e)}"
@@ -485,9 +479,8 @@ async def validate_staff_excel(file: UploadFile = File(...)):
         
         if 'nick_name' in df.columns:
             # 格式1：专门的售后人员名单文件
-            print("检测到nick_name列，开始预览售后人员名单...")
             nick_names = df['nick_name'].dropna().astype(str).tolist()
-            print(f"从nick_name列读取到 {len(nick_names)} 个条目")
+            logger.debug("从nick_name列读取到 %d 个条目", len(nick_names))
             
             for name in nick_names:
                 name = name.strip()
@@ -496,7 +489,6 @@ async def validate_staff_excel(file: UploadFile = File(...)):
                     
         elif 'messages' in df.columns:
             # 格式2：聊天记录文件，从messages中提取售后人员昵称
-            print("检测到messages列，开始预览聊天记录中的售后人员...")
             tineco_staff_nicks = set()
             
             # 只处理前100行作为预览
@@ -506,7 +498,7 @@ async def validate_staff_excel(file: UploadFile = File(...)):
                     messages_value = df.iloc[idx]['messages']
                     if pd.notna(messages_value):
                         if isinstance(messages_value, str):
-                            messages = json.loads(messages_value)
+                            messages = json_loads(messages_value)
                         else:
                             messages = messages_value
                         
@@ -534,7 +526,7 @@ async def validate_staff_excel(file: UploadFile = File(...)):
                 detail="Excel格式错误：文件必须包含 'nick_name' 列（售后人员名单）或 'messages' 列（聊天记录文件）。"
             )
         
-        print(f"预览完成，共找到 {len(valid_names)} 个有效售后人员")
+        logger.info("预览完成，共找到 %d 个有效售后人员", len(valid_names))
         
         return ApiResponse(
             success=True,
@@ -551,7 +543,7 @@ async def validate_staff_excel(file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"验证Excel文件失败: {str(e)}")
+        logger.exception("验证售后人员Excel文件失败")
         raise HTTPException(
             status_code=500,
             detail=f"验证Excel文件失败: {str(e)}"
@@ -4,9 +4,11 @@
 import os
 import psutil
 from datetime import datetime, timedelta
+from typing import Optional
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import ApiResponse, SystemStats
 from app.core.config import settings
+from app.core.logger import log_buffer
 
 router = APIRouter()
 
@@ -174,35 +176,38 @@ async def cleanup_system():
         )
 
 @router.get("/logs", response_model=ApiResponse)
-async def get_system_logs():
-    """获取系统日志（简化版本）"""
+async def get_system_logs(level: Optional[str] = None, task_id: Optional[str] = None, limit: int = 100):
+    """
+    获取最近的系统日志（内存环形缓冲区，按时间倒序）
+    
+    Args:
+        level: 最低日志级别（DEBUG/INFO/WARNING/ERROR）
+        task_id: 只返回该分析任务的日志
+        limit: 最多返回条数
+    """
     try:
-        # 这里可以实现真正的日志读取功能
-        # 目前返回模拟的日志信息
-        logs = [
-            {
-                "timestamp": datetime.now() - timedelta(minutes=5),
-                "level": "INFO",
-                "message": "系统启动完成"
-            },
-            {
-                "timestamp": datetime.now() - timedelta(minutes=3),
-                "level": "INFO", 
-                "message": "文件上传服务就绪"
-            },
-            {
-                "timestamp": datetime.now() - timedelta(minutes=1),
-                "level": "INFO",
-                "message": "分析引擎初始化完成"
-            }
-        ]
+        if limit <= 0:
+            raise HTTPException(
+                status_code=400,
+                detail="limit必须大于0"
+            )
+        
+        try:
+            logs = log_buffer.get_logs(level=level, task_id=task_id, limit=limit)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=str(e)
+            )
         
         return ApiResponse(
             success=True,
             message="获取系统日志成功",
-            data={"logs": logs, "total": len(logs)}
+            data=logs
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -3,23 +3,44 @@
 
 import os
 import uuid
+import hashlib
+import asyncio
 import aiofiles
 import pandas as pd
 import json
 import io
+import logging
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 from app.models.schemas import FileUploadResponse, ApiResponse, ErrorResponse
 from app.core.config import settings
+from app.core.json_backend import json_loads
+from app.services import columnar_cache
+from app.services.frame_cache import frame_cache
+from app.services.excel_reader import read_excel_sample
+from app.services import deep_validator
+from app.services.worker_pool import get_worker_pool
+from app.services.metadata_store import metadata_store
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# 存储上传文件信息的内存字典（生产环境应使用数据库）
+# 上传文件信息的内存缓存（完整记录保存在元数据数据库中）
 uploaded_files = {}
 
+def lookup_file(file_id: str) -> Optional[dict]:
+    """获取上传文件信息：先查内存缓存，再查元数据数据库（服务重启前上传的文件）"""
+    file_info = uploaded_files.get(file_id)
+    if file_info is None:
+        file_info = metadata_store.get_file(file_id)
+        if file_info is not None:
+            uploaded_files[file_id] = file_info
+    return file_info
+
 def validate_file(file: UploadFile) -> None:
     """验证上传文件"""
     # 检查文件扩展名
@@ -38,10 +59,10 @@ def validate_file(file: UploadFile) -> None:
         )
 
 def validate_chat_excel_format(file_path: str) -> dict:
-    """验证聊天记录Excel文件格式"""
+    """验证聊天记录Excel文件格式（只读取表头和前100行样本）"""
     try:
-        # 读取Excel文件
-        df = pd.read_excel(file_path)
+        # 读取表头和样本行，总行数取自工作表元数据
+        df, total_rows = read_excel_sample(file_path, 100)
         
         # 定义必需的列
         required_columns = ['platform', 'date', 'messages', 'user_nick', 'shop_name', 'users']
@@ -67,7 +88,7 @@ def validate_chat_excel_format(file_path: str) -> dict:
                 messages_value = df.iloc[idx]['messages']
                 if pd.notna(messages_value):
                     if isinstance(messages_value, str):
-                        json.loads(messages_value)
+                        json_loads(messages_value)
                     elif not isinstance(messages_value, list):
                         validation_errors.append(f"第{idx+2}行messages格式错误：应为JSON字符串或数组")
             except json.JSONDecodeError:
@@ -87,7 +108,7 @@ def validate_chat_excel_format(file_path: str) -> dict:
         
         return {
             "valid": True,
-            "total_rows": len(df),
+            "total_rows": total_rows,
             "columns": list(df.columns),
             "validated_rows": sample_size
         }
@@ -99,11 +120,12 @@ def validate_chat_excel_format(file_path: str) -> dict:
         }
 
 @router.post("/", response_model=ApiResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), deep_validation: Optional[bool] = None):
     """
     上传Excel聊天记录文件
     
     - **file**: 要上传的Excel文件 (.xlsx 或 .xls)
+    - **deep_validation**: 是否在后台校验整个文件（默认使用DEEP_VALIDATION配置）
     """
     try:
         # 验证文件
@@ -120,11 +142,13 @@ async def upload_file(file: UploadFile = File(...)):
         safe_filename = f"{file_id}{file_ext}"
         file_path = os.path.join(settings.UPLOAD_DIR, safe_filename)
         
-        # 异步保存文件
+        # 异步保存文件，同时计算内容摘要（用于分析结果缓存）
         file_size = 0
+        content_hash = hashlib.sha256()
         async with aiofiles.open(file_path, 'wb') as f:
             while chunk := await file.read(1024 * 1024):  # 1MB chunks
                 file_size += len(chunk)
+                content_hash.update(chunk)
                 
                 # 检查文件大小
                 if file_size > settings.MAX_FILE_SIZE:
@@ -139,8 +163,8 @@ async def upload_file(file: UploadFile = File(...)):
                 
                 await f.write(chunk)
         
-        # 验证Excel文件格式
-        validation_result = validate_chat_excel_format(file_path)
+        # 验证Excel文件格式（解析在线程池中执行，不阻塞事件循环）
+        validation_result = await run_in_threadpool(validate_chat_excel_format, file_path)
         
         if not validation_result["valid"]:
             # 删除格式不正确的文件
@@ -161,13 +185,24 @@ async def upload_file(file: UploadFile = File(...)):
             status="uploaded"
         )
         
-        # 存储文件信息（生产环境应存储到数据库）
+        # 存储文件信息
         uploaded_files[file_id] = {
             **file_info.dict(),
             "file_path": file_path,
             "safe_filename": safe_filename,
+            "content_hash": content_hash.hexdigest(),
             "validation_info": validation_result
         }
+        await run_in_threadpool(metadata_store.save_file, uploaded_files[file_id])
+        
+        # 后台完整解析一次：生成列式缓存并在内存中保留解析数据（完成前开始的分析直接读取Excel）
+        loop = asyncio.get_event_loop()
+        loop.run_in_executor(None, ingest_upload, file_id, file_path)
+        
+        # 全文件校验：后台流式检查所有行，错误通过 /files/{file_id}/validation-errors 查询
+        if deep_validation if deep_validation is not None else settings.DEEP_VALIDATION:
+            await run_in_threadpool(deep_validator.create_index, file_id)
+            loop.run_in_executor(None, deep_validator.run_deep_validation, file_id, file_path)
         
         return ApiResponse(
             success=True,
@@ -195,11 +230,11 @@ async def list_uploaded_files():
     """获取已上传文件列表"""
     try:
         files_list = []
-        for file_id, file_info in uploaded_files.items():
+        for file_info in await run_in_threadpool(metadata_store.list_files):
             # 检查文件是否仍然存在
             if os.path.exists(file_info["file_path"]):
                 files_list.append({
-                    "file_id": file_id,
+                    "file_id": file_info["file_id"],
                     "filename": file_info["filename"],
                     "file_size": file_info["file_size"],
                     "upload_time": file_info["upload_time"],
@@ -222,14 +257,13 @@ async def list_uploaded_files():
 async def get_file_info(file_id: str):
     """获取指定文件信息"""
     try:
-        if file_id not in uploaded_files:
+        file_info = lookup_file(file_id)
+        if file_info is None:
             raise HTTPException(
                 status_code=404,
                 detail="文件不存在"
             )
         
-        file_info = uploaded_files[file_id]
-        
         # 检查文件是否仍然存在
         if not os.path.exists(file_info["file_path"]):
             raise HTTPException(
@@ -257,24 +291,59 @@ async def get_file_info(file_id: str):
             detail=f"获取文件信息失败: {str(e)}"
         )
 
+@router.get("/files/{file_id}/validation-errors", response_model=ApiResponse)
+async def get_validation_errors(file_id: str, page: int = 1, page_size: int = 50,
+                                error_class: Optional[str] = None):
+    """分页获取全文件校验发现的错误（可按错误类别筛选）"""
+    try:
+        if lookup_file(file_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail="文件不存在"
+            )
+        
+        index = await run_in_threadpool(deep_validator.get_index, file_id)
+        if index is None:
+            raise HTTPException(
+                status_code=404,
+                detail="该文件未进行全文件校验"
+            )
+        
+        return ApiResponse(
+            success=True,
+            message="获取校验错误成功",
+            data=index.get_page(page, page_size, error_class)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取校验错误失败: {str(e)}"
+        )
+
 @router.delete("/files/{file_id}", response_model=ApiResponse)
 async def delete_file(file_id: str):
     """删除指定文件"""
     try:
-        if file_id not in uploaded_files:
+        file_info = lookup_file(file_id)
+        if file_info is None:
             raise HTTPException(
                 status_code=404,
                 detail="文件不存在"
             )
         
-        file_info = uploaded_files[file_id]
-        
-        # 删除物理文件
+        # 删除物理文件及其列式缓存
         if os.path.exists(file_info["file_path"]):
             os.remove(file_info["file_path"])
+        columnar_cache.remove_cache(file_info["file_path"])
+        frame_cache.discard(file_id)
+        deep_validator.discard_index(file_id)
         
-        # 从内存中删除文件信息
-        del uploaded_files[file_id]
+        # 删除文件信息
+        uploaded_files.pop(file_id, None)
+        await run_in_threadpool(metadata_store.delete_file, file_id)
         
         return ApiResponse(
             success=True,
@@ -290,12 +359,45 @@ async def delete_file(file_id: str):
             detail=f"删除文件失败: {str(e)}"
         )
 
+def ingest_upload(file_id: str, file_path: str) -> None:
+    """
+    解析上传文件：写入列式缓存并缓存解析数据，后续分析和原始数据加载不再解析Excel
+    
+    列式缓存可用时在工作进程中解析Excel并写入Parquet，API进程再从Parquet读取解析数据
+    （比解析xlsx的XML快得多，也不占用API进程）；列式缓存不可用时在本线程解析Excel，
+    开启进程隔离时跳过（分析在工作进程中直接读取Excel）。
+    """
+    try:
+        cache_path = None
+        if columnar_cache.is_enabled():
+            cache_path = get_worker_pool().submit(columnar_cache.convert_to_cache, file_path).result()
+        if cache_path is not None:
+            df = columnar_cache.read_cache(cache_path)
+        elif settings.ANALYSIS_PROCESS_ISOLATION:
+            return
+        else:
+            df = pd.read_excel(file_path)
+        frame_cache.put(file_id, df)
+        
+        # 解析期间文件已被删除时清理缓存
+        if file_id not in uploaded_files or not os.path.exists(file_path):
+            columnar_cache.remove_cache(file_path)
+            frame_cache.discard(file_id)
+    except Exception as e:
+        logger.error("解析上传文件 %s 出错: %s", file_id, e)
+
+def get_content_hash(file_id: str) -> Optional[str]:
+    """获取文件内容的SHA-256摘要（供其他模块使用）"""
+    file_info = lookup_file(file_id)
+    return file_info.get("content_hash") if file_info else None
+
 def get_file_path(file_id: str) -> str:
     """获取文件路径（供其他模块使用）"""
-    if file_id not in uploaded_files:
+    file_info = lookup_file(file_id)
+    if file_info is None:
         raise ValueError(f"文件ID {file_id} 不存在")
     
-    file_path = uploaded_files[file_id]["file_path"]
+    file_path = file_info["file_path"]
     if not os.path.exists(file_path):
         raise ValueError(f"文件 {file_path} 不存在")
     
@@ -56,6 +56,35 @@ class Settings(BaseSettings):
     # 分析配置
     MAX_CONCURRENT_ANALYSIS: int = Field(default=3, env="MAX_CONCURRENT_ANALYSIS")
     ANALYSIS_TIMEOUT: int = Field(default=300, env="ANALYSIS_TIMEOUT")  # 5分钟
+    ANALYSIS_QUEUE_SIZE: int = Field(default=20, env="ANALYSIS_QUEUE_SIZE")  # 排队等待的分析任务上限，超出时返回429
+    ANALYSIS_SMALL_FILE_MB: int = Field(default=5, env="ANALYSIS_SMALL_FILE_MB")  # 不超过该大小的文件优先分析
+    ANALYSIS_PROCESS_ISOLATION: bool = Field(default=True, env="ANALYSIS_PROCESS_ISOLATION")  # 在独立的工作进程中解析和分析文件，API进程只负责调度
+    ANALYSIS_KILL_GRACE: int = Field(default=5, env="ANALYSIS_KILL_GRACE")  # 取消或超时后等待工作进程自行中止的秒数，超过后强制终止进程
+    TASK_QUEUE_BACKEND: str = Field(default="memory", env="TASK_QUEUE_BACKEND")  # memory（API进程内调度）或 sqlite（持久化队列，由 python -m app.worker 执行）
+    TASK_QUEUE_PATH: str = Field(default="./task_queue.db", env="TASK_QUEUE_PATH")  # SQLite队列文件，API和工作进程需访问同一文件和UPLOAD_DIR；结果以pickle保存，文件必须可信
+    TASK_LEASE_SECONDS: int = Field(default=30, env="TASK_LEASE_SECONDS")  # 工作进程领取任务的租约时长，超时未续约的任务重新排队
+    TASK_HEARTBEAT_SECONDS: int = Field(default=2, env="TASK_HEARTBEAT_SECONDS")  # 工作进程续约和写入进度的间隔
+    TASK_MAX_ATTEMPTS: int = Field(default=3, env="TASK_MAX_ATTEMPTS")  # 工作进程失联后任务的最大执行次数
+    PROGRESS_STREAM_INTERVAL: float = Field(default=0.5, env="PROGRESS_STREAM_INTERVAL")  # SSE/WebSocket推送进度的最小间隔（秒），期间的多次更新合并为一次
+    PROGRESS_STREAM_KEEPALIVE: int = Field(default=15, env="PROGRESS_STREAM_KEEPALIVE")  # 进度流无更新时发送心跳的间隔（秒），避免代理断开空闲连接
+    ANALYSIS_ENGINE: str = Field(default="columnar", env="ANALYSIS_ENGINE")  # columnar（列式批量）或 row（逐行）
+    EXCEL_STREAMING: bool = Field(default=True, env="EXCEL_STREAMING")  # 以openpyxl只读模式分批读取.xlsx
+    STREAMING_BATCH_ROWS: int = Field(default=5000, env="STREAMING_BATCH_ROWS")  # 每批（分片）处理的行数
+    ANALYSIS_WORKERS: int = Field(default=1, env="ANALYSIS_WORKERS")  # 分片分析进程数，1表示在当前进程内分析
+    BUSINESS_TIMEZONE: str = Field(default="Asia/Shanghai", env="BUSINESS_TIMEZONE")  # 早晨消息规则使用的店铺时区，为空时按时间字符串自带的偏移判断
+    JSON_BACKEND: str = Field(default="auto", env="JSON_BACKEND")  # auto（有orjson时使用orjson）、orjson 或 json
+    COLUMNAR_CACHE: bool = Field(default=True, env="COLUMNAR_CACHE")  # 上传时转换为Parquet列式缓存供后续分析读取（需要pyarrow）
+    DEEP_VALIDATION: bool = Field(default=False, env="DEEP_VALIDATION")  # 上传后在后台校验整个文件的messages列并建立错误索引
+    FRAME_CACHE_MAX_MB: int = Field(default=512, env="FRAME_CACHE_MAX_MB")  # 上传时解析的数据在内存中缓存的总大小上限，0表示不缓存
+    RESULT_CACHE_MAX_MB: int = Field(default=256, env="RESULT_CACHE_MAX_MB")  # 按文件内容缓存的分析结果总大小上限，0表示不缓存
+    TASK_MEMORY_CACHE_SIZE: int = Field(default=200, env="TASK_MEMORY_CACHE_SIZE")  # 内存中保留的已结束任务（含结果）数，超出时淘汰最久未访问的任务，之后从元数据数据库读取
+    
+    # 日志配置
+    LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")  # app日志器的级别（DEBUG时输出每次进度更新）
+    LOG_BUFFER_SIZE: int = Field(default=2000, env="LOG_BUFFER_SIZE")  # 内存中保留的最近日志条数，供 /api/system/logs 查询
+    LOG_SAMPLE_FIRST: int = Field(default=20, env="LOG_SAMPLE_FIRST")  # 每个任务的逐行错误日志：前N条全部记录
+    LOG_SAMPLE_EVERY: int = Field(default=100, env="LOG_SAMPLE_EVERY")  # 之后每N条记录一条
+    LOG_RATE_LIMIT: int = Field(default=20, env="LOG_RATE_LIMIT")  # 每个任务每秒最多记录的逐行错误日志条数
     
     # 售后人员配置文件路径
     STAFF_CONFIG_PATH: str = Field(
@@ -63,6 +92,10 @@ class Settings(BaseSettings):
         env="STAFF_CONFIG_PATH"
     )
     
+    # 售后人员昵称特征（除内置的"tineco添可官方旗舰店:k"外，额外的子串/前缀匹配）
+    STAFF_NICK_SUBSTRINGS: List[str] = Field(default=[], env="STAFF_NICK_SUBSTRINGS")
+    STAFF_NICK_PREFIXES: List[str] = Field(default=[], env="STAFF_NICK_PREFIXES")
+    
     # 过滤规则配置
     FILTER_RULES_CONFIG: dict = {
         "early_morning_filter": {
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+JSON解码后端
+
+安装了orjson时优先使用orjson解码messages列，否则回退到标准库json。
+orjson比标准库严格（不接受NaN/Infinity等），解码失败的值会再交给标准库json解码，
+保证能否解码以及抛出的异常与标准库一致。唯一的差异是超出64位的整数会被orjson解码为浮点数，
+过滤规则只使用消息中的字符串字段，原始数据保留的是JSON原文，因此不影响分析结果。
+"""
+
+import json
+import logging
+from typing import Any, List, Callable
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class DecodeFailure:
+    """批量解码中单个值的解码失败结果"""
+    __slots__ = ('error',)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+class JsonDecoder:
+    """JSON解码器"""
+
+    def __init__(self, name: str, loads: Callable[[str], Any]):
+        self.name = name
+        self._fast_loads = loads
+
+    def loads(self, value: str) -> Any:
+        """解码单个JSON字符串，失败时抛出与标准库相同的异常"""
+        try:
+            return self._fast_loads(value)
+        except Exception:
+            if self._fast_loads is json.loads:
+                raise
+            return json.loads(value)
+
+    def decode_batch(self, values: List[str]) -> List[Any]:
+        """
+        批量解码一列JSON字符串
+
+        Returns:
+            List[Any]: 与输入等长的解码结果，解码失败的位置为DecodeFailure
+        """
+        fast_loads = self._fast_loads
+        try:
+            # 绝大多数批次没有坏数据，整批解码避免逐个捕获异常
+            return [fast_loads(value) for value in values]
+        except Exception:
+            pass
+
+        results = []
+        for value in values:
+            try:
+                results.append(self.loads(value))
+            except Exception as e:
+                results.append(DecodeFailure(e))
+        return results
+
+def _create_decoder(backend: str) -> JsonDecoder:
+    """按配置创建解码器：auto 优先 orjson，json 强制使用标准库"""
+    if backend in ("auto", "orjson") and orjson is not None:
+        return JsonDecoder("orjson", orjson.loads)
+    if backend == "orjson":
+        logger.warning("未安装orjson，JSON解码回退到标准库json")
+    return JsonDecoder("json", json.loads)
+
+# 全局解码器实例
+json_decoder = _create_decoder(settings.JSON_BACKEND)
+
+def json_loads(value: str) -> Any:
+    """使用当前后端解码单个JSON字符串"""
+    return json_decoder.loads(value)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+日志
+
+app下各模块使用logging.getLogger(__name__)记录日志，setup_logging()为"app"日志器配置：
+- QueueHandler：调用线程只把日志记录放入队列，由后台线程写标准输出，分析线程不因输出阻塞
+- 内存环形缓冲区：保留最近LOG_BUFFER_SIZE条日志，供 /api/system/logs 按级别和任务查询
+- 任务上下文：在task_context()中记录的日志带有task_id
+分析工作进程的日志通过管道转发到API进程（forward_logs），逐行错误等高频日志用ErrorSampler按任务采样和限流。
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+_task_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_id", default=None)
+
+_FORMAT = "%(asctime)s %(levelname)s %(name)s%(task_suffix)s: %(message)s"
+
+def current_task_id() -> Optional[str]:
+    """当前上下文的任务ID"""
+    return _task_id.get()
+
+@contextmanager
+def task_context(task_id: Optional[str]) -> Iterator[None]:
+    """在上下文中记录的日志带有task_id"""
+    token = _task_id.set(task_id)
+    try:
+        yield
+    finally:
+        _task_id.reset(token)
+
+class TaskContextFilter(logging.Filter):
+    """为日志记录添加task_id（转发的记录已带有task_id）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "task_id"):
+            record.task_id = _task_id.get()
+        record.task_suffix = f" [{record.task_id[:8]}]" if record.task_id else ""
+        return True
+
+class RingBufferHandler(logging.Handler):
+    """在内存中保留最近的日志"""
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self._entries: deque = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._entries.append({
+            "timestamp": datetime.fromtimestamp(record.created),
+            "level": record.levelname,
+            "levelno": record.levelno,
+            "logger": record.name,
+            "task_id": getattr(record, "task_id", None),
+            "message": record.getMessage()
+        })
+
+    def get_logs(self, level: Optional[str] = None, task_id: Optional[str] = None,
+                 limit: int = 100) -> Dict[str, Any]:
+        """
+        按时间倒序获取日志
+
+        Args:
+            level: 最低日志级别（如WARNING）
+            task_id: 只返回该任务的日志
+            limit: 最多返回条数
+
+        Returns:
+            Dict[str, Any]: {"logs": 日志列表, "total": 符合条件的日志数}
+        """
+        min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(min_level, int):
+            raise ValueError(f"未知的日志级别: {level}")
+        # emit在处理器锁内由日志线程调用
+        with self.lock:
+            entries = list(self._entries)
+        matched = [
+            entry for entry in reversed(entries)
+            if entry["levelno"] >= min_level and (task_id is None or entry["task_id"] == task_id)
+        ]
+        logs = [{key: value for key, value in entry.items() if key != "levelno"} for entry in matched[:limit]]
+        return {"logs": logs, "total": len(matched)}
+
+class _ForwardHandler(logging.Handler):
+    """把日志记录发送给API进程（分析工作进程中使用）"""
+
+    def __init__(self, send: Callable[..., None]):
+        super().__init__()
+        self._send = send
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            payload = dict(record.__dict__)
+            exc_text = record.exc_text
+            if record.exc_info and not exc_text:
+                exc_text = logging.Formatter().formatException(record.exc_info)
+            payload.update(msg=record.getMessage(), args=None, exc_info=None, exc_text=exc_text)
+            self._send("log", payload)
+        except Exception:
+            self.handleError(record)
+
+class ErrorSampler:
+    """
+    按任务对高频错误日志采样和限流
+
+    前LOG_SAMPLE_FIRST条全部记录，之后每LOG_SAMPLE_EVERY条记录一条，且每秒不超过LOG_RATE_LIMIT条；
+    被省略的日志不格式化消息，summary()汇总省略的条数。每个分析任务使用独立的采样器。
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.count = 0
+        self.suppressed = 0
+        self._tokens = float(settings.LOG_RATE_LIMIT)
+        self._refilled = time.monotonic()
+
+    def log(self, level: int, msg: str, *args) -> None:
+        self.count += 1
+        if not self.logger.isEnabledFor(level) or not self._sampled() or not self._take_token():
+            self.suppressed += 1
+            return
+        self.logger.log(level, msg, *args)
+
+    def summary(self, what: str) -> None:
+        """记录被省略的日志条数"""
+        if self.suppressed:
+            self.logger.warning("%s共 %d 条，省略了其中 %d 条的日志", what, self.count, self.suppressed)
+
+    def _sampled(self) -> bool:
+        return self.count <= settings.LOG_SAMPLE_FIRST or self.count % max(settings.LOG_SAMPLE_EVERY, 1) == 0
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        rate = settings.LOG_RATE_LIMIT
+        self._tokens = min(float(rate), self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+# 内存中的最近日志
+log_buffer = RingBufferHandler(settings.LOG_BUFFER_SIZE)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+def _app_logger() -> logging.Logger:
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    return logger
+
+def setup_logging() -> None:
+    """配置"app"日志器：队列写入，后台线程输出到标准输出和内存环形缓冲区（重复调用无效果）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(TaskContextFilter())
+        _app_logger().addHandler(queue_handler)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter(_FORMAT))
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, log_buffer)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+def forward_logs(send: Callable[..., None]) -> None:
+    """分析工作进程中：把"app"日志器的记录通过send转发给API进程"""
+    handler = _ForwardHandler(send)
+    handler.addFilter(TaskContextFilter())
+    _app_logger().addHandler(handler)
+
+def handle_forwarded(payload: Dict[str, Any]) -> None:
+    """API进程中：处理工作进程转发的日志记录"""
+    record = logging.makeLogRecord(payload)
+    logging.getLogger(record.name).handle(record)
@@ -4,8 +4,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.api.routes import api_router
 from app.core.config import settings
+from app.core.logger import setup_logging
+
+# 在导入各模块（加载售后人员名单等）之前配置日志
+setup_logging()
+
+from app.api.routes import api_router
+from app.api.endpoints.analysis import recover_tasks
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -39,6 +45,11 @@ if os.path.exists(static_dir):
 # 注册API路由
 app.include_router(api_router, prefix="/api")
 
+@app.on_event("startup")
+async def recover_analysis_tasks():
+    """处理上次运行遗留的分析任务"""
+    recover_tasks()
+
 @app.get("/")
 async def root():
     """根路径，返回API信息"""
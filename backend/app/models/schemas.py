@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from typing import Optional, List, Dict, Any, Union
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime
 from enum import Enum
 
@@ -12,6 +12,7 @@ class AnalysisStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class FileUploadResponse(BaseModel):
     """文件上传响应模型"""
@@ -114,7 +115,7 @@ class FilteredRecord(BaseModel):
     filter_type: str = Field(..., description="过滤类型")
     filter_reason: str = Field(..., description="过滤原因")
     record_index: int = Field(..., description="记录在文件中的行号")
-    raw_data: Dict[str, Any] = Field(..., description="原始聊天记录数据")
+    raw_data: Optional[Dict[str, Any]] = Field(default=None, description="原始聊天记录数据（查看详情时按需加载）")
     
     # 不同过滤类型的特定字段
     staff_name: Optional[str] = Field(default=None, description="售后人员姓名（售后参与类型）")
@@ -135,3 +136,15 @@ class FilterDetailResponse(BaseModel):
 class EnhancedAnalysisResult(AnalysisResult):
     """增强的分析结果模型（包含详细过滤记录）"""
     filtered_records_details: Optional[List[FilteredRecord]] = Field(default=None, description="详细过滤记录列表")
+    rule_stats: Optional[Dict[str, Dict[str, Any]]] = Field(default=None, description="各过滤规则的评估统计（评估次数、命中数、命中率、耗时）")
+    json_backend: Optional[str] = Field(default=None, description="解码messages列使用的JSON后端")
+    rule_overlap: Optional[Dict[str, Any]] = Field(default=None, description="各过滤规则匹配记录的重叠统计（不考虑优先级：两两交集、全部交集、独占数）")
+    
+    # 过滤记录的紧凑存储（不序列化），API返回时按需创建FilteredRecord
+    _record_store: Any = PrivateAttr(default=None)
+    # 源文件行访问器（不序列化），用于按需加载被过滤记录的原始数据
+    _row_source: Any = PrivateAttr(default=None)
+    # 每条记录的规则特征表（不序列化），用于切换规则后直接重新计算计数器
+    _feature_table: Any = PrivateAttr(default=None)
+    # 结果在元数据库中的ID（已保存时），共享同一结果的任务引用同一份数据
+    _result_id: Optional[str] = PrivateAttr(default=None)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分析工作进程
+
+解析Excel/JSON和执行过滤规则都是CPU密集的Python代码，在API进程的线程中执行时会长时间占用GIL，
+事件循环无法及时响应任务状态查询和健康检查。
+开启ANALYSIS_PROCESS_ISOLATION时，调度器的每个执行线程对应一个常驻的分析工作进程（spawn启动）：
+执行线程把任务发送给工作进程，等待期间只转发进度消息和检查取消标志；
+分析结果（计数器、过滤记录存储和特征表）序列化后传回API进程，工作进程的日志也通过管道转发给API进程。
+取消或超时时先通知工作进程在下一批记录前中止（保留已处理部分的计数器），
+超过ANALYSIS_KILL_GRACE秒仍未结束则强制终止进程，下一个任务启动新的工作进程。
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logger import current_task_id, forward_logs, handle_forwarded, task_context
+from app.services.cancellation import CancellationToken, AnalysisCancelled
+from app.services.row_source import RowSource
+from app.services import deep_validator
+
+# 等待工作进程消息时检查取消标志的间隔（秒）
+_POLL_INTERVAL = 0.2
+
+class AnalysisProcess:
+    """常驻的分析工作进程（由一个调度执行线程独占使用）"""
+
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._cancel_event = None
+        self.tasks = 0
+        self.kills = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def run(self, task_analyzer, file_path: str, progress_callback=None, file_id: Optional[str] = None,
+            cancel_token: Optional[CancellationToken] = None):
+        """
+        在工作进程中执行分析，参数和返回值与ChatAnalyzer.analyze_excel相同
+
+        Raises:
+            AnalysisCancelled: 任务被取消或超时
+            RuntimeError: 分析出错或工作进程意外退出
+        """
+        self._ensure_started()
+        self._cancel_event.clear()
+        self.tasks += 1
+        self._conn.send({
+            "file_path": file_path,
+            "file_id": file_id,
+            "filter_rules": task_analyzer.get_filter_rules(),
+            "staff_list": task_analyzer.get_staff_list(),
+            "timeout": cancel_token.timeout if cancel_token else None,
+            "known_bad_rows": deep_validator.get_skippable_rows(file_id),
+            "task_id": current_task_id()
+        })
+
+        stop: Optional[AnalysisCancelled] = None
+        stop_time = 0.0
+        while True:
+            if cancel_token is not None and stop is None:
+                try:
+                    cancel_token.check()
+                except AnalysisCancelled as e:
+                    # 通知工作进程在下一批记录前中止
+                    stop, stop_time = e, time.monotonic()
+                    self._cancel_event.set()
+            if stop is not None and time.monotonic() - stop_time > settings.ANALYSIS_KILL_GRACE:
+                self._kill()
+                raise stop
+
+            if not self._conn.poll(_POLL_INTERVAL):
+                if not self._process.is_alive():
+                    self._kill()
+                    raise RuntimeError("分析工作进程意外退出")
+                continue
+
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                self._kill()
+                raise RuntimeError("分析工作进程意外退出")
+
+            kind = message[0]
+            if kind == "log":
+                handle_forwarded(message[1])
+            elif kind == "progress":
+                if progress_callback:
+                    progress_callback(message[1], message[2])
+            elif kind == "done":
+                result = message[1]
+                result._row_source = RowSource(file_path, file_id)
+                return result
+            elif kind == "cancelled":
+                # API进程发起的取消使用原始原因（工作进程只知道取消标志）
+                error = stop or AnalysisCancelled(message[1], message[2])
+                error.counters = message[3]
+                raise error
+            else:
+                raise RuntimeError(message[1])
+
+    def shutdown(self) -> None:
+        """通知工作进程退出，未及时退出时强制终止"""
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+            self._process.join(timeout=1)
+        except (OSError, ValueError):
+            pass
+        self._kill(count=False)
+
+    def _ensure_started(self) -> None:
+        if self.alive:
+            return
+        self._kill(count=False)
+        parent_conn, child_conn = self._context.Pipe()
+        self._cancel_event = self._context.Event()
+        self._process = self._context.Process(
+            target=_worker_main, args=(child_conn, self._cancel_event), name="analysis-process"
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def _kill(self, count: bool = True) -> None:
+        """终止工作进程（连同分片计算子进程）"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        if process.is_alive():
+            try:
+                # 工作进程启动时创建了独立的进程组，分片计算进程在同一组内
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                process.kill()
+            if count:
+                self.kills += 1
+        process.join(timeout=5)
+        self._conn.close()
+        self._conn = None
+
+def _worker_main(conn, cancel_event) -> None:
+    """工作进程主循环：依次执行API进程发送的分析任务"""
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    from app.services.analyzer import ChatAnalyzer
+
+    send_lock = threading.Lock()
+
+    def send(*message) -> None:
+        with send_lock:
+            conn.send(message)
+
+    forward_logs(send)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+
+        try:
+            cancel_token = CancellationToken(job["timeout"], event=cancel_event)
+            cancel_token.start()
+            task_analyzer = ChatAnalyzer(staff_list=job["staff_list"], filter_rules=job["filter_rules"])
+            with task_context(job.get("task_id")):
+                result = task_analyzer.analyze_excel(
+                    job["file_path"],
+                    progress_callback=lambda progress, message: send("progress", progress, message),
+                    file_id=job["file_id"],
+                    cancel_token=cancel_token,
+                    known_bad_rows=job["known_bad_rows"]
+                )
+            # 行访问器由API进程重新创建
+            result._row_source = None
+            send("done", result)
+        except AnalysisCancelled as e:
+            send("cancelled", e.reason, e.timed_out, e.counters)
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            send("error", str(e))
+
+# 各调度执行线程的工作进程
+_local = threading.local()
+_processes: List[AnalysisProcess] = []
+_processes_lock = threading.Lock()
+
+def _current_process() -> AnalysisProcess:
+    process = getattr(_local, "process", None)
+    if process is None:
+        process = _local.process = AnalysisProcess()
+        with _processes_lock:
+            _processes.append(process)
+    return process
+
+def execute_analysis(task_analyzer, file_path: str, progress_callback=None, file_id: Optional[str] = None,
+                     cancel_token: Optional[CancellationToken] = None):
+    """执行分析：开启进程隔离时在当前执行线程的工作进程中执行，否则在当前线程中执行"""
+    if not settings.ANALYSIS_PROCESS_ISOLATION:
+        return task_analyzer.analyze_excel(
+            file_path, progress_callback=progress_callback, file_id=file_id, cancel_token=cancel_token
+        )
+    return _current_process().run(task_analyzer, file_path, progress_callback, file_id, cancel_token)
+
+def get_stats() -> Dict[str, Any]:
+    """获取工作进程统计"""
+    with _processes_lock:
+        processes = list(_processes)
+    return {
+        "enabled": settings.ANALYSIS_PROCESS_ISOLATION,
+        "processes": len(processes),
+        "alive": sum(1 for process in processes if process.alive),
+        "tasks": sum(process.tasks for process in processes),
+        "killed": sum(process.kills for process in processes)
+    }
+
+@atexit.register
+def _shutdown_all() -> None:
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        process.shutdown()
@@ -3,21 +3,65 @@
 
 import os
 import json
+import logging
+import copy
+import numpy as np
 import pandas as pd
 import datetime
 import uuid
-from typing import Dict, List, Optional, Any
-from app.models.schemas import AnalysisResult, FilteredRecord, EnhancedAnalysisResult
+import hashlib
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+from app.models.schemas import AnalysisResult, EnhancedAnalysisResult
 from app.core.config import settings
+from app.core.json_backend import json_decoder, json_loads
+from app.core.logger import ErrorSampler
+from app.services.rules import (
+    FILTER_RULE_SPECS, RULE_COLUMNS, SERVICE_ASSISTANT_NICK, STAFF_NICK_MARKER, ADDRESS_CONFIRM_SUMMARY
+)
+from app.services.columnar_engine import ColumnarFilterEngine
+from app.services.rule_planner import RulePlan
+from app.services.business_clock import BusinessClock
+from app.services.staff_matcher import StaffMatcher
+from app.services.row_source import RowSource
+from app.services.record_store import FilteredRecordStore
+from app.services.feature_table import RowFeatureTable, ROW_EMPTY
+from app.services.cancellation import CancellationToken, AnalysisCancelled
+from app.services import columnar_cache
+from app.services.frame_cache import frame_cache
+from app.services.worker_pool import get_worker_pool
+from app.services import deep_validator
+from app.services.excel_reader import is_streamable, get_excel_row_count, iter_excel_batches
+
+logger = logging.getLogger(__name__)
 
 class ChatAnalyzer:
     """聊天记录分析引擎"""
     
-    def __init__(self):
+    def __init__(self, staff_list: Optional[List[str]] = None, filter_rules: Optional[Dict] = None,
+                 staff_matcher: Optional[StaffMatcher] = None):
+        """
+        Args:
+            staff_list: 售后人员名单，为None时从配置文件加载
+            filter_rules: 过滤规则配置，为None时使用全局配置
+            staff_matcher: 已按staff_list编译的匹配器，为None时重新编译
+        """
         self.after_sales_staff = []
-        self.filter_rules = settings.FILTER_RULES_CONFIG
-        self.filtered_records_details = []  # 存储详细过滤记录
-        self._load_staff_list()
+        self.filter_rules = filter_rules if filter_rules is not None else settings.FILTER_RULES_CONFIG
+        self.record_store = _new_record_store()  # 存储详细过滤记录
+        self.features = RowFeatureTable()  # 每条记录的规则特征
+        self._rule_plan: Optional[RulePlan] = None
+        self._business_clock: Optional[BusinessClock] = None
+        self._cancel_token: Optional[CancellationToken] = None
+        self._error_log = ErrorSampler(logger)  # 逐行解析错误的日志采样
+        self._config_lock = threading.Lock()
+        if staff_list is None:
+            self._load_staff_list()
+        else:
+            self.after_sales_staff = list(staff_list)
+        self.staff_matcher = staff_matcher or self._build_staff_matcher(self.after_sales_staff)
     
     def _load_staff_list(self) -> None:
         """加载售后人员名单"""
@@ -27,123 +71,168 @@ class ChatAnalyzer:
                 with open(staff_file_path, 'r', encoding='utf-8') as f:
                     staff_data = json.load(f)
                 self.after_sales_staff = [item['nick_name'] for item in staff_data]
-                print(f"成功加载售后人员名单: {len(self.after_sales_staff)} 人")
+                logger.info("成功加载售后人员名单: %d 人", len(self.after_sales_staff))
             else:
                 # 生产环境中初始化为空列表，通过API动态添加
-                print("售后人员名单文件不存在，初始化为空列表")
+                logger.info("售后人员名单文件不存在，初始化为空列表")
                 self.after_sales_staff = []
                 # 确保配置文件目录存在
                 config_dir = os.path.dirname(staff_file_path)
                 if config_dir:
                     os.makedirs(config_dir, exist_ok=True)
         except Exception as e:
-            print(f"加载售后人员名单出错: {e}")
+            logger.error("加载售后人员名单出错: %s", e)
             self.after_sales_staff = []
     
-    def analyze_excel(self, excel_file_path: str, progress_callback=None) -> AnalysisResult:
+    def snapshot(self, rule_overrides: Optional[Dict[str, bool]] = None) -> 'ChatAnalyzer':
+        """
+        为一个分析任务创建独立的分析器
+        
+        过滤规则深拷贝后应用任务指定的启用/禁用设置，之后修改全局配置不影响进行中的任务；
+        售后名单和已编译的匹配器直接共享（更新名单时整体替换，不会原地修改）。
+        各任务的过滤记录、特征表和规则执行计划互不影响，可以并发分析。
+        
+        Args:
+            rule_overrides: 规则ID -> 是否启用
+        
+        Raises:
+            ValueError: 规则ID不存在
+        """
+        with self._config_lock:
+            filter_rules = copy.deepcopy(self.filter_rules)
+            staff_list, staff_matcher = self.after_sales_staff, self.staff_matcher
+        
+        for rule_id, enabled in (rule_overrides or {}).items():
+            if rule_id not in filter_rules:
+                raise ValueError(f"未知的过滤规则: {rule_id}")
+            filter_rules[rule_id]['enabled'] = bool(enabled)
+        
+        return ChatAnalyzer(staff_list=staff_list, filter_rules=filter_rules, staff_matcher=staff_matcher)
+    
+    def analyze_excel(self, excel_file_path: str, progress_callback=None,
+                      file_id: Optional[str] = None,
+                      cancel_token: Optional[CancellationToken] = None,
+                      known_bad_rows: Optional[np.ndarray] = None) -> AnalysisResult:
         """
         分析Excel聊天记录文件
         
         Args:
             excel_file_path: Excel文件路径
             progress_callback: 进度回调函数
+            file_id: 上传文件ID，给定时优先使用上传校验时缓存在内存中的解析数据
+            cancel_token: 取消令牌，每批记录之间检查
+            known_bad_rows: 全文件校验标记的无效行号，为None时按file_id查找（工作进程中由API进程传入）
             
         Returns:
             AnalysisResult: 分析结果
+        
+        Raises:
+            AnalysisCancelled: 任务被取消或超时（counters属性为已处理部分的计数器）
         """
-        print(f"开始分析聊天记录文件: {os.path.basename(excel_file_path)}")
-        print(f"文件大小: {os.path.getsize(excel_file_path) / (1024 * 1024):.2f} MB")
-        print(f"售后人员数量: {len(self.after_sales_staff)}")
+        logger.info("开始分析聊天记录文件: %s（%.2f MB，售后人员 %d 人）",
+                    os.path.basename(excel_file_path),
+                    os.path.getsize(excel_file_path) / (1024 * 1024), len(self.after_sales_staff))
         
-        # 清空之前的详细记录
-        self.filtered_records_details = []
+        # 清空之前的详细记录、特征表、规则执行计划和时间解析缓存
+        self.record_store = _new_record_store()
+        self.features = RowFeatureTable()
+        self._rule_plan = None
+        self._business_clock = None
+        self._cancel_token = cancel_token
+        self._error_log = ErrorSampler(logger)
         
         # 初始化计数器
-        counters = {
-            'total_records': 0,
-            'filtered_records': 0,
-            'early_morning_count': 0,
-            'staff_involved_count': 0,
-            'service_assistant_count': 0,
-            'address_confirm_count': 0,
-            'parse_error_count': 0,
-            'empty_records_count': 0
-        }
+        counters = _new_counters()
         
         try:
             # 读取Excel文件
             if progress_callback:
                 progress_callback(10, "正在读取Excel文件...")
             
-            df = pd.read_excel(excel_file_path)
-            counters['total_records'] = len(df)
+            engine = ColumnarFilterEngine(self) if settings.ANALYSIS_ENGINE == "columnar" else None
+            # 优先使用内存中的解析数据，其次是上传时生成的列式缓存，都没有时才解析Excel
+            cached_frame = frame_cache.get(file_id) if file_id else None
+            cache_path = columnar_cache.find_cache(excel_file_path) if cached_frame is None else None
+            streaming = (cached_frame is None and cache_path is None
+                         and settings.EXCEL_STREAMING and is_streamable(excel_file_path))
             
-            print(f"共读取 {counters['total_records']} 条记录")
-            
-            if progress_callback:
-                progress_callback(20, "开始应用过滤规则...")
+            if streaming:
+                # 流式读取：按固定行数分批处理，内存占用与文件大小无关
+                total_rows = get_excel_row_count(excel_file_path)
+                frames = iter_excel_batches(excel_file_path, settings.STREAMING_BATCH_ROWS,
+                                            usecols=RULE_COLUMNS)
+            elif cached_frame is not None:
+                df = cached_frame[[column for column in RULE_COLUMNS if column in cached_frame.columns]]
+            elif cache_path is not None:
+                df = columnar_cache.read_cache(cache_path, RULE_COLUMNS)
+            else:
+                # 只读取过滤规则需要的列，原始数据在查看过滤详情时按需加载
+                df = pd.read_excel(excel_file_path, usecols=lambda column: column in RULE_COLUMNS)
             
-            # 逐条处理记录
-            for index, row in df.iterrows():
-                # 更新进度
-                if progress_callback and (index + 1) % 1000 == 0:
-                    progress = 20 + int((index + 1) / counters['total_records'] * 70)
-                    progress_callback(progress, f"处理进度: {index + 1}/{counters['total_records']}")
+            if not streaming:
+                total_rows = len(df)
+                frames = [df]
+                
+                logger.info("共读取 %d 条记录", total_rows)
                 
-                try:
-                    # 解析消息和用户数据
-                    messages = self._parse_messages(row)
-                    users = self._parse_users(row)
-                    
-                    # 检查是否为空记录
-                    if not messages:
-                        counters['empty_records_count'] += 1
-                        counters['filtered_records'] += 1
-                        self._add_filtered_record("empty_record", "空记录", index, row)
-                        continue
-                    
-                    # 应用过滤规则
-                    if self._apply_filters(messages, users, counters, index, row):
-                        counters['filtered_records'] += 1
-                        
-                except Exception as e:
-                    print(f"处理记录 {index} 时出错: {e}")
-                    counters['parse_error_count'] += 1
-                    counters['filtered_records'] += 1
-                    self._add_filtered_record("parse_error", "解析错误", index, row, 
-                                            error_message=str(e))
+                if progress_callback:
+                    progress_callback(20, "开始应用过滤规则...")
+            
+            # 全文件校验已确认无法解析的记录按空记录处理，不再重复解码
+            if known_bad_rows is None:
+                known_bad_rows = deep_validator.get_skippable_rows(file_id)
+            if len(known_bad_rows):
+                logger.info("全文件校验标记的无效记录: %d 条，按空记录处理", len(known_bad_rows))
+                frames = _mask_known_bad_rows(frames, known_bad_rows)
+            
+            if settings.ANALYSIS_WORKERS > 1:
+                # 多进程分片：每个分片在独立进程中执行过滤规则，按原始行顺序合并
+                self._process_frames_sharded(frames, counters, total_rows, progress_callback)
+            else:
+                # 按固定行数分批处理，每批之间检查取消标志和超时
+                for batch in _split_batches(frames):
+                    self._check_cancelled()
+                    counters['total_records'] += len(batch)
+                    self._process_frame(batch, counters, engine)
+                    _report_rows_progress(progress_callback, counters['total_records'], total_rows)
+            
+            if streaming:
+                logger.info("共读取 %d 条记录", counters['total_records'])
             
             if progress_callback:
                 progress_callback(95, "生成分析结果...")
             
             # 计算结果
-            valid_records = counters['total_records'] - counters['filtered_records']
-            filter_rate = (counters['filtered_records'] / counters['total_records'] * 100) if counters['total_records'] > 0 else 0
-            
             result = EnhancedAnalysisResult(
-                total_records=counters['total_records'],
-                filtered_records=counters['filtered_records'],
-                valid_records=valid_records,
-                filter_rate=round(filter_rate, 2),
-                early_morning_count=counters['early_morning_count'],
-                staff_involved_count=counters['staff_involved_count'],
-                service_assistant_count=counters['service_assistant_count'],
-                address_confirm_count=counters['address_confirm_count'],
-                parse_error_count=counters['parse_error_count'],
-                empty_records_count=counters['empty_records_count'],
-                filtered_records_details=self.filtered_records_details
+                **summarize_counters(counters),
+                rule_stats=self._get_rule_plan().get_stats(),
+                json_backend=json_decoder.name
             )
+            self.record_store.freeze()
+            self.features.freeze(self.filter_rules)
+            result.rule_overlap = self.features.rule_overlap(self.filter_rules)
+            result._record_store = self.record_store
+            result._feature_table = self.features
+            result._row_source = RowSource(excel_file_path, file_id)
             
             if progress_callback:
                 progress_callback(100, "分析完成")
             
-            # 打印结果摘要
-            self._print_analysis_summary(result)
+            # 记录结果摘要
+            self._error_log.summary("解析错误的记录")
+            self._log_analysis_summary(result)
             
             return result
             
+        except AnalysisCancelled as e:
+            # 保留已处理部分的计数器供查看
+            e.counters = dict(counters)
+            self._error_log.summary("解析错误的记录")
+            logger.warning("分析已中止（已处理 %d 条记录）: %s", counters['total_records'], e.reason)
+            raise
         except Exception as e:
-            print(f"分析Excel文件时出错: {e}")
+            self._error_log.summary("解析错误的记录")
+            logger.error("分析Excel文件时出错: %s", e)
             raise e
     
     def _parse_messages(self, row: pd.Series) -> List[Dict]:
@@ -153,7 +242,7 @@ class ChatAnalyzer:
         if 'messages' in row and not pd.isna(row['messages']):
             try:
                 if isinstance(row['messages'], str):
-                    messages = json.loads(row['messages'])
+                    messages = json_loads(row['messages'])
                 elif isinstance(row['messages'], list):
                     messages = row['messages']
             except json.JSONDecodeError:
@@ -171,75 +260,222 @@ class ChatAnalyzer:
         
         return users
     
-    def _apply_filters(self, messages: List[Dict], users: List[str], counters: Dict, record_index: int, row: pd.Series) -> bool:
+    def _process_frame(self, df: pd.DataFrame, counters: Dict, engine=None, progress_callback=None) -> None:
+        """对一批记录应用过滤规则（engine为None时逐行处理）"""
+        if len(df):
+            self.features.begin_frame(int(df.index[0]), len(df))
+        
+        if engine is not None:
+            # 列式引擎：展开消息/用户表后批量执行过滤规则
+            engine.process_frame(df, counters, progress_callback)
+            return
+        
+        # 逐条处理记录
+        for index, row in df.iterrows():
+            # 更新进度
+            if progress_callback and (index + 1) % 1000 == 0:
+                progress = 20 + int((index + 1) / counters['total_records'] * 70)
+                progress_callback(progress, f"处理进度: {index + 1}/{counters['total_records']}")
+            
+            self._process_row(index, row, counters)
+    
+    def _process_frames_sharded(self, frames: Iterable[pd.DataFrame], counters: Dict,
+                                total_rows: Optional[int], progress_callback=None) -> None:
+        """将记录按行号区间切分为分片，提交到进程池并按提交顺序合并结果"""
+        pool = get_worker_pool()
+        filter_rules = copy.deepcopy(self.filter_rules)
+        staff_list = list(self.after_sales_staff)
+        # 限制在途分片数量，避免读取速度快于处理速度时占用过多内存
+        max_in_flight = settings.ANALYSIS_WORKERS * 2
+        in_flight = deque()
+        rows_done = 0
+        
+        def merge_oldest() -> int:
+            future, shard_rows = in_flight.popleft()
+            shard_counters, shard_store, shard_features, shard_rule_stats = future.result()
+            counters['total_records'] += shard_rows
+            for key, value in shard_counters.items():
+                if key != 'total_records':
+                    counters[key] += value
+            self.record_store.extend(shard_store)
+            self.features.extend(shard_features)
+            self._get_rule_plan().merge(shard_rule_stats)
+            return shard_rows
+        
+        try:
+            for shard in _split_batches(frames):
+                self._check_cancelled()
+                future = pool.submit(_analyze_shard, shard, filter_rules, staff_list,
+                                     settings.ANALYSIS_ENGINE, self.record_store.record_date)
+                in_flight.append((future, len(shard)))
+                
+                if len(in_flight) >= max_in_flight:
+                    rows_done += merge_oldest()
+                    _report_rows_progress(progress_callback, rows_done, total_rows)
+            
+            while in_flight:
+                self._check_cancelled()
+                rows_done += merge_oldest()
+                _report_rows_progress(progress_callback, rows_done, total_rows)
+        except AnalysisCancelled:
+            # 进程池由所有任务共享，不终止工作进程：撤回尚未开始的分片，已开始的分片结果直接丢弃
+            for future, _ in in_flight:
+                future.cancel()
+            raise
+    
+    def _check_cancelled(self) -> None:
+        """检查任务是否已取消或超时（在每批记录之间调用）"""
+        if self._cancel_token is not None:
+            self._cancel_token.check()
+    
+    def _process_row(self, index: int, row: pd.Series, counters: Dict) -> None:
+        """处理单条记录：解析消息和用户数据并应用过滤规则"""
+        try:
+            # 解析消息和用户数据
+            messages = self._parse_messages(row)
+            users = self._parse_users(row)
+            
+            # 检查是否为空记录
+            if not messages:
+                self.features.set_status(index, ROW_EMPTY)
+                self._record_empty(index, counters)
+                return
+            
+            outcomes = self._collect_row_features(index, messages, users)
+            
+            # 应用过滤规则
+            if self._apply_filters(outcomes, counters, index):
+                counters['filtered_records'] += 1
+                
+        except Exception as e:
+            self._record_parse_error(index, counters, e)
+    
+    def _collect_row_features(self, index: int, messages: List[Dict], users: List[str]) -> List[list]:
         """
-        应用过滤规则
+        计算记录在全部规则上的特征（与规则是否启用无关），写入特征表
         
         Returns:
-            bool: True表示应该过滤掉这条记录
+            各规则（按FILTER_RULE_SPECS顺序）的[详情值, 检查时的异常, 耗时]，由规则执行计划归因，不再重复检查
         """
-        # 过滤规则1: 早晨消息检查(0-8点)
-        if self.filter_rules['early_morning_filter']['enabled']:
-            early_time = self._check_early_morning_messages(messages)
-            if early_time:
-                counters['early_morning_count'] += 1
-                self._add_filtered_record("early_morning", "早晨消息(0-8点)", record_index, row, 
-                                        timestamp=early_time)
-                return True
-        
-        # 过滤规则2: 售后人员检查
-        if self.filter_rules['staff_filter']['enabled']:
-            staff_name = self._check_staff_involvement(users)
-            if staff_name:
-                counters['staff_involved_count'] += 1
-                self._add_filtered_record("staff_involvement", "售后人员参与", record_index, row,
-                                        staff_name=staff_name)
-                return True
+        checks = (
+            lambda: self._scan_early_morning(messages),
+            lambda: self._check_staff_involvement(users),
+            lambda: self._check_service_assistant_only(messages),
+            lambda: self._check_address_confirmation(messages),
+        )
+        outcomes = []
+        error_rules = invalid_rules = 0
+        for code, check in enumerate(checks):
+            error = None
+            started = time.perf_counter()
+            try:
+                value = check()
+            except Exception as e:
+                value, error = None, e
+                error_rules |= 1 << code
+            outcomes.append([value, error, time.perf_counter() - started])
+        # 早晨消息规则的特征是小时掩码，详情值是窗口内第一条消息的时间
+        hour_mask, outcomes[0][0] = outcomes[0][0] or (0, None)
+        for code, (value, _, _) in enumerate(outcomes):
+            # 命中时的详情值无法保存（如非字符串的地址）时，该规则命中的记录按解析错误处理
+            detail_field = FILTER_RULE_SPECS[code][4]
+            if value and not self.record_store.accepts(detail_field, value):
+                invalid_rules |= 1 << code
+        _, staff_name, service_message, address_content = (value for value, _, _ in outcomes)
+        self.features.set_row(index, hour_mask, staff_name or None,
+                              bool(service_message), bool(address_content), error_rules, invalid_rules)
+        return outcomes
+    
+    def _record_empty(self, index: int, counters: Dict) -> None:
+        """记录空消息记录"""
+        counters['empty_records_count'] += 1
+        counters['filtered_records'] += 1
+        self._add_filtered_record("empty_record", "空记录", index)
+    
+    def _record_parse_error(self, index: int, counters: Dict, error: Exception) -> None:
+        """记录解析错误"""
+        self._error_log.log(logging.WARNING, "处理记录 %d 时出错: %s", index, error)
+        counters['parse_error_count'] += 1
+        counters['filtered_records'] += 1
+        self._add_filtered_record("parse_error", "解析错误", index, 
+                                error_message=str(error))
+    
+    def _apply_filters(self, outcomes: List[list], counters: Dict, record_index: int) -> bool:
+        """
+        应用过滤规则（按规则执行计划的优先级，取第一个命中的规则）
         
-        # 过滤规则3: 服务助手检查
-        if self.filter_rules['service_assistant_filter']['enabled']:
-            service_msg = self._check_service_assistant_only(messages)
-            if service_msg:
-                counters['service_assistant_count'] += 1
-                self._add_filtered_record("service_assistant", "服务助手消息", record_index, row,
-                                        service_message=service_msg)
-                return True
+        Args:
+            outcomes: _collect_row_features返回的各规则检查结果
         
-        # 过滤规则4: 收货地址确认检查
-        if self.filter_rules['address_confirm_filter']['enabled']:
-            address_content = self._check_address_confirmation(messages)
-            if address_content:
-                counters['address_confirm_count'] += 1
-                self._add_filtered_record("address_confirmation", "收货地址确认消息", record_index, row,
-                                        address_content=address_content)
-                return True
+        Returns:
+            bool: True表示应该过滤掉这条记录
+        """
+        hit = self._get_rule_plan().first_hit(outcomes)
+        if hit is None:
+            return False
         
-        return False
+        spec, value = hit
+        self._commit_filter_hit(spec, value, counters, record_index)
+        return True
+    
+    def _get_rule_plan(self) -> RulePlan:
+        """获取本次分析的规则执行计划（按需编译）"""
+        if self._rule_plan is None:
+            self._rule_plan = RulePlan(self.filter_rules)
+        return self._rule_plan
     
-    def _check_early_morning_messages(self, messages: List[Dict]) -> Optional[datetime.datetime]:
-        """检查早晨消息(0-8点)，返回具体时间"""
+    def _commit_filter_hit(self, spec: tuple, value: Any, counters: Dict, record_index: int) -> None:
+        """记录规则命中：更新计数器并添加过滤记录详情"""
+        rule_key, filter_type, filter_reason, counter_key, detail_field = spec
+        if rule_key == "early_morning_filter":
+            clock = self._get_business_clock()
+            filter_reason = f"早晨消息({clock.start_hour}-{clock.end_hour}点)"
+        counters[counter_key] += 1
         try:
-            for message in messages:
-                if isinstance(message, dict) and 'time' in message:
-                    time_str = message['time']
-                    if time_str:
-                        # 处理时间字符串
-                        time_str = time_str.replace('Z', '+00:00')
-                        dt = datetime.datetime.fromisoformat(time_str)
-                        if 0 <= dt.hour < 8:
-                            return dt
+            self._add_filtered_record(filter_type, filter_reason, record_index,
+                                    **{detail_field: value})
         except Exception:
-            pass
-        return None
+            # 详情无法保存时该记录按解析错误处理，特征表同步标记
+            self.features.mark_invalid_detail(record_index, _RULE_CODES[rule_key])
+            raise
+    
+    def _scan_early_morning(self, messages: List[Dict]) -> Tuple[int, Optional[datetime.datetime]]:
+        """
+        检查早晨消息（业务时区内的配置时间窗口，默认0-8点）
+        
+        Returns:
+            (需要判断的本地小时集合（24位掩码）, 窗口内第一条消息的时间)；
+            时间无法解析时不再检查后续消息
+        """
+        clock = self._get_business_clock()
+        hour_mask = 0
+        first_match = None
+        for message in messages:
+            if isinstance(message, dict) and 'time' in message:
+                time_str = message['time']
+                if time_str:
+                    dt = clock.parse(time_str) if isinstance(time_str, str) else None
+                    if dt is None:
+                        break
+                    hour_mask |= 1 << dt.hour
+                    if first_match is None and clock.in_window(dt.hour):
+                        first_match = dt
+        return hour_mask, first_match
+    
+    def _get_business_clock(self) -> BusinessClock:
+        """获取本次分析的业务时钟（时区换算和早晨时间窗口）"""
+        if self._business_clock is None:
+            rule_config = self.filter_rules.get('early_morning_filter', {})
+            self._business_clock = BusinessClock(
+                settings.BUSINESS_TIMEZONE,
+                rule_config.get('start_hour', 0),
+                rule_config.get('end_hour', 8)
+            )
+        return self._business_clock
     
     def _check_staff_involvement(self, users: List[str]) -> Optional[str]:
         """检查售后人员参与，返回具体人员姓名"""
-        for user in users:
-            if 'tineco添可官方旗舰店:k' in user:
-                return user
-            elif user in self.after_sales_staff:
-                return user
-        return None
+        return self.staff_matcher.first_match(users)
     
     def _check_service_assistant_only(self, messages: List[Dict]) -> Optional[str]:
         """检查是否全部是服务助手消息，返回服务助手消息内容"""
@@ -249,7 +485,7 @@ class ChatAnalyzer:
         service_messages = []
         for message in messages:
             if isinstance(message, dict) and 'sender_nick' in message:
-                if message['sender_nick'] != 'tineco添可官方旗舰店:服务助手':
+                if message['sender_nick'] != SERVICE_ASSISTANT_NICK:
                     return None
                 if 'content' in message:
                     content = message['content']
@@ -263,59 +499,37 @@ class ChatAnalyzer:
         for message in messages:
             if isinstance(message, dict) and 'content' in message:
                 content = message['content']
-                if isinstance(content, dict) and content.get('summary') == '请确认收货地址':
+                if isinstance(content, dict) and content.get('summary') == ADDRESS_CONFIRM_SUMMARY:
                     # 尝试提取地址信息
                     if 'text' in content:
                         return content['text']
-                    return '请确认收货地址'
+                    return ADDRESS_CONFIRM_SUMMARY
         return None
     
     def _add_filtered_record(self, filter_type: str, filter_reason: str, record_index: int, 
-                           row: pd.Series, **kwargs) -> None:
-        """添加过滤记录详情"""
-        # 生成记录ID
-        record_id = f"CHT_{datetime.datetime.now().strftime('%Y%m%d')}_{record_index:06d}"
-        
-        # 创建原始数据字典
-        raw_data = {}
-        for col in row.index:
-            try:
-                value = row[col]
-                if pd.notna(value):
-                    raw_data[col] = value if not isinstance(value, pd.Series) else str(value)
-            except Exception:
-                pass
-        
-        # 创建FilteredRecord对象
-        filtered_record = FilteredRecord(
-            record_id=record_id,
-            filter_type=filter_type,
-            filter_reason=filter_reason,
-            record_index=record_index,
-            raw_data=raw_data,
-            **kwargs
+                           **kwargs) -> None:
+        """添加过滤记录详情（原始数据不在此复制，查看详情时通过行号按需加载）"""
+        self.record_store.append(filter_type, filter_reason, record_index, **kwargs)
+    
+    def _log_analysis_summary(self, result: AnalysisResult) -> None:
+        """记录分析结果摘要"""
+        clock = self._get_business_clock()
+        logger.info(
+            "分析完成: 总记录 %d，被过滤 %d，有效 %d，过滤率 %s%%；"
+            "早晨消息(%d-%d点) %d，售后人员参与 %d，全部是服务助手消息 %d，收货地址确认 %d，解析错误 %d，空消息 %d",
+            result.total_records, result.filtered_records, result.valid_records, result.filter_rate,
+            clock.start_hour, clock.end_hour, result.early_morning_count, result.staff_involved_count, result.service_assistant_count,
+            result.address_confirm_count, result.parse_error_count, result.empty_records_count
         )
-        
-        self.filtered_records_details.append(filtered_record)
     
-    def _print_analysis_summary(self, result: AnalysisResult) -> None:
-        """打印分析结果摘要"""
-        print("\n" + "-" * 70)
-        print("聊天记录分析结果摘要")
-        print("-" * 70)
-        print(f"总记录数: {result.total_records}")
-        print(f"被过滤记录数: {result.filtered_records}")
-        print(f"有效记录数: {result.valid_records}")
-        print(f"过滤率: {result.filter_rate}%")
-        print("\n" + "-" * 70)
-        print("过滤条件统计")
-        print("-" * 70)
-        print(f"早晨消息(0-8点): {result.early_morning_count} 条")
-        print(f"售后人员参与: {result.staff_involved_count} 条")
-        print(f"全部是服务助手消息: {result.service_assistant_count} 条")
-        print(f"收货地址确认消息: {result.address_confirm_count} 条")
-        print(f"消息解析错误: {result.parse_error_count} 条")
-        print(f"空消息记录: {result.empty_records_count} 条")
+    @staticmethod
+    def _build_staff_matcher(staff_list: List[str]) -> StaffMatcher:
+        """编译售后人员匹配器（精确昵称 + 昵称子串/前缀特征）"""
+        return StaffMatcher(
+            staff_list,
+            substrings=[STAFF_NICK_MARKER, *settings.STAFF_NICK_SUBSTRINGS],
+            prefixes=settings.STAFF_NICK_PREFIXES
+        )
     
     def get_filter_rules(self) -> Dict:
         """获取当前过滤规则配置"""
@@ -323,15 +537,27 @@ class ChatAnalyzer:
     
     def update_filter_rules(self, rules: Dict) -> None:
         """更新过滤规则配置"""
-        self.filter_rules.update(rules)
+        with self._config_lock:
+            self.filter_rules.update(rules)
+        self._rule_plan = None
+        self._business_clock = None
     
     def get_staff_list(self) -> List[str]:
         """获取售后人员名单"""
         return self.after_sales_staff.copy()
     
+    def get_staff_list_version(self) -> str:
+        """售后人员名单版本（名单内容的摘要，名单变化后版本随之变化）"""
+        staff_json = json.dumps(self.after_sales_staff, ensure_ascii=False)
+        return hashlib.sha256(staff_json.encode('utf-8')).hexdigest()[:16]
+    
     def update_staff_list(self, staff_list: List[str]) -> None:
         """更新售后人员名单"""
-        self.after_sales_staff = staff_list.copy()
+        # 先编译新的匹配器再整体替换，进行中的分析不会看到半更新的名单
+        matcher = self._build_staff_matcher(staff_list)
+        with self._config_lock:
+            self.after_sales_staff = staff_list.copy()
+            self.staff_matcher = matcher
         
         # 保存到配置文件
         try:
@@ -340,7 +566,83 @@ class ChatAnalyzer:
             with open(settings.STAFF_CONFIG_PATH, 'w', encoding='utf-8') as f:
                 json.dump(staff_data, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            print(f"保存售后人员名单出错: {e}")
+            logger.error("保存售后人员名单出错: %s", e)
+
+# 规则配置键到优先级编码
+_RULE_CODES = {spec[0]: code for code, spec in enumerate(FILTER_RULE_SPECS)}
+
+def _new_counters() -> Dict[str, int]:
+    """创建空的分析计数器"""
+    return {
+        'total_records': 0,
+        'filtered_records': 0,
+        'early_morning_count': 0,
+        'staff_involved_count': 0,
+        'service_assistant_count': 0,
+        'address_confirm_count': 0,
+        'parse_error_count': 0,
+        'empty_records_count': 0
+    }
+
+def summarize_counters(counters: Dict[str, int]) -> Dict[str, Any]:
+    """由计数器计算分析结果的汇总字段（有效记录数、过滤率和各规则计数）"""
+    valid_records = counters['total_records'] - counters['filtered_records']
+    filter_rate = (counters['filtered_records'] / counters['total_records'] * 100) if counters['total_records'] > 0 else 0
+    
+    return {
+        "total_records": counters['total_records'],
+        "filtered_records": counters['filtered_records'],
+        "valid_records": valid_records,
+        "filter_rate": round(filter_rate, 2),
+        "early_morning_count": counters['early_morning_count'],
+        "staff_involved_count": counters['staff_involved_count'],
+        "service_assistant_count": counters['service_assistant_count'],
+        "address_confirm_count": counters['address_confirm_count'],
+        "parse_error_count": counters['parse_error_count'],
+        "empty_records_count": counters['empty_records_count']
+    }
+
+def _new_record_store() -> FilteredRecordStore:
+    """创建空的过滤记录存储（记录ID使用当天日期）"""
+    return FilteredRecordStore(datetime.datetime.now().strftime('%Y%m%d'))
+
+def _mask_known_bad_rows(frames: Iterable[pd.DataFrame], bad_rows: np.ndarray) -> Iterable[pd.DataFrame]:
+    """将已知无效记录的messages置为空值（批次索引为全局行号）"""
+    for frame in frames:
+        if len(frame) and 'messages' in frame.columns:
+            rows = bad_rows[np.isin(bad_rows, frame.index)]
+            if len(rows):
+                frame = frame.copy()
+                frame.loc[rows, 'messages'] = np.nan
+        yield frame
+
+def _split_batches(frames: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+    """将数据按STREAMING_BATCH_ROWS行切分为批次（流式读取的批次不再切分）"""
+    for frame in frames:
+        for start in range(0, len(frame), settings.STREAMING_BATCH_ROWS):
+            yield frame.iloc[start:start + settings.STREAMING_BATCH_ROWS]
+
+def _report_rows_progress(progress_callback, rows_done: int, total_rows: Optional[int]) -> None:
+    """按已处理行数报告进度（10%-90%）"""
+    if not progress_callback:
+        return
+    if total_rows:
+        progress = 10 + int(min(rows_done / total_rows, 1) * 80)
+        progress_callback(progress, f"处理进度: {rows_done}/{total_rows}")
+    else:
+        progress_callback(10, f"已处理 {rows_done} 条记录")
+
+def _analyze_shard(shard: pd.DataFrame, filter_rules: Dict, staff_list: List[str],
+                   engine_name: str, record_date: str) -> tuple:
+    """在工作进程中分析一个分片，返回(计数器, 过滤记录存储, 特征表, 规则评估统计)"""
+    shard_analyzer = ChatAnalyzer(staff_list=staff_list, filter_rules=filter_rules)
+    shard_analyzer.record_store = FilteredRecordStore(record_date)
+    counters = _new_counters()
+    engine = ColumnarFilterEngine(shard_analyzer) if engine_name == "columnar" else None
+    shard_analyzer._process_frame(shard, counters, engine)
+    shard_analyzer._error_log.summary("分片中解析错误的记录")
+    return (counters, shard_analyzer.record_store, shard_analyzer.features,
+            shard_analyzer._get_rule_plan().get_stats())
 
 # 创建全局分析器实例
 analyzer = ChatAnalyzer()
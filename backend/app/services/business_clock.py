@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+# 时间字符串解析结果的缓存条数（按最近最少使用淘汰，内存占用与文件行数无关）
+_PARSE_CACHE_SIZE = 65536
+
+class BusinessClock:
+    """
+    店铺本地时间换算与早晨时间窗口判断
+
+    带时区偏移的时间（含Z）换算到业务时区后再取小时；不带时区的时间视为已是本地时间。
+    业务时区为空时保持字符串自带的偏移，不做换算。
+    解析结果按原始字符串缓存在有界的LRU中，同一次分析中重复出现的时间通常只解析一次。
+    """
+
+    def __init__(self, timezone_name: str = "", start_hour: int = 0, end_hour: int = 8):
+        self.timezone = ZoneInfo(timezone_name) if timezone_name else None
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.parse = functools.lru_cache(maxsize=_PARSE_CACHE_SIZE)(self._parse)
+
+    def _parse(self, time_str: str) -> Optional[datetime.datetime]:
+        """解析时间字符串并换算为业务时区，无法解析时返回None（通过parse调用）"""
+        try:
+            dt = datetime.datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+            if self.timezone is not None and dt.tzinfo is not None:
+                dt = dt.astimezone(self.timezone)
+        except Exception:
+            dt = None
+        return dt
+
+    def in_window(self, hour: int) -> bool:
+        """判断小时是否在时间窗口内（起始小时大于结束小时表示跨越午夜）"""
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= hour < self.end_hour
+        return hour >= self.start_hour or hour < self.end_hour
+
+    def parse_hours(self, time_values: np.ndarray) -> np.ndarray:
+        """
+        一次解析整列时间字符串，返回本地小时数组（无法解析为-1）
+
+        先对整列去重，每个不同的字符串只解析一次。
+        """
+        hours = np.full(len(time_values), -1, dtype=np.int16)
+        if len(time_values):
+            codes, uniques = pd.factorize(time_values)
+            unique_hours = np.array(
+                [dt.hour if dt is not None else -1 for dt in map(self.parse, uniques)],
+                dtype=np.int16
+            )
+            hours[:] = unique_hours[codes]
+        return hours
+
+    def window_mask(self, hours: np.ndarray) -> np.ndarray:
+        """向量化判断小时数组是否在时间窗口内"""
+        if self.start_hour <= self.end_hour:
+            return (hours >= self.start_hour) & (hours < self.end_hour)
+        return (hours >= self.start_hour) | ((hours >= 0) & (hours < self.end_hour))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Dict, Optional
+
+class AnalysisCancelled(Exception):
+    """分析任务被取消或超时"""
+
+    def __init__(self, reason: str, timed_out: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.timed_out = timed_out
+        self.counters: Optional[Dict[str, int]] = None  # 取消时已处理部分的计数器
+
+class CancellationToken:
+    """
+    分析任务的取消令牌
+
+    API请求线程调用cancel设置取消标志，分析线程在每批记录之间调用check，
+    已取消或超过时限时抛出AnalysisCancelled，任务线程随即结束并释放执行槽位。
+    时限从任务开始执行（start）时计算，排队等待的时间不计入。
+    在分析工作进程中使用时，取消标志为API进程传入的multiprocessing.Event。
+    """
+
+    def __init__(self, timeout: Optional[float] = None, event=None):
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.reason: Optional[str] = None
+        self._event = event if event is not None else threading.Event()
+
+    def start(self) -> None:
+        """任务开始执行，开始计时"""
+        if self.timeout:
+            self.deadline = time.monotonic() + self.timeout
+
+    def cancel(self, reason: str = "任务已取消") -> None:
+        """请求取消任务"""
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """检查取消标志和时限"""
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason or "任务已取消")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise AnalysisCancelled(f"分析超时（超过{self.timeout}秒）", timed_out=True)
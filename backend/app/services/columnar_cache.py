@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+上传文件的列式缓存
+
+上传时将Excel解析一次并保存为同名的Parquet文件（与上传文件位于同一目录），
+之后的分析、重新分析和原始数据加载都直接读取Parquet（内存映射），不再解析xlsx的XML。
+messages等列按原样保存为字符串。缓存依赖可选的pyarrow，未安装或转换失败时回退到读取Excel。
+"""
+
+import logging
+import os
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Sequence
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow为可选依赖
+    pq = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_EXTENSION = '.parquet'
+
+# 每个行组的行数：加载原始数据时只读取包含所需行的行组
+_ROW_GROUP_ROWS = 10000
+
+def is_enabled() -> bool:
+    """列式缓存是否可用"""
+    return settings.COLUMNAR_CACHE and pq is not None
+
+def get_cache_path(file_path: str) -> str:
+    """上传文件对应的缓存文件路径"""
+    return os.path.splitext(file_path)[0] + CACHE_EXTENSION
+
+def find_cache(file_path: str) -> Optional[str]:
+    """返回可用的缓存文件路径，缓存不存在或早于源文件时返回None"""
+    if not is_enabled():
+        return None
+    cache_path = get_cache_path(file_path)
+    if cache_path == file_path or not os.path.exists(cache_path):
+        return None
+    if os.path.getmtime(cache_path) < os.path.getmtime(file_path):
+        return None
+    return cache_path
+
+def build_cache(file_path: str) -> pd.DataFrame:
+    """
+    读取Excel文件并写入列式缓存
+
+    Returns:
+        pd.DataFrame: 读取的完整数据（与pd.read_excel一致）
+    """
+    df = pd.read_excel(file_path)
+    write_cache(file_path, df)
+    return df
+
+def convert_to_cache(file_path: str) -> Optional[str]:
+    """读取Excel文件并写入列式缓存，只返回缓存路径（在工作进程中执行，不回传数据）"""
+    return write_cache(file_path, pd.read_excel(file_path))
+
+def write_cache(file_path: str, df: pd.DataFrame) -> Optional[str]:
+    """将数据写入缓存文件，无法转换时（如同一列混合数字和文本）返回None"""
+    if not is_enabled():
+        return None
+    cache_path = get_cache_path(file_path)
+    temp_path = cache_path + '.tmp'
+    try:
+        # 先写临时文件再替换，读取方不会看到写了一半的缓存
+        df.to_parquet(temp_path, engine='pyarrow', index=False, row_group_size=_ROW_GROUP_ROWS)
+        os.replace(temp_path, cache_path)
+        return cache_path
+    except Exception as e:
+        logger.warning("生成列式缓存失败，将直接读取Excel: %s", e)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+def read_cache(cache_path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """以内存映射方式读取缓存，columns中不存在的列会被忽略"""
+    if columns is not None:
+        names = set(pq.read_schema(cache_path).names)
+        columns: List[str] = [column for column in columns if column in names]
+    return pd.read_parquet(cache_path, engine='pyarrow', columns=columns, memory_map=True)
+
+def read_rows(cache_path: str, row_indexes: Sequence[int]) -> pd.DataFrame:
+    """
+    只读取包含指定行的行组，按row_indexes的顺序返回这些行（索引为行号）
+
+    Raises:
+        IndexError: 行号超出范围
+    """
+    parquet_file = pq.ParquetFile(cache_path, memory_map=True)
+    metadata = parquet_file.metadata
+    starts = np.cumsum([0] + [metadata.row_group(group).num_rows for group in range(metadata.num_row_groups)])
+    row_indexes = np.asarray(row_indexes, dtype=np.int64)
+    if len(row_indexes) and (row_indexes.min() < 0 or row_indexes.max() >= starts[-1]):
+        raise IndexError(f"行号超出范围（共{starts[-1]}行）")
+
+    frames = []
+    for group in np.unique(np.searchsorted(starts, row_indexes, side='right') - 1):
+        frame = parquet_file.read_row_group(int(group)).to_pandas()
+        frame.index = pd.RangeIndex(starts[group], starts[group] + len(frame))
+        frames.append(frame)
+    if not frames:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return pd.concat(frames).loc[row_indexes]
+
+def remove_cache(file_path: str) -> None:
+    """删除上传文件对应的缓存"""
+    cache_path = get_cache_path(file_path)
+    if cache_path != file_path and os.path.exists(cache_path):
+        os.remove(cache_path)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Any
+
+from app.core.json_backend import json_decoder, DecodeFailure
+from app.services.rules import (
+    FILTER_RULE_SPECS, SERVICE_ASSISTANT_NICK, ADDRESS_CONFIRM_SUMMARY
+)
+
+
+class ColumnarFilterEngine:
+    """
+    列式过滤引擎
+
+    将messages列的JSON展开为扁平的消息表（record_id, time, sender_nick, summary, text），
+    将users列展开为用户表，然后用NumPy/pandas向量化谓词执行四条过滤规则，
+    按规则优先级取第一个命中的规则。计数器和过滤详情与逐行处理完全一致。
+    """
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    def process_frame(self, df: pd.DataFrame, counters: Dict, progress_callback=None) -> None:
+        """对一个DataFrame执行全部过滤规则并写入计数器和过滤详情"""
+        total = len(df)
+        if total == 0:
+            return
+
+        messages, users, fallback = self._explode(df)
+
+        if progress_callback:
+            progress_callback(45, f"消息表展开完成: {len(messages['record_id'])} 条消息")
+
+        hits = self._evaluate_rules(messages, users, fallback, total)
+        self._record_features(users, hits, fallback)
+
+        if progress_callback:
+            progress_callback(55, "过滤规则计算完成，正在汇总结果...")
+
+        self._commit(df, messages, users, hits, fallback, counters, progress_callback)
+
+    def _explode(self, df: pd.DataFrame):
+        """展开messages和users列，返回消息表、用户表和需要逐行处理的记录掩码"""
+        total = len(df)
+        # 存在非常规数据（如非字符串的text）的记录交给逐行逻辑处理，以保证结果一致
+        fallback = np.zeros(total, dtype=bool)
+
+        m_record: List[int] = []
+        m_time: List[Optional[str]] = []
+        m_time_flag: List[int] = []  # 0: 无时间, 1: 时间字符串, 2: 非字符串时间（解析失败）
+        m_has_sender: List[bool] = []
+        m_sender: List[Optional[str]] = []
+        m_summary: List[Optional[str]] = []
+        m_has_text: List[bool] = []
+        m_text: List[Optional[str]] = []
+
+        message_values = df['messages'].tolist() if 'messages' in df.columns else [None] * total
+        strings = []
+        for pos, value in enumerate(message_values):
+            if isinstance(value, str):
+                strings.append((pos, value))
+            elif not pd.api.types.is_scalar(value):
+                fallback[pos] = True
+
+        # 整列批量解码JSON
+        decoded_values = json_decoder.decode_batch([value for _, value in strings])
+
+        for (pos, _), decoded in zip(strings, decoded_values):
+            if isinstance(decoded, DecodeFailure):
+                # JSON格式错误视为空消息，其他异常交给逐行逻辑处理
+                if not isinstance(decoded.error, json.JSONDecodeError):
+                    fallback[pos] = True
+                continue
+
+            if not isinstance(decoded, list):
+                continue
+
+            for message in decoded:
+                time_value = sender = summary = text = None
+                time_flag = 0
+                has_sender = has_text = False
+
+                if isinstance(message, dict):
+                    time_value = message.get('time')
+                    if time_value:
+                        time_flag = 1 if isinstance(time_value, str) else 2
+                    if time_flag != 1:
+                        time_value = None
+
+                    if 'sender_nick' in message:
+                        has_sender = True
+                        sender = message['sender_nick']
+                        if not isinstance(sender, str):
+                            sender = None
+
+                    content = message.get('content') if 'content' in message else None
+                    if isinstance(content, dict):
+                        summary = content.get('summary')
+                        if not isinstance(summary, str):
+                            summary = None
+                        if 'text' in content:
+                            has_text = True
+                            text = content['text']
+                            if not isinstance(text, str):
+                                fallback[pos] = True
+                                text = None
+
+                m_record.append(pos)
+                m_time.append(time_value)
+                m_time_flag.append(time_flag)
+                m_has_sender.append(has_sender)
+                m_sender.append(sender)
+                m_summary.append(summary)
+                m_has_text.append(has_text)
+                m_text.append(text)
+
+        u_record: List[int] = []
+        u_name: List[str] = []
+        user_values = df['users'].tolist() if 'users' in df.columns else [None] * total
+        for pos, value in enumerate(user_values):
+            if not pd.api.types.is_scalar(value):
+                fallback[pos] = True
+                continue
+            if pd.isna(value):
+                continue
+            for user in str(value).split(','):
+                user = user.strip()
+                if user:
+                    u_record.append(pos)
+                    u_name.append(user)
+
+        messages = {
+            'record_id': np.asarray(m_record, dtype=np.int64),
+            'time': _object_array(m_time),
+            'time_flag': np.asarray(m_time_flag, dtype=np.int8),
+            'has_sender': np.asarray(m_has_sender, dtype=bool),
+            'sender_nick': _object_array(m_sender),
+            'summary': _object_array(m_summary),
+            'has_text': np.asarray(m_has_text, dtype=bool),
+            'text': _object_array(m_text),
+        }
+        users = {
+            'record_id': np.asarray(u_record, dtype=np.int64),
+            'user': _object_array(u_name),
+        }
+        return messages, users, fallback
+
+    def _evaluate_rules(self, messages: Dict, users: Dict, fallback: np.ndarray, total: int) -> Dict[str, Any]:
+        """向量化计算每条规则在每条记录上的命中情况，并记录规则评估统计"""
+        m_record = messages['record_id']
+        message_counts = np.bincount(m_record, minlength=total)
+        # 逐行逻辑只对非空记录评估规则；回退记录的统计由逐行逻辑记录
+        evaluated = (message_counts > 0) & ~fallback
+        evaluated_count = int(evaluated.sum())
+        plan = self.analyzer._get_rule_plan()
+        started = time.perf_counter()
+
+        # 规则1: 早晨消息——每条记录中第一条有时间的消息若解析失败则整条规则不命中
+        clock = self.analyzer._get_business_clock()
+        time_flag = messages['time_flag']
+        hours = np.full(len(m_record), -1, dtype=np.int16)
+        timed = time_flag == 1
+        hours[timed] = clock.parse_hours(messages['time'][timed])
+        in_window = clock.window_mask(hours)
+        decisive = (time_flag != 0) & ((hours < 0) | in_window)
+        early_first = _first_per_record(m_record, decisive, total)
+        early_hit = early_first >= 0
+        early_hit[early_hit] = in_window[early_first[early_hit]]
+        # 特征表：第一条时间无法解析的消息之前出现的全部本地小时
+        failed = (time_flag == 2) | (timed & (hours < 0))
+        failed_first = _first_per_record(m_record, failed, total)
+        limit = np.where(failed_first >= 0, failed_first, len(m_record))
+        counted = timed & (hours >= 0) & (np.arange(len(m_record)) < limit[m_record])
+        hour_masks = np.zeros(total, dtype=np.uint32)
+        np.bitwise_or.at(hour_masks, m_record[counted], np.left_shift(np.uint32(1), hours[counted].astype(np.uint32)))
+        started = self._add_rule_stats(plan, "early_morning_filter", evaluated_count,
+                                       early_hit & evaluated, started)
+
+        # 规则2: 售后人员参与
+        staff_mask = self.analyzer.staff_matcher.match_array(users['user'])
+        staff_first = _first_per_record(users['record_id'], staff_mask, total)
+        staff_hit = staff_first >= 0
+        started = self._add_rule_stats(plan, "staff_filter", evaluated_count,
+                                       staff_hit & evaluated, started)
+
+        # 规则3: 全部为服务助手消息（拼接后的消息内容为空字符串时不命中）
+        has_sender = messages['has_sender']
+        non_assistant = has_sender & (messages['sender_nick'] != SERVICE_ASSISTANT_NICK)
+        assistant_text = has_sender & messages['has_text']
+        text_counts = np.bincount(m_record[assistant_text], minlength=total)
+        empty_text_counts = np.bincount(
+            m_record[assistant_text & (messages['text'] == '')], minlength=total
+        )
+        assistant_hit = (
+            (np.bincount(m_record[non_assistant], minlength=total) == 0)
+            & ~((text_counts == 1) & (empty_text_counts == 1))
+        )
+        started = self._add_rule_stats(plan, "service_assistant_filter", evaluated_count,
+                                       assistant_hit & evaluated, started)
+
+        # 规则4: 收货地址确认（第一条确认消息的内容为空字符串时不命中）
+        address_first = _first_per_record(
+            m_record, messages['summary'] == ADDRESS_CONFIRM_SUMMARY, total
+        )
+        address_hit = address_first >= 0
+        address_pos = address_first[address_hit]
+        address_hit[address_hit] = ~(messages['has_text'][address_pos] & (messages['text'][address_pos] == ''))
+        self._add_rule_stats(plan, "address_confirm_filter", evaluated_count,
+                             address_hit & evaluated, started)
+
+        return {
+            'message_counts': message_counts,
+            'early_morning_filter': early_hit,
+            'early_first': early_first,
+            'hour_masks': hour_masks,
+            'staff_filter': staff_hit,
+            'staff_first': staff_first,
+            'service_assistant_filter': assistant_hit,
+            'address_confirm_filter': address_hit,
+            'address_first': address_first,
+        }
+
+    def _record_features(self, users: Dict, hits: Dict, fallback: np.ndarray) -> None:
+        """将全部规则的命中情况写入特征表（回退记录由逐行逻辑写入）"""
+        has_messages = hits['message_counts'] > 0
+        staff_hit = hits['staff_filter']
+        staff_names = np.full(len(staff_hit), None, dtype=object)
+        staff_names[staff_hit] = users['user'][hits['staff_first'][staff_hit]]
+        self.analyzer.features.set_frame(
+            np.flatnonzero(has_messages & ~fallback),
+            np.flatnonzero(~has_messages & ~fallback),
+            hits['hour_masks'],
+            staff_names,
+            hits['service_assistant_filter'],
+            hits['address_confirm_filter']
+        )
+
+    @staticmethod
+    def _add_rule_stats(plan, rule_key: str, evaluated_count: int, hit: np.ndarray, started: float) -> float:
+        """记录一条规则的向量化评估统计，返回新的计时起点"""
+        now = time.perf_counter()
+        plan.add_stats(rule_key, evaluated_count, int(hit.sum()), now - started)
+        return now
+
+    def _commit(self, df: pd.DataFrame, messages: Dict, users: Dict, hits: Dict,
+                fallback: np.ndarray, counters: Dict, progress_callback=None) -> None:
+        """按原始行顺序写入计数器和过滤详情"""
+        total = len(df)
+        analyzer = self.analyzer
+        empty = (hits['message_counts'] == 0) & ~fallback
+
+        # 按规则优先级为每条记录确定命中的规则
+        outcome = np.full(total, -1, dtype=np.int8)
+        decided = fallback | empty
+        for code, spec in enumerate(FILTER_RULE_SPECS):
+            if not analyzer.filter_rules[spec[0]]['enabled']:
+                continue
+            selected = hits[spec[0]] & ~decided
+            outcome[selected] = code
+            decided |= selected
+
+        message_offsets = np.concatenate(([0], np.cumsum(hits['message_counts'])))
+        pending = np.flatnonzero(fallback | empty | (outcome >= 0))
+        labels = list(df.index)
+
+        for done, pos in enumerate(pending):
+            if progress_callback and (done + 1) % 1000 == 0:
+                progress = 55 + int((done + 1) / len(pending) * 35)
+                progress_callback(progress, f"汇总进度: {done + 1}/{len(pending)}")
+
+            index = labels[pos]
+
+            if fallback[pos]:
+                row = df.iloc[pos]
+                analyzer._process_row(index, row, counters)
+                continue
+
+            try:
+                if empty[pos]:
+                    analyzer._record_empty(index, counters)
+                    continue
+
+                spec = FILTER_RULE_SPECS[outcome[pos]]
+                value = self._rule_value(spec[0], pos, messages, users, hits, message_offsets)
+                analyzer._commit_filter_hit(spec, value, counters, index)
+                counters['filtered_records'] += 1
+            except Exception as e:
+                analyzer._record_parse_error(index, counters, e)
+
+    def _rule_value(self, rule_key: str, pos: int, messages: Dict, users: Dict, hits: Dict,
+                    message_offsets: np.ndarray) -> Any:
+        """取出命中规则的详情值（与逐行检查函数的返回值一致）"""
+        if rule_key == "early_morning_filter":
+            return self.analyzer._get_business_clock().parse(messages['time'][hits['early_first'][pos]])
+
+        if rule_key == "staff_filter":
+            return users['user'][hits['staff_first'][pos]]
+
+        if rule_key == "service_assistant_filter":
+            start, stop = message_offsets[pos], message_offsets[pos + 1]
+            texts = [
+                messages['text'][i] for i in range(start, stop)
+                if messages['has_sender'][i] and messages['has_text'][i]
+            ]
+            return "; ".join(texts) if texts else "服务助手消息"
+
+        if rule_key == "address_confirm_filter":
+            first = hits['address_first'][pos]
+            return messages['text'][first] if messages['has_text'][first] else ADDRESS_CONFIRM_SUMMARY
+
+        return None
+
+def _object_array(values: List[Any]) -> np.ndarray:
+    """构建一维object数组（避免numpy将嵌套序列展开为多维）"""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+def _first_per_record(record_ids: np.ndarray, mask: np.ndarray, total: int) -> np.ndarray:
+    """返回每条记录中第一个满足掩码的元素位置（无则为-1），要求record_ids非递减"""
+    first = np.full(total, -1, dtype=np.int64)
+    positions = np.flatnonzero(mask)
+    if positions.size:
+        records = record_ids[positions]
+        starts = np.r_[True, records[1:] != records[:-1]]
+        first[records[starts]] = positions[starts]
+    return first
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+上传文件的全文件校验
+
+格式校验只检查前100行样本。开启全文件校验后，上传完成时在后台流式读取整个文件，
+按分片（ANALYSIS_WORKERS大于1时多进程并行）检查messages列，
+生成紧凑的错误索引（行号、列、错误类别）。
+分析时已确认无法得到消息列表的记录直接按空记录处理，不再重复解码。
+索引按文件ID保存到元数据存储，服务重启后以及其他进程中仍可使用。
+"""
+
+import json
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from array import array
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.json_backend import json_decoder, DecodeFailure
+from app.services.excel_reader import is_streamable, get_excel_row_count, iter_excel_batches
+from app.services.metadata_store import metadata_store
+from app.services.worker_pool import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+# 错误类别: (类别, 说明, 分析时是否按空记录处理)
+ERROR_CLASSES: List[Tuple[str, str, bool]] = [
+    ("json_error", "messages JSON格式错误", True),
+    ("not_list", "messages内容不是消息数组", True),
+    ("invalid_type", "messages格式错误：应为JSON字符串或数组", True),
+    ("decode_error", "messages解码异常", False),
+]
+_CLASS_CODES = {name: code for code, (name, _, _) in enumerate(ERROR_CLASSES)}
+
+# 校验的列
+VALIDATED_COLUMNS = ['messages']
+
+class ValidationIndex:
+    """单个文件的全文件校验状态和错误索引"""
+
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+        self.status = "pending"  # pending / running / completed / failed
+        self.total_rows: Optional[int] = None
+        self.checked_rows = 0
+        self.error_message: Optional[str] = None
+        self.started_time: Optional[datetime] = None
+        self.completed_time: Optional[datetime] = None
+        self.rows = array('q')
+        self.column_codes = array('b')
+        self.class_codes = array('b')
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> 'ValidationIndex':
+        """由元数据存储中保存的记录恢复索引"""
+        index = cls(record["file_id"])
+        for key in ("status", "total_rows", "checked_rows", "error_message", "started_time", "completed_time"):
+            setattr(index, key, record[key])
+        index.rows.frombytes(record["rows"] or b"")
+        index.column_codes.frombytes(record["column_codes"] or b"")
+        index.class_codes.frombytes(record["class_codes"] or b"")
+        return index
+
+    def to_record(self) -> Dict[str, Any]:
+        """保存到元数据存储的记录（错误索引为数组的字节内容）"""
+        with self._lock:
+            return {
+                "file_id": self.file_id,
+                "status": self.status,
+                "total_rows": self.total_rows,
+                "checked_rows": self.checked_rows,
+                "error_message": self.error_message,
+                "started_time": self.started_time,
+                "completed_time": self.completed_time,
+                "rows": self.rows.tobytes(),
+                "column_codes": self.column_codes.tobytes(),
+                "class_codes": self.class_codes.tobytes()
+            }
+
+    def add_errors(self, rows: List[int], column_code: int, class_codes: List[int], checked_rows: int) -> None:
+        """追加一个分片的校验结果（按行号顺序）"""
+        with self._lock:
+            self.rows.extend(rows)
+            self.column_codes.extend([column_code] * len(rows))
+            self.class_codes.extend(class_codes)
+            self.checked_rows += checked_rows
+
+    def skippable_rows(self) -> np.ndarray:
+        """分析时可按空记录处理的行号（只在校验完成后返回）"""
+        if self.status != "completed":
+            return np.empty(0, dtype=np.int64)
+        skippable = [code for code, (_, _, skip) in enumerate(ERROR_CLASSES) if skip]
+        class_codes = np.frombuffer(self.class_codes, dtype=np.int8)
+        rows = np.frombuffer(self.rows, dtype=np.int64)
+        return rows[np.isin(class_codes, skippable)]
+
+    def get_page(self, page: int, page_size: int, error_class: Optional[str] = None) -> Dict[str, Any]:
+        """分页获取错误列表"""
+        with self._lock:
+            class_codes = np.frombuffer(self.class_codes, dtype=np.int8).copy()
+            rows = np.frombuffer(self.rows, dtype=np.int64).copy()
+            column_codes = np.frombuffer(self.column_codes, dtype=np.int8).copy()
+
+        positions = np.arange(len(rows))
+        if error_class is not None:
+            positions = positions[class_codes == _CLASS_CODES.get(error_class, -1)]
+
+        total_count = len(positions)
+        start = (page - 1) * page_size
+        errors = []
+        for position in positions[start:start + page_size] if start >= 0 else []:
+            name, description, _ = ERROR_CLASSES[class_codes[position]]
+            errors.append({
+                "record_index": int(rows[position]),
+                "row": int(rows[position]) + 2,  # Excel中的行号（含表头）
+                "column": VALIDATED_COLUMNS[column_codes[position]],
+                "error_class": name,
+                "error_message": description
+            })
+
+        return {
+            **self.get_summary(class_codes),
+            "errors": errors,
+            "page": page,
+            "page_size": page_size,
+            "total_count": total_count,
+            "total_pages": (total_count + page_size - 1) // page_size
+        }
+
+    def get_summary(self, class_codes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """校验状态和各类错误数量"""
+        if class_codes is None:
+            class_codes = np.frombuffer(self.class_codes, dtype=np.int8)
+        counts = np.bincount(class_codes, minlength=len(ERROR_CLASSES)) if len(class_codes) else [0] * len(ERROR_CLASSES)
+        return {
+            "file_id": self.file_id,
+            "status": self.status,
+            "total_rows": self.total_rows,
+            "checked_rows": self.checked_rows,
+            "total_errors": len(class_codes),
+            "error_counts": {name: int(counts[code]) for code, (name, _, _) in enumerate(ERROR_CLASSES)},
+            "error_message": self.error_message,
+            "started_time": self.started_time,
+            "completed_time": self.completed_time
+        }
+
+# 各文件的校验索引（内存缓存，已保存到元数据存储）
+validation_indexes: Dict[str, ValidationIndex] = {}
+
+def create_index(file_id: str) -> ValidationIndex:
+    """登记待校验的文件（状态为pending）"""
+    index = ValidationIndex(file_id)
+    validation_indexes[file_id] = index
+    metadata_store.save_validation_index(index.to_record())
+    return index
+
+def get_index(file_id: str) -> Optional[ValidationIndex]:
+    """
+    获取文件的校验索引：先查内存，再查元数据存储（服务重启前或其他进程中建立的索引）
+
+    存储中未结束的校验已随原进程中断，按失败返回；只缓存已结束的索引，
+    避免其他进程之后保存的结果被内存中的旧状态遮住。
+    """
+    index = validation_indexes.get(file_id)
+    if index is not None:
+        return index
+    record = metadata_store.get_validation_index(file_id)
+    if record is None:
+        return None
+    index = ValidationIndex.from_record(record)
+    if index.status in ("pending", "running"):
+        index.status = "failed"
+        index.error_message = "服务重启，校验已中断"
+        return index
+    return validation_indexes.setdefault(file_id, index)
+
+def run_deep_validation(file_id: str, file_path: str) -> None:
+    """流式读取整个文件并建立错误索引（在后台线程中执行），结束后保存到元数据存储"""
+    index = validation_indexes.get(file_id) or create_index(file_id)
+    index.status = "running"
+    index.started_time = datetime.now()
+
+    try:
+        if is_streamable(file_path):
+            index.total_rows = get_excel_row_count(file_path)
+            frames = iter_excel_batches(file_path, settings.STREAMING_BATCH_ROWS, usecols=VALIDATED_COLUMNS)
+        else:
+            df = pd.read_excel(file_path, usecols=lambda column: column in VALIDATED_COLUMNS)
+            index.total_rows = len(df)
+            frames = [df]
+
+        _check_frames(index, frames)
+
+        index.status = "completed"
+        logger.info("全文件校验完成 %s: %d 行, %d 个错误", file_id, index.checked_rows, len(index.rows))
+    except Exception as e:
+        index.status = "failed"
+        index.error_message = str(e)
+        logger.error("全文件校验出错 %s: %s", file_id, e)
+    finally:
+        index.completed_time = datetime.now()
+        try:
+            metadata_store.save_validation_index(index.to_record())
+        except Exception as e:
+            logger.error("保存校验索引出错 %s: %s", file_id, e)
+
+def get_skippable_rows(file_id: Optional[str]) -> np.ndarray:
+    """获取文件中分析时可按空记录处理的行号，未校验或校验未完成时返回空数组"""
+    index = get_index(file_id) if file_id else None
+    if index is None:
+        return np.empty(0, dtype=np.int64)
+    return index.skippable_rows()
+
+def discard_index(file_id: str) -> None:
+    """删除内存中的校验索引（文件删除时调用，存储中的索引随文件信息删除）"""
+    validation_indexes.pop(file_id, None)
+
+def _check_frames(index: ValidationIndex, frames: Iterable[pd.DataFrame]) -> None:
+    """按分片检查messages列，多进程时并行执行并按分片顺序合并"""
+    parallel = settings.ANALYSIS_WORKERS > 1
+    pool = get_worker_pool() if parallel else None
+    in_flight = deque()
+    column_code = VALIDATED_COLUMNS.index('messages')
+
+    def merge_oldest() -> None:
+        future, start, count = in_flight.popleft()
+        rows, class_codes = future.result()
+        index.add_errors(rows, column_code, class_codes, count)
+
+    for frame in frames:
+        for start in range(0, len(frame), settings.STREAMING_BATCH_ROWS):
+            chunk = frame.iloc[start:start + settings.STREAMING_BATCH_ROWS]
+            first_row = int(chunk.index[0])
+            values = chunk['messages'].tolist() if 'messages' in chunk.columns else [None] * len(chunk)
+
+            if not parallel:
+                rows, class_codes = check_messages_chunk(first_row, values)
+                index.add_errors(rows, column_code, class_codes, len(chunk))
+                continue
+
+            in_flight.append((pool.submit(check_messages_chunk, first_row, values), first_row, len(chunk)))
+            if len(in_flight) >= settings.ANALYSIS_WORKERS * 2:
+                merge_oldest()
+
+    while in_flight:
+        merge_oldest()
+
+def check_messages_chunk(first_row: int, values: List[Any]) -> Tuple[List[int], List[int]]:
+    """
+    检查一段连续行的messages值（与分析器的解析逻辑一致）
+
+    Returns:
+        Tuple[List[int], List[int]]: (出错的行号, 错误类别编码)
+    """
+    rows: List[int] = []
+    class_codes: List[int] = []
+    strings = []
+
+    for offset, value in enumerate(values):
+        if isinstance(value, str):
+            strings.append((offset, value))
+        elif pd.api.types.is_scalar(value) and not pd.isna(value):
+            rows.append(first_row + offset)
+            class_codes.append(_CLASS_CODES["invalid_type"])
+
+    decoded_values = json_decoder.decode_batch([value for _, value in strings])
+    for (offset, _), decoded in zip(strings, decoded_values):
+        if isinstance(decoded, DecodeFailure):
+            error_class = "json_error" if isinstance(decoded.error, json.JSONDecodeError) else "decode_error"
+        elif not isinstance(decoded, list):
+            error_class = "not_list"
+        else:
+            continue
+        rows.append(first_row + offset)
+        class_codes.append(_CLASS_CODES[error_class])
+
+    # 按行号排序，保证错误索引按文件顺序排列
+    order = sorted(range(len(rows)), key=rows.__getitem__)
+    return [rows[i] for i in order], [class_codes[i] for i in order]
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pandas as pd
+from typing import BinaryIO, Iterator, List, Optional, Any, Sequence, Tuple, Union
+from openpyxl import load_workbook
+
+# 支持流式读取的文件格式（openpyxl不支持旧版.xls）
+STREAMABLE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# pandas默认的缺失值字符串（read_excel的na_values默认值），读取时转为NaN
+_NA_VALUES = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+
+def is_streamable(file_path: str) -> bool:
+    """判断文件是否支持流式读取"""
+    return os.path.splitext(file_path)[1].lower() in STREAMABLE_EXTENSIONS
+
+def get_excel_row_count(file_path: str) -> Optional[int]:
+    """
+    从工作表元数据（dimension）获取数据行数（不含表头），不解析单元格
+
+    Returns:
+        Optional[int]: 数据行数，元数据缺失时返回None
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        max_row = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+
+    if not max_row or max_row <= 1:
+        return None
+    return max_row - 1
+
+def iter_excel_batches(file_path: str, batch_size: int = 5000,
+                       usecols: Optional[Sequence[Any]] = None) -> Iterator[pd.DataFrame]:
+    """
+    以openpyxl只读模式逐行读取第一个工作表，按固定行数产出DataFrame批次
+
+    与pd.read_excel保持一致：首行为表头，空单元格和pandas默认的缺失值字符串（如"NA"、"null"）为NaN，
+    整数值的数字单元格转为int，末尾的空行被忽略（只由缺失值字符串组成的行不算空行）。每个批次的索引为该行在整个文件中的行号（从0开始）。
+    单元格值按原样保留（object类型），不做跨行的类型推断。
+    指定usecols时只保留这些列，空行判断仍按整行进行，行号与完整读取一致。
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # 部分导出工具写入的dimension不准确，按实际内容读取
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        header = _read_header(rows, usecols)
+        if header is None:
+            return
+        yield from _iter_row_batches(rows, *header, batch_size)
+    finally:
+        workbook.close()
+
+def read_excel_sample(source: Union[str, BinaryIO], sample_rows: int = 100,
+                      file_name: Optional[str] = None) -> Tuple[pd.DataFrame, int]:
+    """
+    只读取表头和前sample_rows行数据（用于格式校验），不解析整个工作簿
+
+    总行数取自工作表元数据（dimension）；文件不足sample_rows行时即为实际行数，
+    元数据缺失或不准确时才逐行计数。不支持流式读取的格式（.xls）回退到完整读取。
+
+    Args:
+        source: 文件路径或文件对象
+        sample_rows: 样本行数
+        file_name: 文件名（source为文件对象时用于判断格式）
+
+    Returns:
+        Tuple[pd.DataFrame, int]: (样本数据, 数据总行数)
+    """
+    if not is_streamable(file_name if file_name is not None else source):
+        df = pd.read_excel(source)
+        return df, len(df)
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        max_row = sheet.max_row
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        header = _read_header(rows)
+        if header is None:
+            return pd.DataFrame(), 0
+        batches = _iter_row_batches(rows, *header, sample_rows)
+        sample = next(batches, None)
+        if sample is None:
+            return _make_frame([], header[0], 0), 0
+        if len(sample) < sample_rows:
+            return sample, len(sample)
+        if max_row and max_row - 1 >= len(sample):
+            return sample, max_row - 1
+        return sample, len(sample) + sum(len(batch) for batch in batches)
+    finally:
+        workbook.close()
+
+def _read_header(rows: Iterator[tuple], usecols: Optional[Sequence[Any]] = None) -> Optional[tuple]:
+    """
+    读取表头行
+
+    Returns:
+        Optional[tuple]: (保留的列名, 表头宽度, 保留列的位置)，工作表为空时返回None
+    """
+    header = next(rows, None)
+    if header is None:
+        return None
+    columns = _build_columns(header)
+    width = len(columns)
+    if usecols is not None:
+        positions = [i for i, name in enumerate(columns) if name in usecols]
+        columns = [columns[i] for i in positions]
+    else:
+        positions = None
+    return columns, width, positions
+
+def _iter_row_batches(rows: Iterator[tuple], columns: List[Any], width: int,
+                      positions: Optional[List[int]], batch_size: int) -> Iterator[pd.DataFrame]:
+    """将表头之后的数据行按固定行数组装为DataFrame批次"""
+    empty_row = [np.nan] * len(columns)
+    batch: List[List[Any]] = []
+    start = 0
+    pending_empty = 0  # 连续空行数，只有后面出现数据行时才计入（与pandas一致）
+
+    for values in rows:
+        values = values[:width]
+        # 空行按原始单元格判断，与pandas一致
+        if all(value is None or (isinstance(value, str) and value == "") for value in values):
+            pending_empty += 1
+            continue
+
+        row = [_convert_value(value) for value in values]
+
+        while pending_empty:
+            batch.append(list(empty_row))
+            pending_empty -= 1
+            if len(batch) >= batch_size:
+                yield _make_frame(batch, columns, start)
+                start += len(batch)
+                batch = []
+
+        if len(row) < width:
+            row.extend([np.nan] * (width - len(row)))
+        batch.append(row if positions is None else [row[i] for i in positions])
+        if len(batch) >= batch_size:
+            yield _make_frame(batch, columns, start)
+            start += len(batch)
+            batch = []
+
+    if batch:
+        yield _make_frame(batch, columns, start)
+
+def _convert_value(value: Any) -> Any:
+    """单元格值转换（与pandas的openpyxl读取逻辑一致）"""
+    if value is None or (isinstance(value, str) and value in _NA_VALUES):
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _build_columns(header: tuple) -> List[Any]:
+    """生成列名：空表头命名为 Unnamed: i，重复列名追加 .1/.2 后缀（与pandas一致）"""
+    # 去除表头末尾的空单元格
+    header = list(header)
+    while header and header[-1] is None:
+        header.pop()
+
+    columns: List[Any] = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None:
+            name = f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def _make_frame(batch: List[List[Any]], columns: List[Any], start: int) -> pd.DataFrame:
+    """将一批行构造为DataFrame，索引为全局行号"""
+    return pd.DataFrame(
+        batch,
+        columns=columns,
+        index=pd.RangeIndex(start, start + len(batch)),
+        dtype=object
+    )
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import copy
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.business_clock import BusinessClock
+from app.services.rules import FILTER_RULE_SPECS
+
+# 记录状态
+ROW_EVALUATED = 0  # 非空记录，已计算全部规则特征
+ROW_EMPTY = 1
+ROW_PARSE_ERROR = 2  # 解析消息/用户数据时出错，与规则无关
+
+# 标志位：第0位全部为服务助手消息，第1位含收货地址确认；
+# 第2-5位为各规则检查时出错，第6-9位为规则命中但详情无法保存（按FILTER_RULE_SPECS顺序）
+FLAG_ASSISTANT = 1
+FLAG_ADDRESS = 2
+_RULE_ERROR_SHIFT = 2
+_INVALID_DETAIL_SHIFT = 6
+
+_ALL_HOURS = (1 << 24) - 1
+
+class RowFeatureTable:
+    """
+    每条记录的规则特征表
+
+    分析时对每条非空记录计算全部四条规则的特征（与规则是否启用无关）：
+    早晨消息规则需要判断的本地小时集合（24位掩码）、匹配到的售后人员编码、
+    是否全部为服务助手消息、是否含收货地址确认，以及各规则检查或保存详情时是否出错。
+    每条记录占11字节。切换规则或调整早晨时间窗口后，可直接由特征表重新计算计数器，
+    不需要重新读取源文件。
+    """
+
+    def __init__(self):
+        self.first_row = 0
+        self.statuses = np.empty(0, dtype=np.int8)
+        self.flags = np.empty(0, dtype=np.uint16)
+        self.hour_masks = np.empty(0, dtype=np.uint32)
+        self.staff_codes = np.empty(0, dtype=np.int32)
+        self.staff_names: List[str] = []
+        self._staff_lookup: Dict[str, int] = {}
+        self.filter_rules: Dict = {}  # 分析时使用的过滤规则配置
+
+        self._chunks: List[tuple] = []
+        self._current: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        self._freeze_chunks()
+        return len(self.statuses)
+
+    def begin_frame(self, first_row: int, row_count: int) -> None:
+        """为一批连续行分配特征槽位（默认按解析错误处理，计算特征后更新）"""
+        if not self._chunks and not len(self.statuses):
+            self.first_row = first_row
+        self._current = (
+            first_row,
+            np.full(row_count, ROW_PARSE_ERROR, dtype=np.int8),
+            np.zeros(row_count, dtype=np.uint16),
+            np.zeros(row_count, dtype=np.uint32),
+            np.full(row_count, -1, dtype=np.int32),
+        )
+        self._chunks.append(self._current)
+
+    def set_status(self, row: int, status: int) -> None:
+        first_row, statuses = self._current[0], self._current[1]
+        statuses[row - first_row] = status
+
+    def set_row(self, row: int, hour_mask: int, staff_name: Optional[str],
+                assistant: bool, address: bool, error_rules: int, invalid_rules: int) -> None:
+        """写入逐行计算的特征（error_rules/invalid_rules为检查出错/详情无法保存的规则位掩码）"""
+        first_row, statuses, flags, hour_masks, staff_codes = self._current
+        pos = row - first_row
+        statuses[pos] = ROW_EVALUATED
+        flags[pos] = (FLAG_ASSISTANT if assistant else 0) | (FLAG_ADDRESS if address else 0) \
+            | (error_rules << _RULE_ERROR_SHIFT) | (invalid_rules << _INVALID_DETAIL_SHIFT)
+        hour_masks[pos] = hour_mask
+        staff_codes[pos] = self._intern_staff(staff_name) if staff_name is not None else -1
+
+    def mark_invalid_detail(self, row: int, rule_code: int) -> None:
+        """标记规则在该记录上命中但详情无法保存"""
+        first_row, flags = self._current[0], self._current[2]
+        flags[row - first_row] |= 1 << (rule_code + _INVALID_DETAIL_SHIFT)
+
+    def set_frame(self, positions: np.ndarray, empty: np.ndarray, hour_masks: np.ndarray,
+                  staff_names: np.ndarray, assistant: np.ndarray, address: np.ndarray) -> None:
+        """
+        批量写入当前批次的特征（列式引擎）
+
+        Args:
+            positions: 已计算特征的记录在批次内的位置
+            empty: 空记录在批次内的位置
+            staff_names: 每个位置匹配到的售后人员（未匹配为None）
+        """
+        _, statuses, flags, chunk_hours, staff_codes = self._current
+        statuses[empty] = ROW_EMPTY
+        statuses[positions] = ROW_EVALUATED
+        flags[positions] = (assistant[positions] * FLAG_ASSISTANT) | (address[positions] * FLAG_ADDRESS)
+        chunk_hours[positions] = hour_masks[positions]
+        staff_codes[positions] = [
+            self._intern_staff(name) if name is not None else -1 for name in staff_names[positions]
+        ]
+
+    def extend(self, other: 'RowFeatureTable') -> None:
+        """追加另一个特征表（如分片结果），重新映射售后人员编码"""
+        other._freeze_chunks()
+        if not len(other.statuses):
+            return
+        staff_map = np.array([self._intern_staff(name) for name in other.staff_names] + [-1], dtype=np.int32)
+        self.begin_frame(other.first_row, len(other.statuses))
+        _, statuses, flags, hour_masks, staff_codes = self._current
+        statuses[:] = other.statuses
+        flags[:] = other.flags
+        hour_masks[:] = other.hour_masks
+        staff_codes[:] = staff_map[other.staff_codes]
+
+    def freeze(self, filter_rules: Dict) -> None:
+        """分析结束时合并各批次，并保存分析使用的过滤规则配置"""
+        self._freeze_chunks()
+        self.filter_rules = copy.deepcopy(filter_rules)
+
+    def nbytes(self) -> int:
+        """估算占用的内存字节数"""
+        self._freeze_chunks()
+        return (self.statuses.nbytes + self.flags.nbytes + self.hour_masks.nbytes + self.staff_codes.nbytes
+                + sum(len(name.encode('utf-8')) + 64 for name in self.staff_names))
+
+    def evaluate(self, filter_rules: Dict) -> Dict[str, int]:
+        """
+        按给定的过滤规则配置重新计算计数器（规则优先级和首个命中归因与分析时一致）
+
+        规则检查出错的记录计为解析错误；命中但详情无法保存的记录与分析时一样，
+        同时计入规则计数和解析错误。
+
+        Returns:
+            Dict[str, int]: 与分析计数器相同的键
+        """
+        self._freeze_chunks()
+        statuses = self.statuses
+        counters = {
+            'total_records': len(statuses),
+            'empty_records_count': int(np.count_nonzero(statuses == ROW_EMPTY)),
+            'parse_error_count': int(np.count_nonzero(statuses == ROW_PARSE_ERROR)),
+        }
+
+        decided = statuses != ROW_EVALUATED
+        for code, (rule_key, _, _, counter_key, _) in enumerate(FILTER_RULE_SPECS):
+            counters[counter_key] = 0
+            rule_config = filter_rules.get(rule_key, {})
+            if not rule_config.get('enabled', False):
+                continue
+            error = ((self.flags >> (code + _RULE_ERROR_SHIFT)) & 1).astype(bool) & ~decided
+            hit = self._rule_hits(rule_key, rule_config) & ~decided & ~error
+            invalid = ((self.flags >> (code + _INVALID_DETAIL_SHIFT)) & 1).astype(bool) & hit
+            counters['parse_error_count'] += int(np.count_nonzero(error)) + int(np.count_nonzero(invalid))
+            counters[counter_key] = int(np.count_nonzero(hit))
+            decided |= error | hit
+
+        counters['filtered_records'] = int(np.count_nonzero(decided))
+        return counters
+
+    def rule_match_codes(self, filter_rules: Dict) -> np.ndarray:
+        """
+        每条记录的规则匹配位集
+
+        第k位表示FILTER_RULE_SPECS中第k条规则匹配该记录（不考虑优先级和启用状态，
+        早晨消息规则使用filter_rules中的时间窗口），检查出错的规则不算匹配。
+        """
+        self._freeze_chunks()
+        evaluated = self.statuses == ROW_EVALUATED
+        codes = np.zeros(len(self.statuses), dtype=np.uint8)
+        for code, spec in enumerate(FILTER_RULE_SPECS):
+            error = ((self.flags >> (code + _RULE_ERROR_SHIFT)) & 1).astype(bool)
+            match = self._rule_hits(spec[0], filter_rules.get(spec[0], {})) & evaluated & ~error
+            codes |= match.astype(np.uint8) << code
+        return codes
+
+    def rule_overlap(self, filter_rules: Dict) -> Dict[str, Any]:
+        """
+        规则重叠统计：按位集取值计数后得到任意规则组合的交集
+
+        Returns:
+            Dict[str, Any]: matrix为两两交集（对角线为单条规则的匹配数），
+                all_rules为全部规则的交集，exclusive_counts为只被该规则匹配的记录数，
+                any_rule为至少被一条规则匹配的记录数
+        """
+        rule_keys = [spec[0] for spec in FILTER_RULE_SPECS]
+        regions = np.bincount(self.rule_match_codes(filter_rules), minlength=1 << len(rule_keys))
+        combos = np.arange(len(regions))
+
+        def count(mask: int) -> int:
+            return int(regions[(combos & mask) == mask].sum())
+
+        return {
+            "matrix": {
+                rule_a: {rule_b: count((1 << i) | (1 << j)) for j, rule_b in enumerate(rule_keys)}
+                for i, rule_a in enumerate(rule_keys)
+            },
+            "all_rules": count((1 << len(rule_keys)) - 1),
+            "exclusive_counts": {rule_key: int(regions[1 << i]) for i, rule_key in enumerate(rule_keys)},
+            "any_rule": int(regions[1:].sum())
+        }
+
+    def _rule_hits(self, rule_key: str, rule_config: Dict) -> np.ndarray:
+        """各记录在规则上是否命中"""
+        if rule_key == "early_morning_filter":
+            clock = BusinessClock("", rule_config.get('start_hour', 0), rule_config.get('end_hour', 8))
+            window = sum(1 << hour for hour in range(24) if clock.in_window(hour)) & _ALL_HOURS
+            return (self.hour_masks & np.uint32(window)) != 0
+        if rule_key == "staff_filter":
+            return self.staff_codes >= 0
+        if rule_key == "service_assistant_filter":
+            return (self.flags & FLAG_ASSISTANT) != 0
+        if rule_key == "address_confirm_filter":
+            return (self.flags & FLAG_ADDRESS) != 0
+        return np.zeros(len(self.statuses), dtype=bool)
+
+    def _intern_staff(self, name: str) -> int:
+        code = self._staff_lookup.get(name)
+        if code is None:
+            code = self._staff_lookup[name] = len(self.staff_names)
+            self.staff_names.append(name)
+        return code
+
+    def _freeze_chunks(self) -> None:
+        """将各批次的特征合并为连续数组（批次按行号顺序追加）"""
+        if not self._chunks:
+            return
+        parts = [(self.statuses, self.flags, self.hour_masks, self.staff_codes)]
+        parts += [chunk[1:] for chunk in self._chunks]
+        self.statuses, self.flags, self.hour_masks, self.staff_codes = (
+            np.concatenate(columns) for columns in zip(*parts)
+        )
+        self._chunks = []
+        self._current = None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import pandas as pd
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+class FrameCache:
+    """
+    已解析数据的内存缓存
+
+    上传后解析得到的DataFrame（列式缓存可用时从Parquet读取）按file_id缓存，
+    分析任务（不开启进程隔离时）和过滤详情的原始数据加载直接使用，不再重新读取文件。
+    按最近最少使用（LRU）顺序淘汰，缓存数据的总内存不超过预算；单个超出预算的数据不缓存。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._frames: 'OrderedDict[str, Tuple[pd.DataFrame, int]]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, file_id: str, df: pd.DataFrame) -> bool:
+        """
+        缓存数据
+
+        Returns:
+            bool: 是否已缓存（超出预算时返回False）
+        """
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self._remove(file_id)
+            if size > self.max_bytes:
+                return False
+            self._frames[file_id] = (df, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._frames))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def get(self, file_id: str) -> Optional[pd.DataFrame]:
+        """获取缓存的数据，未命中返回None"""
+        with self._lock:
+            entry = self._frames.get(file_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(file_id)
+            self.hits += 1
+            return entry[0]
+
+    def discard(self, file_id: str) -> None:
+        """移除缓存的数据（文件删除时调用）"""
+        with self._lock:
+            self._remove(file_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._frames),
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_size_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _remove(self, file_id: str) -> None:
+        entry = self._frames.pop(file_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+# 全局数据缓存实例
+frame_cache = FrameCache(settings.FRAME_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件和分析任务的持久化存储（DATABASE_URL指定的SQLite数据库）
+
+上传文件信息和任务信息保存在带索引的表中，服务重启后仍可查询；
+全文件校验的错误索引按文件ID保存，重启后分析仍可跳过已知无效的记录；
+分析结果（含过滤记录存储和特征表）压缩后单独保存，查询任务时才按需读取。
+共享同一结果的任务（命中结果缓存或附加到进行中的任务）引用同一份结果数据。
+内存中的uploaded_files和analysis_tasks只作为进行中任务和最近访问记录的缓存。
+"""
+
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploaded_files (
+    file_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    upload_time TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    safe_filename TEXT,
+    content_hash TEXT,
+    validation_info TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_upload_time ON uploaded_files (upload_time);
+
+CREATE TABLE IF NOT EXISTS analysis_tasks (
+    task_id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_time TEXT NOT NULL,
+    started_time TEXT,
+    completed_time TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    status_message TEXT,
+    error_message TEXT,
+    filter_rules TEXT,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    coalesced_with TEXT,
+    priority TEXT,
+    partial_result TEXT,
+    result_id TEXT,
+    filter_rate REAL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_created_time ON analysis_tasks (created_time);
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_status ON analysis_tasks (status);
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_file_id ON analysis_tasks (file_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_result_id ON analysis_tasks (result_id);
+
+CREATE TABLE IF NOT EXISTS validation_indexes (
+    file_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total_rows INTEGER,
+    checked_rows INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    started_time TEXT,
+    completed_time TEXT,
+    rows BLOB,
+    column_codes BLOB,
+    class_codes BLOB
+);
+
+CREATE TABLE IF NOT EXISTS analysis_results (
+    result_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_time TEXT NOT NULL
+);
+"""
+
+_FILE_COLUMNS = ("file_id", "filename", "file_size", "upload_time", "status", "file_path",
+                 "safe_filename", "content_hash", "validation_info")
+_TASK_COLUMNS = ("task_id", "file_id", "filename", "status", "created_time", "started_time", "completed_time",
+                 "progress", "status_message", "error_message", "filter_rules", "cache_hit", "coalesced_with",
+                 "priority", "partial_result", "result_id", "filter_rate")
+_VALIDATION_COLUMNS = ("file_id", "status", "total_rows", "checked_rows", "error_message", "started_time",
+                       "completed_time", "rows", "column_codes", "class_codes")
+_JSON_COLUMNS = ("validation_info", "filter_rules", "partial_result")
+_TIME_COLUMNS = ("upload_time", "created_time", "started_time", "completed_time")
+
+# 结果压缩级别（过滤记录以重复文本为主，低级别已有较好的压缩率且速度快）
+_COMPRESSION_LEVEL = 1
+
+# 进行中的任务状态
+UNFINISHED_STATUSES = ("pending", "processing")
+
+class MetadataStore:
+    """SQLite元数据存储（每次操作使用独立连接，可在多线程和多进程中使用）"""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        self.path = _sqlite_path(database_url)
+        self.persistent = self.path is not None
+        if not self.persistent:
+            # 不支持的数据库：使用进程内的共享内存数据库，重启后数据丢失
+            logger.warning("DATABASE_URL不是SQLite数据库，文件和任务信息只保存在内存中: %s", database_url)
+            self.path = "file:chat_analyzer_metadata?mode=memory&cache=shared"
+        self._keeper: Optional[sqlite3.Connection] = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self._ensure_schema()
+        conn = self._open()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, uri=not self.persistent)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._open()
+            if self.persistent:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if self.persistent:
+                conn.close()
+            else:
+                # 共享内存数据库在最后一个连接关闭时释放
+                self._keeper = conn
+            self._initialized = True
+
+    # ---- 上传文件 ----
+
+    def save_file(self, file_info: Dict[str, Any]) -> None:
+        """保存上传文件信息"""
+        self._upsert("uploaded_files", "file_id", _FILE_COLUMNS, file_info)
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """获取上传文件信息"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM uploaded_files WHERE file_id = ?", (file_id,)).fetchone()
+        return _decode_row(row) if row else None
+
+    def list_files(self) -> List[Dict[str, Any]]:
+        """按上传时间顺序获取全部文件信息"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM uploaded_files ORDER BY upload_time").fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def delete_file(self, file_id: str) -> None:
+        """删除上传文件信息和校验索引"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM uploaded_files WHERE file_id = ?", (file_id,))
+            conn.execute("DELETE FROM validation_indexes WHERE file_id = ?", (file_id,))
+
+    # ---- 全文件校验索引 ----
+
+    def save_validation_index(self, index_info: Dict[str, Any]) -> None:
+        """保存文件的校验状态和错误索引（rows/column_codes/class_codes为数组的字节内容）"""
+        self._upsert("validation_indexes", "file_id", _VALIDATION_COLUMNS, index_info)
+
+    def get_validation_index(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """获取文件的校验状态和错误索引"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM validation_indexes WHERE file_id = ?", (file_id,)).fetchone()
+        return _decode_row(row) if row else None
+
+    # ---- 分析任务 ----
+
+    def save_task(self, task_info: Dict[str, Any]) -> None:
+        """保存任务信息（分析结果需先通过save_result保存）"""
+        result = task_info.get("result")
+        row = dict(task_info)
+        row["result_id"] = getattr(result, "_result_id", None)
+        row["filter_rate"] = getattr(result, "filter_rate", None)
+        row["cache_hit"] = int(bool(task_info.get("cache_hit")))
+        self._upsert("analysis_tasks", "task_id", _TASK_COLUMNS, row)
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务信息（不含分析结果，result_id为结果ID）"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM analysis_tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return _decode_row(row) if row else None
+
+    def list_tasks(self) -> List[Dict[str, Any]]:
+        """按创建时间倒序获取全部任务信息（不含分析结果）"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM analysis_tasks ORDER BY created_time DESC").fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def delete_task(self, task_id: str) -> None:
+        """删除任务信息，结果不再被引用时一并删除"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT result_id FROM analysis_tasks WHERE task_id = ?", (task_id,)).fetchone()
+            conn.execute("DELETE FROM analysis_tasks WHERE task_id = ?", (task_id,))
+            if row is not None and row["result_id"]:
+                conn.execute(
+                    "DELETE FROM analysis_results WHERE result_id = ? AND NOT EXISTS "
+                    "(SELECT 1 FROM analysis_tasks WHERE result_id = ?)",
+                    (row["result_id"], row["result_id"])
+                )
+
+    def get_task_stats(self) -> Dict[str, Any]:
+        """各状态的任务数和已完成任务的平均过滤率"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM analysis_tasks GROUP BY status").fetchall())
+            average = conn.execute(
+                "SELECT AVG(filter_rate) FROM analysis_tasks WHERE status = 'completed' AND filter_rate IS NOT NULL"
+            ).fetchone()[0]
+        return {"status_counts": counts, "average_filter_rate": average or 0.0}
+
+    def interrupt_unfinished_tasks(self, message: str) -> int:
+        """将进行中的任务标记为失败（服务重启后内存中的任务无法继续），返回任务数"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE analysis_tasks SET status = 'failed', completed_time = ?, error_message = ?, "
+                f"status_message = ? WHERE status IN ({','.join('?' * len(UNFINISHED_STATUSES))})",
+                (datetime.now().isoformat(), message, f"分析失败: {message}", *UNFINISHED_STATUSES)
+            ).rowcount
+
+    # ---- 分析结果 ----
+
+    def save_result(self, result_id: str, result: Any) -> str:
+        """
+        压缩保存分析结果（行访问器不保存，读取时重新创建）
+
+        Returns:
+            str: 结果ID
+        """
+        stored = result.model_copy()
+        stored._row_source = None
+        stored._result_id = result_id
+        data = zlib.compress(pickle.dumps(stored, protocol=pickle.HIGHEST_PROTOCOL), _COMPRESSION_LEVEL)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_results (result_id, data, size, created_time) VALUES (?, ?, ?, ?)",
+                (result_id, data, len(data), datetime.now().isoformat())
+            )
+        return result_id
+
+    def load_result(self, result_id: str) -> Optional[Any]:
+        """读取分析结果"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM analysis_results WHERE result_id = ?", (result_id,)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(zlib.decompress(row["data"]))
+
+    def has_result(self, result_id: str) -> bool:
+        """结果是否已保存"""
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM analysis_results WHERE result_id = ?", (result_id,)).fetchone() is not None
+
+    def get_storage_stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        with self._connect() as conn:
+            files = conn.execute("SELECT COUNT(*) FROM uploaded_files").fetchone()[0]
+            tasks = conn.execute("SELECT COUNT(*) FROM analysis_tasks").fetchone()[0]
+            results, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_results").fetchone()
+        return {
+            "persistent": self.persistent,
+            "files": files,
+            "tasks": tasks,
+            "results": results,
+            "results_size_mb": round(size / (1024 * 1024), 2)
+        }
+
+    def _upsert(self, table: str, key: str, columns: tuple, values: Dict[str, Any]) -> None:
+        row = [_encode_value(column, values.get(column)) for column in columns]
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in columns if column != key)
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT({key}) DO UPDATE SET {assignments}",
+                row
+            )
+
+def _sqlite_path(database_url: str) -> Optional[str]:
+    """由sqlite:///path形式的URL得到数据库文件路径，其他数据库返回None"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix) or database_url == prefix + ":memory:":
+        return None
+    return database_url[len(prefix):]
+
+def _encode_value(column: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if column in _JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):  # 枚举
+        return value.value
+    return value
+
+def _decode_row(row: sqlite3.Row) -> Dict[str, Any]:
+    values = dict(row)
+    for column in _JSON_COLUMNS:
+        if values.get(column) is not None:
+            values[column] = json.loads(values[column])
+    for column in _TIME_COLUMNS:
+        if values.get(column):
+            values[column] = datetime.fromisoformat(values[column])
+    if "cache_hit" in values:
+        values["cache_hit"] = bool(values["cache_hit"])
+    return values
+
+# 全局元数据存储实例
+metadata_store = MetadataStore(settings.DATABASE_URL)
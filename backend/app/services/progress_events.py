@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务进度推送
+
+分析线程（调度执行线程、队列跟踪线程）在任务进度或状态变化时通知ProgressHub，
+订阅者（SSE和WebSocket连接，运行在事件循环中）只收到"哪些任务有变化"的通知，
+发送时再读取任务的最新状态：两次发送之间的多次进度更新合并为一次，
+每个连接的推送频率不超过PROGRESS_STREAM_INTERVAL。
+"""
+
+import asyncio
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+class Subscription:
+    """一个连接对若干任务的订阅（在事件循环中使用）"""
+
+    def __init__(self, hub: 'ProgressHub', loop: asyncio.AbstractEventLoop):
+        self._hub = hub
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._changed: Set[str] = set()
+        self.task_ids: Set[str] = set()
+
+    def add(self, task_ids: Iterable[str]) -> None:
+        """订阅任务（新订阅的任务视为有变化，下次发送当前状态）"""
+        task_ids = set(task_ids) - self.task_ids
+        self.task_ids |= task_ids
+        self._hub._register(self, task_ids)
+        self._changed |= task_ids
+        if task_ids:
+            self._event.set()
+
+    def remove(self, task_ids: Iterable[str]) -> None:
+        """取消订阅任务"""
+        task_ids = set(task_ids) & self.task_ids
+        self.task_ids -= task_ids
+        self._changed -= task_ids
+        self._hub._unregister(self, task_ids)
+
+    def close(self) -> None:
+        """取消全部订阅"""
+        self.remove(list(self.task_ids))
+
+    async def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        等待订阅的任务发生变化
+
+        Returns:
+            Set[str]: 有变化的任务ID，超时时为空集合
+        """
+        if not self._changed:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._event.clear()
+        changed, self._changed = self._changed & self.task_ids, set()
+        return changed
+
+    def _notify(self, task_id: Optional[str]) -> None:
+        """由任意线程调用：标记任务有变化（task_id为None表示全部订阅的任务）"""
+        try:
+            self._loop.call_soon_threadsafe(self._mark, task_id)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _mark(self, task_id: Optional[str]) -> None:
+        if task_id is None:
+            self._changed |= self.task_ids
+        elif task_id in self.task_ids:
+            self._changed.add(task_id)
+        if self._changed:
+            self._event.set()
+
+class ProgressHub:
+    """任务进度的订阅和通知（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._all: Set[Subscription] = set()
+
+    def subscribe(self, task_ids: Iterable[str] = ()) -> Subscription:
+        """在当前事件循环中创建订阅"""
+        subscription = Subscription(self, asyncio.get_running_loop())
+        with self._lock:
+            self._all.add(subscription)
+        subscription.add(task_ids)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """关闭订阅"""
+        subscription.close()
+        with self._lock:
+            self._all.discard(subscription)
+
+    def publish(self, task_id: str) -> None:
+        """通知任务的进度或状态有变化"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(task_id, ()))
+        for subscription in subscriptions:
+            subscription._notify(task_id)
+
+    def publish_all(self) -> None:
+        """通知全部订阅（有任务开始或结束时，排队中任务的位置和预计时间随之变化）"""
+        with self._lock:
+            subscriptions = list(self._all)
+        for subscription in subscriptions:
+            subscription._notify(None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取订阅统计"""
+        with self._lock:
+            return {
+                "connections": len(self._all),
+                "subscribed_tasks": len(self._subscriptions)
+            }
+
+    def _register(self, subscription: Subscription, task_ids: Set[str]) -> None:
+        with self._lock:
+            for task_id in task_ids:
+                self._subscriptions.setdefault(task_id, set()).add(subscription)
+
+    def _unregister(self, subscription: Subscription, task_ids: Set[str]) -> None:
+        with self._lock:
+            for task_id in task_ids:
+                subscriptions = self._subscriptions.get(task_id)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[task_id]
+
+# 全局进度推送实例
+progress_hub = ProgressHub()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.schemas import FilteredRecord
+
+# 各详情字段的存储方式
+_TEXT_FIELDS = ('address_content', 'error_message', 'service_message')
+_STAFF_FIELD = 'staff_name'
+_TIMESTAMP_FIELD = 'timestamp'
+
+# 时区偏移的特殊取值：无时间戳 / 不带时区的时间
+_NO_TIMESTAMP = -2 ** 63
+_NAIVE = -2 ** 63 + 1
+
+_EMPTY_POSITIONS = np.empty(0, dtype=np.int64)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+class FilteredRecordStore:
+    """
+    被过滤记录的紧凑存储
+
+    每条记录只占用几个定长数组槽位：行号、记录类别编码（过滤类型、原因和详情字段）、
+    售后人员编码、时间戳（本地时间的微秒数及时区偏移）和文本区结束偏移。
+    售后人员姓名去重存储；地址、服务助手消息、错误信息依次写入同一个文本区。
+    FilteredRecord模型只在API返回时按需创建。
+    分析结束时（freeze）建立按过滤类型分组的位置索引和行号到位置的哈希索引，
+    分页查询和按记录ID查找不再扫描全部记录。
+    """
+
+    def __init__(self, record_date: str):
+        self.record_date = record_date  # 记录ID中的日期
+        self.record_indexes = array('q')
+        self.kind_codes = array('h')
+        self.staff_codes = array('i')
+        self.timestamps = array('q')
+        self.utc_offsets = array('q')
+        self.text_ends = array('q')
+
+        # 记录类别: (过滤类型, 过滤原因, 详情字段)
+        self.kinds: List[Tuple[str, str, Optional[str]]] = []
+        self._kind_lookup: Dict[Tuple[str, str, Optional[str]], int] = {}
+        self.staff_names: List[str] = []
+        self._staff_lookup: Dict[str, int] = {}
+
+        self._text_parts: List[str] = []
+        self._text_length = 0
+        self._arena = ""
+
+        # 查询索引（freeze时建立，追加记录后失效）
+        self._type_index: Optional[Dict[str, np.ndarray]] = None
+        self._position_by_index: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.record_indexes)
+
+    def append(self, filter_type: str, filter_reason: str, record_index: int, **kwargs) -> None:
+        """
+        添加一条被过滤记录
+
+        详情值类型不符合FilteredRecord定义时先交给模型校验，
+        校验失败抛出与直接创建模型相同的异常，校验通过则保存转换后的值。
+        """
+        detail_field, value = next(iter(kwargs.items())) if kwargs else (None, None)
+        if value is not None and not _is_plain_value(detail_field, value):
+            record = FilteredRecord(
+                record_id=self.record_id(record_index),
+                filter_type=filter_type,
+                filter_reason=filter_reason,
+                record_index=record_index,
+                **kwargs
+            )
+            value = getattr(record, detail_field)
+        if value is None:
+            detail_field = None
+
+        kind_code = self._intern_kind((filter_type, filter_reason, detail_field))
+        staff_code = -1
+        timestamp, utc_offset = 0, _NO_TIMESTAMP
+        if detail_field == _STAFF_FIELD:
+            staff_code = self._intern_staff(value)
+        elif detail_field == _TIMESTAMP_FIELD:
+            timestamp, utc_offset = _encode_timestamp(value)
+        elif detail_field is not None:
+            self._text_parts.append(value)
+            self._text_length += len(value)
+
+        self._drop_indexes()
+        self.record_indexes.append(record_index)
+        self.kind_codes.append(kind_code)
+        self.staff_codes.append(staff_code)
+        self.timestamps.append(timestamp)
+        self.utc_offsets.append(utc_offset)
+        self.text_ends.append(self._text_length)
+
+    def accepts(self, detail_field: str, value: Any) -> bool:
+        """详情值能否保存（类型不符合FilteredRecord定义且无法转换时返回False）"""
+        if value is None or _is_plain_value(detail_field, value):
+            return True
+        try:
+            FilteredRecord(record_id="", filter_type="", filter_reason="", record_index=0,
+                           **{detail_field: value})
+            return True
+        except Exception:
+            return False
+
+    def extend(self, other: 'FilteredRecordStore') -> None:
+        """
+        追加另一个存储（如分片结果）的全部记录，重新映射类别和人员编码
+
+        文本只追加到待合并列表，freeze时一次性合并，合并N个分片的代价与文本总量成正比。
+        """
+        self._drop_indexes()
+
+        kind_map = np.array([self._intern_kind(kind) for kind in other.kinds] or [0], dtype=np.int16)
+        staff_map = np.array([self._intern_staff(name) for name in other.staff_names] + [-1], dtype=np.int32)
+
+        self.record_indexes.extend(other.record_indexes)
+        self.kind_codes.frombytes(kind_map[np.frombuffer(other.kind_codes, dtype=np.int16)].tobytes())
+        # 编码-1映射到表末尾的-1
+        self.staff_codes.frombytes(staff_map[np.frombuffer(other.staff_codes, dtype=np.int32)].tobytes())
+        self.timestamps.extend(other.timestamps)
+        self.utc_offsets.extend(other.utc_offsets)
+        self.text_ends.frombytes((np.frombuffer(other.text_ends, dtype=np.int64) + self._text_length).tobytes())
+
+        if other._arena:
+            self._text_parts.append(other._arena)
+        self._text_parts.extend(other._text_parts)
+        self._text_length += other._text_length
+
+    def freeze(self) -> None:
+        """分析结束后合并文本区，释放各段文本对象，并建立查询索引"""
+        self._freeze_text()
+        self._build_indexes()
+
+    def nbytes(self) -> int:
+        """估算占用的内存字节数（定长数组、文本区和去重表）"""
+        self._freeze_text()
+        arrays = (self.record_indexes, self.kind_codes, self.staff_codes,
+                  self.timestamps, self.utc_offsets, self.text_ends)
+        size = sum(len(values) * values.itemsize for values in arrays)
+        size += len(self._arena.encode('utf-8'))
+        size += sum(len(name.encode('utf-8')) + 64 for name in self.staff_names)
+        return size + len(self.kinds) * 128
+
+    def record_id(self, record_index: int) -> str:
+        """生成记录ID"""
+        return f"CHT_{self.record_date}_{record_index:06d}"
+
+    def filter_type_at(self, position: int) -> str:
+        """获取指定位置记录的过滤类型"""
+        return self.kinds[self.kind_codes[position]][0]
+
+    def positions_of_type(self, filter_type: str) -> np.ndarray:
+        """返回指定过滤类型的全部记录位置（按原始行顺序）"""
+        if self._type_index is None:
+            self._build_indexes()
+        return self._type_index.get(filter_type, _EMPTY_POSITIONS)
+
+    def position_of(self, record_id: str) -> Optional[int]:
+        """按记录ID查找记录位置，不存在返回None"""
+        prefix = f"CHT_{self.record_date}_"
+        if not record_id.startswith(prefix) or not record_id[len(prefix):].isdigit():
+            return None
+        record_index = int(record_id[len(prefix):])
+        if self.record_id(record_index) != record_id:
+            return None
+        if self._position_by_index is None:
+            self._build_indexes()
+        return self._position_by_index.get(record_index)
+
+    def get(self, position: int) -> FilteredRecord:
+        """创建指定位置记录的FilteredRecord模型"""
+        self._freeze_text()
+        filter_type, filter_reason, detail_field = self.kinds[self.kind_codes[position]]
+        record_index = self.record_indexes[position]
+
+        details: Dict[str, Any] = {}
+        if detail_field == _STAFF_FIELD:
+            details[detail_field] = self.staff_names[self.staff_codes[position]]
+        elif detail_field == _TIMESTAMP_FIELD:
+            details[detail_field] = _decode_timestamp(self.timestamps[position], self.utc_offsets[position])
+        elif detail_field is not None:
+            start = self.text_ends[position - 1] if position else 0
+            details[detail_field] = self._arena[start:self.text_ends[position]]
+
+        return FilteredRecord(
+            record_id=self.record_id(record_index),
+            filter_type=filter_type,
+            filter_reason=filter_reason,
+            record_index=record_index,
+            **details
+        )
+
+    def records(self, positions: Sequence[int]) -> List[FilteredRecord]:
+        """批量创建FilteredRecord模型"""
+        return [self.get(int(position)) for position in positions]
+
+    def __iter__(self) -> Iterator[FilteredRecord]:
+        for position in range(len(self)):
+            yield self.get(position)
+
+    def _intern_kind(self, kind: Tuple[str, str, Optional[str]]) -> int:
+        code = self._kind_lookup.get(kind)
+        if code is None:
+            code = self._kind_lookup[kind] = len(self.kinds)
+            self.kinds.append(kind)
+        return code
+
+    def _intern_staff(self, name: str) -> int:
+        code = self._staff_lookup.get(name)
+        if code is None:
+            code = self._staff_lookup[name] = len(self.staff_names)
+            self.staff_names.append(name)
+        return code
+
+    def _build_indexes(self) -> None:
+        """建立过滤类型分组索引和行号哈希索引"""
+        kind_codes = np.frombuffer(self.kind_codes, dtype=np.int16)
+        # 稳定排序保证同一类型内仍按原始行顺序
+        order = np.argsort(kind_codes, kind='stable')
+        bounds = np.searchsorted(kind_codes[order], np.arange(len(self.kinds) + 1))
+
+        type_positions: Dict[str, List[np.ndarray]] = {}
+        for code, (filter_type, _, _) in enumerate(self.kinds):
+            type_positions.setdefault(filter_type, []).append(order[bounds[code]:bounds[code + 1]])
+
+        self._type_index = {
+            filter_type: parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+            for filter_type, parts in type_positions.items()
+        }
+        # 同一行号只会被记录一次，保留第一条以与顺序查找一致
+        position_by_index: Dict[int, int] = {}
+        for position, record_index in enumerate(self.record_indexes):
+            position_by_index.setdefault(record_index, position)
+        self._position_by_index = position_by_index
+
+    def _drop_indexes(self) -> None:
+        self._type_index = None
+        self._position_by_index = None
+
+    def _freeze_text(self) -> None:
+        if self._text_parts:
+            self._arena = self._arena + "".join(self._text_parts)
+            self._text_parts = []
+
+def _is_plain_value(detail_field: str, value: Any) -> bool:
+    """详情值是否已是模型字段的目标类型（无需校验转换）"""
+    if detail_field == _TIMESTAMP_FIELD:
+        return isinstance(value, datetime.datetime)
+    if detail_field == _STAFF_FIELD or detail_field in _TEXT_FIELDS:
+        return type(value) is str
+    return False
+
+def _encode_timestamp(value: datetime.datetime) -> Tuple[int, int]:
+    """时间编码为(本地时间的微秒数, 时区偏移微秒数)"""
+    offset = value.utcoffset()
+    local = value.replace(tzinfo=None)
+    micros = (local - _EPOCH) // _MICROSECOND
+    if offset is None:
+        return micros, _NAIVE
+    return micros, offset // _MICROSECOND
+
+def _decode_timestamp(micros: int, utc_offset: int) -> Optional[datetime.datetime]:
+    """由编码还原时间"""
+    if utc_offset == _NO_TIMESTAMP:
+        return None
+    value = _EPOCH + datetime.timedelta(microseconds=micros)
+    if utc_offset == _NAIVE:
+        return value
+    return value.replace(tzinfo=datetime.timezone(datetime.timedelta(microseconds=utc_offset)))
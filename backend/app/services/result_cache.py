@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分析结果缓存
+
+以(文件内容SHA-256, 生效的过滤规则配置, 售后名单版本)为键缓存分析结果，
+重复分析同一份导出文件时直接返回缓存结果。
+同一键的分析正在进行时，新的请求附加到进行中的任务，不再重复分析；
+执行的任务被取消或超时时，由第一个附加的任务接替执行（handoff）。
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+def make_result_key(content_hash: str, filter_rules: Dict, staff_list_version: str) -> str:
+    """生成结果缓存键（同时包含影响过滤结果的其他配置）"""
+    config = {
+        "filter_rules": filter_rules,
+        "business_timezone": settings.BUSINESS_TIMEZONE,
+        "staff_nick_substrings": settings.STAFF_NICK_SUBSTRINGS,
+        "staff_nick_prefixes": settings.STAFF_NICK_PREFIXES
+    }
+    config_hash = hashlib.sha256(
+        json.dumps(config, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+    return f"{content_hash}:{config_hash}:{staff_list_version}"
+
+class ResultCache:
+    """
+    分析结果的内存缓存
+
+    按最近最少使用（LRU）顺序淘汰，缓存结果的总大小（主要是过滤记录存储和特征表）不超过预算。
+    同时登记进行中的分析：键 -> 首个任务ID及附加的任务ID列表。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._results: 'OrderedDict[str, Tuple[Any, int]]' = OrderedDict()
+        self._total_bytes = 0
+        self._in_flight: Dict[str, Tuple[str, List[str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def lookup(self, key: str, task_id: str) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        查找缓存结果或进行中的任务
+
+        未命中且没有进行中的任务时，登记task_id为该键的执行任务。
+
+        Returns:
+            Tuple[Optional[Any], Optional[str]]: (缓存的结果, 进行中任务的ID)，都为None时需要执行分析
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return entry[0], None
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                in_flight[1].append(task_id)
+                self.coalesced += 1
+                return None, in_flight[0]
+
+            self.misses += 1
+            self._in_flight[key] = (task_id, [])
+            return None, None
+
+    def finish(self, key: str, result: Optional[Any] = None) -> List[str]:
+        """
+        分析结束：成功时缓存结果，并解除进行中登记
+
+        Returns:
+            List[str]: 附加到该任务的任务ID
+        """
+        with self._lock:
+            _, followers = self._in_flight.pop(key, (None, []))
+            if result is not None:
+                self._put(key, result)
+            return followers
+
+    def handoff(self, key: str) -> Optional[str]:
+        """
+        执行的任务未得到结果就结束：第一个附加的任务成为新的执行任务，其余任务改为附加到它
+
+        Returns:
+            Optional[str]: 新的执行任务ID，没有附加的任务时解除进行中登记并返回None
+        """
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                return None
+            followers = in_flight[1]
+            if not followers:
+                del self._in_flight[key]
+                return None
+            leader = followers.pop(0)
+            self._in_flight[key] = (leader, followers)
+            return leader
+
+    def detach(self, key: str, task_id: str) -> None:
+        """附加的任务被取消：不再随执行的任务结束而更新"""
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and task_id in in_flight[1]:
+                in_flight[1].remove(task_id)
+
+    def followers_of(self, key: str) -> List[str]:
+        """获取附加到进行中任务的任务ID"""
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            return list(in_flight[1]) if in_flight else []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._results),
+                "in_flight": len(self._in_flight),
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_size_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups * 100, 2) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _put(self, key: str, result: Any) -> None:
+        size = _estimate_size(result)
+        self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._results[key] = (result, size)
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes:
+            oldest = next(iter(self._results))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._results.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+def _estimate_size(result: Any) -> int:
+    """估算结果占用的内存（过滤记录存储 + 特征表 + 汇总字段）"""
+    size = 4096
+    for attr in ("_record_store", "_feature_table"):
+        part = getattr(result, attr, None)
+        if part is not None:
+            size += part.nbytes()
+    return size
+
+# 全局结果缓存实例
+result_cache = ResultCache(settings.RESULT_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+from app.services import columnar_cache
+from app.services.frame_cache import frame_cache
+
+class RowSource:
+    """
+    分析源文件的行访问器
+
+    分析时只读取过滤规则需要的列，被过滤记录只保存行号；
+    查看过滤详情时才按需加载所需的行并生成原始数据字典（raw_data）。
+    行访问器本身不保留数据：优先使用内存中缓存的解析数据（有界LRU，可被淘汰），
+    其次只读取列式缓存中包含所需行的行组，都没有时解析Excel并放入解析数据缓存。
+    """
+
+    def __init__(self, file_path: str, file_id: Optional[str] = None):
+        self.file_path = file_path
+        self.file_id = file_id  # 用于查找内存中缓存的解析数据
+
+    def _load_rows(self, record_indexes: List[int]) -> pd.DataFrame:
+        """按顺序读取指定行的完整数据"""
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"源文件 {self.file_path} 不存在")
+        df = frame_cache.get(self.file_id) if self.file_id else None
+        if df is None:
+            cache_path = columnar_cache.find_cache(self.file_path)
+            if cache_path is not None:
+                return columnar_cache.read_rows(cache_path, record_indexes)
+            df = pd.read_excel(self.file_path)
+            if self.file_id:
+                frame_cache.put(self.file_id, df)
+        return df.iloc[record_indexes]
+
+    def get_raw_data(self, record_index: int) -> Dict[str, Any]:
+        """获取指定行的原始数据字典（忽略空值）"""
+        return self.get_raw_data_many([record_index])[0]
+
+    def get_raw_data_many(self, record_indexes: List[int]) -> List[Dict[str, Any]]:
+        """批量获取原始数据字典"""
+        if not record_indexes:
+            return []
+        rows = self._load_rows(record_indexes)
+        return [_build_raw_data(rows.columns, values) for values in rows.values]
+
+def _build_raw_data(columns: pd.Index, values: Any) -> Dict[str, Any]:
+    """由一行的列名和值创建原始数据字典"""
+    raw_data = {}
+    if not columns.is_unique:
+        # 列名重复时按标签取值（与pd.Series行为一致）
+        row = pd.Series(values, index=columns)
+        items = ((col, row[col]) for col in columns)
+    else:
+        items = zip(columns, values)
+
+    for col, value in items:
+        try:
+            if pd.notna(value):
+                raw_data[col] = value if not isinstance(value, pd.Series) else str(value)
+        except Exception:
+            pass
+    return raw_data
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional, Any, Sequence, Tuple
+
+from app.services.rules import FILTER_RULE_SPECS
+
+class RulePlan:
+    """
+    规则执行计划
+
+    每次分析编译一次：按优先级保留已启用的规则，逐行归因时不再查询配置。
+    每条记录的全部规则只检查一次（结果同时写入特征表），计划按优先级取第一个命中的规则；
+    排在命中规则之前的规则计为已评估，命中规则之后的不计。计划同时统计每条规则的评估次数、命中数和耗时。
+    """
+
+    def __init__(self, filter_rules: Dict):
+        # (规则编码, 规则定义)，规则编码为规则在FILTER_RULE_SPECS中的位置
+        self.steps: List[Tuple[int, tuple]] = [
+            (code, spec) for code, spec in enumerate(FILTER_RULE_SPECS)
+            if filter_rules[spec[0]]['enabled']
+        ]
+        self.evaluations: Dict[str, int] = {spec[0]: 0 for spec in FILTER_RULE_SPECS}
+        self.hits: Dict[str, int] = {spec[0]: 0 for spec in FILTER_RULE_SPECS}
+        self.seconds: Dict[str, float] = {spec[0]: 0.0 for spec in FILTER_RULE_SPECS}
+
+    def first_hit(self, outcomes: Sequence[Sequence]) -> Optional[Tuple[tuple, Any]]:
+        """
+        按优先级返回第一个命中的(规则定义, 详情值)，均未命中返回None
+
+        Args:
+            outcomes: 各规则（按FILTER_RULE_SPECS顺序）的(详情值, 检查时的异常, 耗时)；
+                命中之前的规则检查出错时抛出该异常
+        """
+        for code, spec in self.steps:
+            rule_key = spec[0]
+            value, error, seconds = outcomes[code]
+            if error is not None:
+                raise error
+            self.seconds[rule_key] += seconds
+            self.evaluations[rule_key] += 1
+            if value:
+                self.hits[rule_key] += 1
+                return spec, value
+        return None
+
+    def add_stats(self, rule_key: str, evaluations: int, hits: int, seconds: float) -> None:
+        """累加批量评估（列式引擎或分片进程）的统计"""
+        self.evaluations[rule_key] += evaluations
+        self.hits[rule_key] += hits
+        self.seconds[rule_key] += seconds
+
+    def merge(self, stats: Dict[str, Dict[str, Any]]) -> None:
+        """合并另一个计划导出的统计"""
+        for rule_key, item in stats.items():
+            self.add_stats(rule_key, item['evaluations'], item['hits'], item['time_ms'] / 1000)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """导出每条规则的评估统计"""
+        stats = {}
+        for spec in FILTER_RULE_SPECS:
+            rule_key = spec[0]
+            evaluations = self.evaluations[rule_key]
+            stats[rule_key] = {
+                "evaluations": evaluations,
+                "hits": self.hits[rule_key],
+                "hit_rate": round(self.hits[rule_key] / evaluations * 100, 2) if evaluations else 0.0,
+                "time_ms": round(self.seconds[rule_key] * 1000, 3)
+            }
+        return stats
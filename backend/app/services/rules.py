@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""过滤规则的公共定义（逐行引擎与列式引擎共用）"""
+
+# 官方店铺服务助手昵称
+SERVICE_ASSISTANT_NICK = 'tineco添可官方旗舰店:服务助手'
+
+# 售后人员昵称特征子串
+STAFF_NICK_MARKER = 'tineco添可官方旗舰店:k'
+
+# 收货地址确认消息摘要
+ADDRESS_CONFIRM_SUMMARY = '请确认收货地址'
+
+# 过滤规则需要读取的列（其余列只在查看过滤详情时按需加载）
+RULE_COLUMNS = ('messages', 'users')
+
+# 过滤规则定义（按优先级排序）：配置键, 过滤类型, 过滤原因, 计数器键, 详情字段
+FILTER_RULE_SPECS = [
+    ("early_morning_filter", "early_morning", "早晨消息(0-8点)", "early_morning_count", "timestamp"),
+    ("staff_filter", "staff_involvement", "售后人员参与", "staff_involved_count", "staff_name"),
+    ("service_assistant_filter", "service_assistant", "服务助手消息", "service_assistant_count", "service_message"),
+    ("address_confirm_filter", "address_confirmation", "收货地址确认消息", "address_confirm_count", "address_content"),
+]
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional
+
+class StaffMatcher:
+    """
+    售后人员匹配器
+
+    精确昵称使用哈希集合查找；子串和前缀特征编译为一个正则表达式，
+    每个用户名只需扫描一次，匹配代价与名单大小无关。
+    匹配器创建后不再修改，更新名单时整体替换。
+    """
+
+    def __init__(self, staff_names: Iterable[str], substrings: Iterable[str] = (),
+                 prefixes: Iterable[str] = ()):
+        self.names = frozenset(staff_names)
+        self.substrings = tuple(pattern for pattern in substrings if pattern)
+        self.prefixes = tuple(pattern for pattern in prefixes if pattern)
+
+        alternatives = [re.escape(pattern) for pattern in self.substrings]
+        alternatives += ['^' + re.escape(pattern) for pattern in self.prefixes]
+        self._pattern = re.compile('|'.join(alternatives)) if alternatives else None
+
+    def matches(self, user: str) -> bool:
+        """判断单个用户是否为售后人员"""
+        if self._pattern is not None and self._pattern.search(user):
+            return True
+        return user in self.names
+
+    def first_match(self, users: List[str]) -> Optional[str]:
+        """返回第一个售后人员用户名，没有则返回None"""
+        for user in users:
+            if self.matches(user):
+                return user
+        return None
+
+    def match_array(self, users: np.ndarray) -> np.ndarray:
+        """批量判断用户名数组，返回布尔掩码"""
+        names = pd.Series(users, dtype=object)
+        mask = names.isin(self.names).to_numpy(dtype=bool)
+        if self._pattern is not None and len(names):
+            mask |= names.str.contains(self._pattern).to_numpy(dtype=bool)
+        return mask
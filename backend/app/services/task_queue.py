@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+持久化的分析任务队列（SQLite）
+
+TASK_QUEUE_BACKEND为sqlite时，API进程只把任务写入队列文件，
+由独立的工作进程（python -m app.worker）领取执行并写回结果，
+多个uvicorn进程和多台机器上的工作进程共享同一个队列文件（以及UPLOAD_DIR）。
+
+工作进程以租约方式领取任务，执行期间定期续约（心跳）并写入进度；
+工作进程退出或失联导致租约过期后，任务重新排队，超过TASK_MAX_ATTEMPTS次后标记为失败。
+任务状态使用AnalysisStatus的取值。
+
+分析结果以pickle格式写入队列文件，读取时会执行其中的反序列化指令：
+队列文件只能由受信任的API进程和工作进程写入，不要放在其他用户可写的位置。
+"""
+
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import task_context
+from app.models.schemas import AnalysisStatus
+from app.services.task_scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+_PENDING = AnalysisStatus.PENDING.value
+_PROCESSING = AnalysisStatus.PROCESSING.value
+_FINISHED = (AnalysisStatus.COMPLETED.value, AnalysisStatus.FAILED.value, AnalysisStatus.CANCELLED.value)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL UNIQUE,
+    file_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    known_bad_rows BLOB,
+    priority INTEGER NOT NULL DEFAULT 0,
+    estimated_rows INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    status_message TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    timed_out INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    partial_result TEXT,
+    total_records INTEGER,
+    result BLOB,
+    created_time TEXT NOT NULL,
+    started_time TEXT,
+    completed_time TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_queue ON analysis_jobs (status, priority, seq);
+"""
+
+# 估算处理速度时使用的最近完成任务数
+_THROUGHPUT_SAMPLE = 20
+
+# 查询任务状态时返回的列（不含结果数据和无效行号）
+_STATUS_COLUMNS = (
+    "task_id, file_id, file_path, payload, priority, estimated_rows, status, progress, status_message, "
+    "attempts, worker_id, cancel_requested, timed_out, error_message, partial_result, total_records, "
+    "created_time, started_time, completed_time"
+)
+
+class SQLiteTaskQueue:
+    """基于SQLite文件的分析任务队列（每次操作使用独立连接，可在多线程和多进程中使用）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self._ensure_schema()
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _ensure_schema(self) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(analysis_jobs)")}
+                if "known_bad_rows" not in columns:
+                    # 旧版本创建的队列文件
+                    conn.execute("ALTER TABLE analysis_jobs ADD COLUMN known_bad_rows BLOB")
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def enqueue(self, task_id: str, file_id: str, file_path: str, payload: Dict[str, Any],
+                priority: int = 0, estimated_rows: int = 0,
+                known_bad_rows: Optional[np.ndarray] = None, bounded: bool = True) -> int:
+        """
+        提交任务
+
+        全文件校验标记的无效行号单独保存，只在工作进程领取任务时读取，查询任务状态时不解码。
+        bounded为False时不检查排队上限（已接受的请求改为独立执行时使用）。
+
+        Returns:
+            int: 排队位置（从1开始）
+
+        Raises:
+            QueueFullError: 排队任务数已达ANALYSIS_QUEUE_SIZE
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = conn.execute(
+                    "SELECT COUNT(*) FROM analysis_jobs WHERE status = ?", (_PENDING,)
+                ).fetchone()[0]
+                if bounded and queued >= settings.ANALYSIS_QUEUE_SIZE:
+                    raise QueueFullError(f"分析队列已满（{queued}个任务排队），请稍后重试")
+                conn.execute(
+                    "INSERT INTO analysis_jobs (task_id, file_id, file_path, payload, known_bad_rows, priority, "
+                    "estimated_rows, status, status_message, created_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_id, file_id, file_path, json.dumps(payload, ensure_ascii=False, default=_json_default),
+                     np.asarray(known_bad_rows, dtype=np.int64).tobytes() if known_bad_rows is not None else None,
+                     priority, max(estimated_rows, 0), _PENDING, "等待工作进程领取",
+                     datetime.now().isoformat())
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return self._position(conn, task_id)
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按优先级领取一个排队任务（先将租约过期的任务重新排队），没有任务时返回None
+
+        返回的任务包含known_bad_rows（全文件校验标记的无效行号数组，未校验时为None）。
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(conn, now)
+                row = conn.execute(
+                    f"SELECT {_STATUS_COLUMNS}, known_bad_rows FROM analysis_jobs "
+                    "WHERE status = ? ORDER BY priority, seq LIMIT 1",
+                    (_PENDING,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                started_time = datetime.now().isoformat()
+                conn.execute(
+                    "UPDATE analysis_jobs SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "started_time = ?, progress = 0, status_message = ? WHERE task_id = ?",
+                    (_PROCESSING, worker_id, now + settings.TASK_LEASE_SECONDS, started_time,
+                     f"工作进程 {worker_id} 开始分析", row["task_id"])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = _row_to_dict(row)
+        if job["known_bad_rows"] is not None:
+            job["known_bad_rows"] = np.frombuffer(job["known_bad_rows"], dtype=np.int64)
+        job.update(status=_PROCESSING, worker_id=worker_id, attempts=job["attempts"] + 1, started_time=started_time)
+        return job
+
+    def heartbeat(self, task_id: str, worker_id: str, progress: Optional[float] = None,
+                  message: Optional[str] = None) -> Optional[bool]:
+        """
+        续约并写入进度
+
+        Returns:
+            Optional[bool]: 是否已请求取消；租约已失效（任务被重新排队或删除）时返回None
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE analysis_jobs SET lease_expires = ?, progress = COALESCE(?, progress), "
+                "status_message = COALESCE(?, status_message) WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (time.time() + settings.TASK_LEASE_SECONDS, progress, message, task_id, worker_id, _PROCESSING)
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = conn.execute("SELECT cancel_requested FROM analysis_jobs WHERE task_id = ?", (task_id,)).fetchone()
+            return bool(row["cancel_requested"])
+
+    def complete(self, task_id: str, worker_id: str, result: Any) -> bool:
+        """写入分析结果，返回是否仍持有租约（否则结果被丢弃）"""
+        return self._finish(task_id, worker_id, AnalysisStatus.COMPLETED.value, progress=100.0,
+                            status_message="分析完成", total_records=result.total_records,
+                            result=pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def fail(self, task_id: str, worker_id: str, error_message: str) -> bool:
+        """标记任务失败"""
+        return self._finish(task_id, worker_id, AnalysisStatus.FAILED.value,
+                            status_message=f"分析失败: {error_message}", error_message=error_message)
+
+    def abort(self, task_id: str, worker_id: str, reason: str, timed_out: bool,
+              counters: Optional[Dict[str, int]]) -> bool:
+        """标记任务中止：取消为cancelled，超时为failed，保留已处理部分的计数器"""
+        status = AnalysisStatus.FAILED.value if timed_out else AnalysisStatus.CANCELLED.value
+        return self._finish(task_id, worker_id, status, status_message=f"分析已中止: {reason}",
+                            error_message=reason, timed_out=int(timed_out),
+                            partial_result=json.dumps(counters) if counters is not None else None)
+
+    def request_cancel(self, task_id: str) -> bool:
+        """取消任务：排队中的任务直接取消，执行中的任务通知工作进程中止"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE analysis_jobs SET status = ?, cancel_requested = 1, completed_time = ?, "
+                "status_message = ? WHERE task_id = ? AND status = ?",
+                (AnalysisStatus.CANCELLED.value, datetime.now().isoformat(), "任务已取消", task_id, _PENDING)
+            )
+            if cursor.rowcount:
+                return True
+            cursor = conn.execute(
+                "UPDATE analysis_jobs SET cancel_requested = 1 WHERE task_id = ? AND status = ?",
+                (task_id, _PROCESSING)
+            )
+            return cursor.rowcount > 0
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态（不含结果数据）"""
+        jobs = self.get_many([task_id])
+        return jobs[0] if jobs else None
+
+    def get_many(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量获取任务状态"""
+        if not task_ids:
+            return []
+        with self._connect() as conn:
+            placeholders = ",".join("?" * len(task_ids))
+            rows = conn.execute(
+                f"SELECT {_STATUS_COLUMNS} FROM analysis_jobs WHERE task_id IN ({placeholders})", task_ids
+            ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """获取全部任务状态"""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM analysis_jobs ORDER BY seq").fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def load_result(self, task_id: str) -> Optional[Any]:
+        """读取已完成任务的分析结果（pickle格式，队列文件必须可信）"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM analysis_jobs WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or row["result"] is None:
+            return None
+        return pickle.loads(row["result"])
+
+    def delete(self, task_id: str) -> None:
+        """删除任务记录"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM analysis_jobs WHERE task_id = ?", (task_id,))
+
+    def requeue_expired(self) -> int:
+        """将租约过期的任务重新排队（或标记为失败），返回处理的任务数"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = self._requeue_expired(conn, time.time())
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return count
+
+    def get_queue_info(self, task_id: str) -> Dict[str, Any]:
+        """
+        任务的排队位置（0表示执行中）和预计等待/完成时间
+
+        处理速度（行/秒）取最近完成任务的总行数与总耗时之比，尚无已完成任务时预计时间为None；
+        执行中任务的剩余时间和前面排队任务的处理时间按当前活跃的工作进程数均摊。
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, priority, seq, estimated_rows, started_time FROM analysis_jobs WHERE task_id = ?",
+                (task_id,)
+            ).fetchone()
+            if row is None or row["status"] in _FINISHED:
+                return {"queue_position": None, "eta_seconds": None}
+            rows_per_second = self._rows_per_second(conn)
+            if row["status"] == _PROCESSING:
+                return {"queue_position": 0, "eta_seconds": _round(self._remaining_seconds(row, rows_per_second))}
+
+            position = self._position(conn, task_id)
+            if not rows_per_second:
+                return {"queue_position": position, "eta_seconds": None}
+            ahead_rows = conn.execute(
+                "SELECT COALESCE(SUM(estimated_rows), 0) FROM analysis_jobs WHERE status = ? "
+                "AND (priority < ? OR (priority = ? AND seq < ?))",
+                (_PENDING, row["priority"], row["priority"], row["seq"])
+            ).fetchone()[0]
+            running = conn.execute(
+                "SELECT estimated_rows, started_time, worker_id, lease_expires FROM analysis_jobs WHERE status = ?",
+                (_PROCESSING,)
+            ).fetchall()
+        running_seconds = sum(self._remaining_seconds(job, rows_per_second) for job in running)
+        workers = len({job["worker_id"] for job in running if (job["lease_expires"] or 0) > time.time()}) or 1
+        wait_seconds = (running_seconds + ahead_rows / rows_per_second) / workers
+        return {
+            "queue_position": position,
+            "eta_seconds": _round(wait_seconds + row["estimated_rows"] / rows_per_second)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status").fetchall())
+            workers = conn.execute(
+                "SELECT COUNT(DISTINCT worker_id) FROM analysis_jobs WHERE status = ? AND lease_expires > ?",
+                (_PROCESSING, time.time())
+            ).fetchone()[0]
+            rows_per_second = self._rows_per_second(conn)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "queued": counts.get(_PENDING, 0),
+            "running": counts.get(_PROCESSING, 0),
+            "active_workers": workers,
+            "rows_per_second": _round(rows_per_second),
+            "status_counts": counts
+        }
+
+    def _finish(self, task_id: str, worker_id: str, status: str, **fields) -> bool:
+        fields.update(status=status, completed_time=datetime.now().isoformat(), lease_expires=None)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE analysis_jobs SET {assignments} WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (*fields.values(), task_id, worker_id, _PROCESSING)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def _requeue_expired(conn: sqlite3.Connection, now: float) -> int:
+        cancelled = conn.execute(
+            "UPDATE analysis_jobs SET status = ?, completed_time = ?, lease_expires = NULL, status_message = ? "
+            "WHERE status = ? AND lease_expires < ? AND cancel_requested = 1",
+            (AnalysisStatus.CANCELLED.value, datetime.now().isoformat(), "任务已取消", _PROCESSING, now)
+        ).rowcount
+        failed = conn.execute(
+            "UPDATE analysis_jobs SET status = ?, completed_time = ?, lease_expires = NULL, "
+            "error_message = ?, status_message = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+            (AnalysisStatus.FAILED.value, datetime.now().isoformat(), "工作进程失联，任务已达最大重试次数",
+             "分析失败: 工作进程失联", _PROCESSING, now, settings.TASK_MAX_ATTEMPTS)
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE analysis_jobs SET status = ?, worker_id = NULL, lease_expires = NULL, progress = 0, "
+            "status_message = ? WHERE status = ? AND lease_expires < ?",
+            (_PENDING, "工作进程失联，任务重新排队", _PROCESSING, now)
+        ).rowcount
+        return cancelled + failed + requeued
+
+    @staticmethod
+    def _rows_per_second(conn: sqlite3.Connection) -> Optional[float]:
+        """最近完成任务的处理速度（行/秒），没有已完成任务时返回None"""
+        rows = seconds = 0.0
+        for job in conn.execute(
+            "SELECT total_records, started_time, completed_time FROM analysis_jobs "
+            "WHERE status = ? AND total_records > 0 AND started_time IS NOT NULL "
+            "ORDER BY completed_time DESC LIMIT ?",
+            (AnalysisStatus.COMPLETED.value, _THROUGHPUT_SAMPLE)
+        ):
+            elapsed = datetime.fromisoformat(job["completed_time"]) - datetime.fromisoformat(job["started_time"])
+            rows += job["total_records"]
+            seconds += elapsed.total_seconds()
+        return rows / seconds if rows and seconds > 0 else None
+
+    @staticmethod
+    def _remaining_seconds(job: sqlite3.Row, rows_per_second: Optional[float]) -> float:
+        """执行中任务按预计行数估算的剩余时间"""
+        if not rows_per_second or not job["started_time"]:
+            return 0.0
+        elapsed = (datetime.now() - datetime.fromisoformat(job["started_time"])).total_seconds()
+        return max(job["estimated_rows"] / rows_per_second - elapsed, 0.0)
+
+    @staticmethod
+    def _position(conn: sqlite3.Connection, task_id: str) -> int:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM analysis_jobs AS other JOIN analysis_jobs AS job ON job.task_id = ? "
+            "WHERE other.status = ? AND (other.priority < job.priority "
+            "OR (other.priority = job.priority AND other.seq <= job.seq))",
+            (task_id, _PENDING)
+        ).fetchone()
+        return row[0]
+
+class QueueWatcher:
+    """
+    跟踪本API进程提交的持久化任务
+
+    后台线程定期读取任务状态：执行中时回调on_progress，结束时回调on_finished并停止跟踪。
+    """
+
+    def __init__(self, queue: SQLiteTaskQueue, interval: float = 0.5):
+        self.queue = queue
+        self.interval = interval
+        self._watched: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, task_id: str, on_progress: Callable[[Dict[str, Any]], None],
+              on_finished: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._watched[task_id] = (on_progress, on_finished)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-queue-watcher", daemon=True)
+                self._thread.start()
+
+    def is_watching(self, task_id: str) -> bool:
+        """任务是否仍在跟踪（尚未读取到结束状态）"""
+        with self._lock:
+            return task_id in self._watched
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = dict(self._watched)
+            if not watched:
+                continue
+            try:
+                self.queue.requeue_expired()
+                jobs = self.queue.get_many(list(watched))
+            except Exception as e:
+                logger.error("读取任务队列出错: %s", e)
+                continue
+
+            for job in jobs:
+                on_progress, on_finished = watched[job["task_id"]]
+                try:
+                    with task_context(job["task_id"]):
+                        if job["status"] in _FINISHED:
+                            with self._lock:
+                                self._watched.pop(job["task_id"], None)
+                            on_finished(job)
+                        else:
+                            on_progress(job)
+                except Exception as e:
+                    logger.exception("更新任务 %s 状态出错: %s", job["task_id"], e)
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["partial_result"] = json.loads(job["partial_result"]) if job["partial_result"] else None
+    for key in ("created_time", "started_time", "completed_time"):
+        job[key] = datetime.fromisoformat(job[key]) if job[key] else None
+    return job
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.integer):
+        return int(value)
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+# 全局任务队列实例（TASK_QUEUE_BACKEND为sqlite时使用）
+task_queue = SQLiteTaskQueue(settings.TASK_QUEUE_PATH)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import task_context
+
+logger = logging.getLogger(__name__)
+
+# 优先级类别（数值越小越先执行）：小文件可以插队到大文件之前
+PRIORITY_SMALL = 0
+PRIORITY_LARGE = 1
+PRIORITY_NAMES = {PRIORITY_SMALL: "small", PRIORITY_LARGE: "large"}
+
+# 观测吞吐量的平滑系数
+_RATE_SMOOTHING = 0.3
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+class AnalysisScheduler:
+    """
+    分析任务调度器
+
+    有界优先队列 + 固定数量的执行线程（MAX_CONCURRENT_ANALYSIS）。
+    同一优先级内按提交顺序执行；队列已满时拒绝提交。
+    根据已完成任务观测到的处理速度（行/秒）估算排队任务的位置和预计完成时间。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._queue: List[Tuple[int, int, str]] = []  # (优先级, 序号, 任务ID)
+        self._jobs: Dict[str, Tuple[Callable, tuple, int]] = {}  # 排队任务: (函数, 参数, 预计行数)
+        self._running: Dict[str, Tuple[float, int]] = {}  # 执行中任务: (开始时间, 预计行数)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self.rows_per_second: Optional[float] = None
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, task_id: str, priority: int, estimated_rows: int,
+               fn: Callable[..., Any], *args, bounded: bool = True) -> int:
+        """
+        提交任务
+
+        fn返回处理的记录数时用于更新吞吐量估算。
+        bounded为False时不检查排队上限（已接受的请求改为独立执行时使用）。
+
+        Returns:
+            int: 排队位置（从1开始）
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        with self._cond:
+            if bounded and len(self._jobs) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"分析队列已满（{len(self._jobs)}个任务排队），请稍后重试")
+            self._jobs[task_id] = (fn, args, max(estimated_rows, 0))
+            heapq.heappush(self._queue, (priority, next(self._sequence), task_id))
+            self._ensure_workers()
+            self._cond.notify()
+            return self._position(task_id)
+
+    def cancel(self, task_id: str) -> bool:
+        """从队列中移除尚未开始的任务，返回是否移除"""
+        with self._cond:
+            if self._jobs.pop(task_id, None) is None:
+                return False
+            self._queue = [entry for entry in self._queue if entry[2] != task_id]
+            heapq.heapify(self._queue)
+            return True
+
+    def get_queue_info(self, task_id: str) -> Dict[str, Any]:
+        """任务的排队位置和预计等待/完成时间（秒，尚无吞吐量数据时为None）"""
+        with self._cond:
+            if task_id in self._running:
+                started, rows = self._running[task_id]
+                return {"queue_position": 0, "eta_seconds": self._round(self._remaining_seconds(started, rows))}
+            if task_id not in self._jobs:
+                return {"queue_position": None, "eta_seconds": None}
+
+            position = self._position(task_id)
+            ahead_rows = sum(self._jobs[entry[2]][2] for entry in sorted(self._queue)[:position - 1])
+            own_rows = self._jobs[task_id][2]
+            if not self.rows_per_second:
+                return {"queue_position": position, "eta_seconds": None}
+
+            # 执行中任务剩余时间和前面排队任务的处理时间按执行线程数均摊
+            running_seconds = sum(self._remaining_seconds(*item) for item in self._running.values())
+            wait_seconds = (running_seconds + ahead_rows / self.rows_per_second) / self.max_workers
+            return {
+                "queue_position": position,
+                "eta_seconds": self._round(wait_seconds + own_rows / self.rows_per_second)
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        with self._cond:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": len(self._running),
+                "queued": len(self._jobs),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rows_per_second": self._round(self.rows_per_second)
+            }
+
+    def _position(self, task_id: str) -> int:
+        for position, entry in enumerate(sorted(self._queue), 1):
+            if entry[2] == task_id:
+                return position
+        return 0
+
+    def _remaining_seconds(self, started: float, rows: int) -> float:
+        if not self.rows_per_second:
+            return 0.0
+        return max(rows / self.rows_per_second - (time.monotonic() - started), 0.0)
+
+    def _ensure_workers(self) -> None:
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"analysis-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _work(self) -> None:
+        """执行线程：按优先级取出任务执行"""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, task_id = heapq.heappop(self._queue)
+                fn, args, rows = self._jobs.pop(task_id)
+                started = time.monotonic()
+                self._running[task_id] = (started, rows)
+
+            processed_rows = None
+            try:
+                with task_context(task_id):
+                    processed_rows = fn(*args)
+            except Exception as e:
+                logger.exception("分析任务 %s 执行出错: %s", task_id, e)
+            finally:
+                with self._cond:
+                    self._running.pop(task_id, None)
+                    self.completed += 1
+                    self._record_throughput(processed_rows, time.monotonic() - started)
+
+    def _record_throughput(self, rows: Optional[int], seconds: float) -> None:
+        if not rows or seconds <= 0:
+            return
+        rate = rows / seconds
+        if self.rows_per_second is None:
+            self.rows_per_second = rate
+        else:
+            self.rows_per_second += _RATE_SMOOTHING * (rate - self.rows_per_second)
+
+    @staticmethod
+    def _round(value: Optional[float]) -> Optional[float]:
+        return round(value, 1) if value is not None else None
+
+def priority_for_size(file_size: int) -> int:
+    """按文件大小确定优先级类别"""
+    return PRIORITY_SMALL if file_size <= settings.ANALYSIS_SMALL_FILE_MB * 1024 * 1024 else PRIORITY_LARGE
+
+# 全局调度器实例
+scheduler = AnalysisScheduler(settings.MAX_CONCURRENT_ANALYSIS, settings.ANALYSIS_QUEUE_SIZE)
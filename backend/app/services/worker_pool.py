@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logger import setup_logging
+
+# 分片计算进程池（按需创建，分片分析和全文件校验共享）
+_worker_pool: Optional[ProcessPoolExecutor] = None
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """获取分片计算进程池（进程数为ANALYSIS_WORKERS）"""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            # 使用spawn启动方式，避免在多线程的API进程中fork
+            _worker_pool = ProcessPoolExecutor(
+                max_workers=settings.ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=setup_logging  # 分片进程的日志直接写标准输出
+            )
+        return _worker_pool
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分析工作进程
+
+从持久化任务队列（TASK_QUEUE_PATH）领取分析任务，执行后把结果写回队列。
+需要与API进程访问同一个队列文件和UPLOAD_DIR，可以在多台机器上运行多个实例：
+
+    python -m app.worker [--worker-id ID] [--poll-interval 1.0] [--once]
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import setup_logging, task_context
+from app.services.analyzer import ChatAnalyzer
+from app.services.cancellation import CancellationToken, AnalysisCancelled
+from app.services.task_queue import task_queue
+
+logger = logging.getLogger(__name__)
+
+# 写入队列遇到数据库锁定等临时错误时的重试次数和间隔（秒，每次加倍）
+_WRITE_ATTEMPTS = 5
+_RETRY_DELAY = 0.5
+_MAX_RETRY_DELAY = 8.0
+
+def _with_retry(description: str, operation: Callable[..., Any], *args) -> Any:
+    """
+    执行队列操作，sqlite3.OperationalError（如database is locked）时等待后重试
+
+    Raises:
+        sqlite3.OperationalError: 重试_WRITE_ATTEMPTS次后仍然出错
+    """
+    delay = _RETRY_DELAY
+    for attempt in range(1, _WRITE_ATTEMPTS + 1):
+        try:
+            return operation(*args)
+        except sqlite3.OperationalError as e:
+            if attempt == _WRITE_ATTEMPTS:
+                raise
+            logger.warning("%s出错（第%d次），%.1f秒后重试: %s", description, attempt, delay, e)
+            time.sleep(delay)
+            delay = min(delay * 2, _MAX_RETRY_DELAY)
+
+class JobHeartbeat:
+    """执行任务期间定期续约并写入最新进度，收到取消请求或租约失效时取消分析"""
+
+    def __init__(self, job: Dict[str, Any], worker_id: str, cancel_token: CancellationToken):
+        self.job = job
+        self.worker_id = worker_id
+        self.cancel_token = cancel_token
+        self.progress: Optional[float] = None
+        self.message: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def update_progress(self, progress: float, message: str = "") -> None:
+        """进度回调（只记录，由心跳线程写入队列）"""
+        self.progress, self.message = progress, message
+
+    def __enter__(self) -> 'JobHeartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.TASK_HEARTBEAT_SECONDS):
+            try:
+                cancel_requested = task_queue.heartbeat(
+                    self.job["task_id"], self.worker_id, self.progress, self.message
+                )
+            except Exception as e:
+                logger.error("任务 %s 续约出错: %s", self.job["task_id"], e)
+                continue
+            if cancel_requested is None:
+                self.cancel_token.cancel("任务租约已失效")
+            elif cancel_requested:
+                self.cancel_token.cancel("任务已被用户取消")
+
+def run_job(job: Dict[str, Any], worker_id: str) -> None:
+    """执行一个已领取的任务并写回结果"""
+    task_id = job["task_id"]
+    payload = job["payload"]
+    logger.info("工作进程 %s 开始执行任务 %s（第%d次）", worker_id, task_id, job["attempts"])
+
+    cancel_token = CancellationToken(payload.get("timeout"))
+    cancel_token.start()
+    known_bad_rows = job.get("known_bad_rows")
+    if known_bad_rows is None and payload.get("known_bad_rows") is not None:
+        # 旧版本提交的任务把无效行号放在payload中
+        known_bad_rows = np.array(payload["known_bad_rows"], dtype=np.int64)
+    task_analyzer = ChatAnalyzer(staff_list=payload["staff_list"], filter_rules=payload["filter_rules"])
+
+    try:
+        with JobHeartbeat(job, worker_id, cancel_token) as heartbeat:
+            result = task_analyzer.analyze_excel(
+                job["file_path"],
+                progress_callback=heartbeat.update_progress,
+                file_id=job["file_id"],
+                cancel_token=cancel_token,
+                known_bad_rows=known_bad_rows
+            )
+        # 行访问器由API进程重新创建
+        result._row_source = None
+        write = ("写入分析结果", task_queue.complete, task_id, worker_id, result)
+    except AnalysisCancelled as e:
+        logger.info("任务 %s 已中止: %s", task_id, e.reason)
+        write = ("写入中止状态", task_queue.abort, task_id, worker_id, e.reason, e.timed_out, e.counters)
+    except Exception as e:
+        logger.error("任务 %s 失败: %s", task_id, e)
+        write = ("写入失败状态", task_queue.fail, task_id, worker_id, str(e))
+
+    try:
+        if not _with_retry(*write):
+            logger.warning("任务 %s 的租约已失效，未能%s", task_id, write[0])
+    except sqlite3.OperationalError as e:
+        # 租约过期后任务由其他工作进程重新执行
+        logger.error("任务 %s %s失败，等待租约过期后重新排队: %s", task_id, write[0], e)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="从持久化队列领取并执行分析任务")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}",
+                        help="工作进程标识（默认为主机名-进程号）")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="队列为空时的轮询间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="队列为空时退出")
+    args = parser.parse_args()
+
+    setup_logging()
+    logger.info("分析工作进程 %s 已启动，队列文件: %s", args.worker_id, os.path.abspath(task_queue.path))
+    while True:
+        try:
+            job = task_queue.claim(args.worker_id)
+        except sqlite3.OperationalError as e:
+            logger.warning("领取任务出错，%.1f秒后重试: %s", args.poll_interval, e)
+            time.sleep(args.poll_interval)
+            continue
+        if job is None:
+            if args.once:
+                return
+            time.sleep(args.poll_interval)
+            continue
+        with task_context(job["task_id"]):
+            run_job(job, args.worker_id)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试公共配置
+
+导入应用前把上传目录、元数据数据库、任务队列和售后名单指向临时目录；
+结果缓存关闭，同一文件的每次分析都实际执行。
+耗时的基准测试标记为benchmark，设置环境变量RUN_BENCHMARKS=1时才执行。
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix="chat-analyzer-tests-")
+
+STAFF = ["客服A", "客服B", "tineco添可官方旗舰店:小李"]
+SERVICE_ASSISTANT = "tineco添可官方旗舰店:服务助手"
+
+with open(os.path.join(_TEST_DIR, "staff.json"), "w", encoding="utf-8") as f:
+    json.dump([{"nick_name": nick} for nick in STAFF], f, ensure_ascii=False)
+
+os.environ.update({
+    "UPLOAD_DIR": os.path.join(_TEST_DIR, "uploads"),
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_DIR, 'metadata.db')}",
+    "TASK_QUEUE_PATH": os.path.join(_TEST_DIR, "task_queue.db"),
+    "STAFF_CONFIG_PATH": os.path.join(_TEST_DIR, "staff.json"),
+    "MAX_CONCURRENT_ANALYSIS": "1",
+    "ANALYSIS_PROCESS_ISOLATION": "false",
+    "RESULT_CACHE_MAX_MB": "0",
+    "PROGRESS_STREAM_INTERVAL": "0.05",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.services import analysis_process  # noqa: E402
+
+_FINISHED = {"completed", "failed", "cancelled"}
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: 耗时的性能基准测试，设置RUN_BENCHMARKS=1时执行")
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("RUN_BENCHMARKS") == "1":
+        return
+    skip = pytest.mark.skip(reason="基准测试，设置RUN_BENCHMARKS=1时执行")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+def _message(rng: random.Random):
+    """生成一条消息，包括时间缺失或格式错误、内容不是对象等异常情况"""
+    message = {}
+    r = rng.random()
+    if r < 0.9:
+        zone = rng.choice(["", "Z", "+08:00", "+00:00"])
+        message["time"] = f"2024-05-{rng.randrange(1, 28):02d}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00{zone}"
+    elif r < 0.93:
+        message["time"] = "bogus"
+    elif r < 0.95:
+        message["time"] = ""
+
+    r = rng.random()
+    if r < 0.5:
+        message["sender_nick"] = SERVICE_ASSISTANT
+    elif r < 0.9:
+        message["sender_nick"] = rng.choice(["买家1", "客服A", "tineco添可官方旗舰店:k1", None])
+
+    r = rng.random()
+    if r < 0.8:
+        content = {}
+        if rng.random() < 0.2:
+            content["summary"] = "请确认收货地址"
+        elif rng.random() < 0.3:
+            content["summary"] = rng.choice(["其他", None, 3])
+        if rng.random() < 0.8:
+            content["text"] = rng.choice(["你好", "", "地址: 杭州", "abc"])
+        message["content"] = content
+    elif r < 0.85:
+        message["content"] = "plain"
+    return message if rng.random() > 0.02 else rng.choice(["x", 1, None])
+
+def make_chat_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """生成聊天记录导出数据，覆盖各过滤规则和messages列的异常格式（前100行是上传校验的样本，不含错误JSON）"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        r = rng.random()
+        if r < 0.03:
+            messages = None
+        elif r < 0.05:
+            messages = "{bad json" if i >= 100 else "[]"
+        elif r < 0.06:
+            messages = "[]"
+        else:
+            messages = json.dumps([_message(rng) for _ in range(rng.randrange(1, 6))], ensure_ascii=False)
+        users = ",".join(rng.choice(["买家1", "客服A", "tineco添可官方旗舰店:k9", " ", "客服Z", "客服B"])
+                         for _ in range(rng.randrange(0, 4)))
+        records.append({
+            "platform": "taobao",
+            "date": "2024-05-01",
+            "messages": messages,
+            "user_nick": f"u{i}",
+            "shop_name": "tineco",
+            "users": users or None,
+            "num": rng.choice([1, 2, None])
+        })
+    return pd.DataFrame(records)
+
+@pytest.fixture(scope="session")
+def make_chat_file(tmp_path_factory):
+    """按(行数, 随机种子)生成.xlsx文件，同一参数只生成一次"""
+    files = {}
+
+    def make(rows: int = 2000, seed: int = 0) -> str:
+        if (rows, seed) not in files:
+            path = str(tmp_path_factory.mktemp("data") / f"chat_{rows}_{seed}.xlsx")
+            make_chat_frame(rows, seed).to_excel(path, index=False)
+            files[(rows, seed)] = path
+        return files[(rows, seed)]
+
+    return make
+
+@pytest.fixture(scope="session")
+def make_cached_chat_file(tmp_path_factory):
+    """
+    生成大文件：数据写入列式缓存，.xlsx只是占位（分析时读取缓存），避免写入大量行的Excel文件
+
+    Returns:
+        (文件路径, 生成的数据)
+    """
+    from app.services import columnar_cache
+
+    files = {}
+
+    def make(rows: int, seed: int = 0):
+        if (rows, seed) not in files:
+            frame = make_chat_frame(rows, seed)
+            path = str(tmp_path_factory.mktemp("data") / f"chat_cached_{rows}_{seed}.xlsx")
+            frame.head(1).to_excel(path, index=False)
+            assert columnar_cache.write_cache(path, frame) is not None
+            files[(rows, seed)] = (path, frame)
+        return files[(rows, seed)]
+
+    return make
+
+@pytest.fixture(scope="session")
+def chat_file(make_chat_file) -> str:
+    return make_chat_file()
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def upload(client):
+    """上传文件并返回文件ID"""
+    def upload_file(path: str) -> str:
+        with open(path, "rb") as f:
+            response = client.post("/api/upload/", files={"file": (os.path.basename(path), f)})
+        assert response.status_code == 200, response.text
+        return response.json()["data"]["file_id"]
+
+    return upload_file
+
+@pytest.fixture
+def upload_large(upload, make_cached_chat_file):
+    """
+    上传大文件并返回文件ID
+
+    上传的是占位的.xlsx：等待后台解析完成后用生成的数据替换上传文件的列式缓存，并清除内存中的占位数据。
+    """
+    from app.api.endpoints.upload import get_file_path
+    from app.services import columnar_cache
+    from app.services.frame_cache import frame_cache
+
+    def upload_file(rows: int, seed: int = 0) -> str:
+        path, frame = make_cached_chat_file(rows, seed)
+        file_id = upload(path)
+        deadline = time.monotonic() + 30
+        while frame_cache.get(file_id) is None:
+            assert time.monotonic() < deadline, "上传文件解析超时"
+            time.sleep(0.02)
+        assert columnar_cache.write_cache(get_file_path(file_id), frame) is not None
+        frame_cache.discard(file_id)
+        return file_id
+
+    return upload_file
+
+@pytest.fixture
+def start_task(client):
+    """开始分析并返回接口返回的数据"""
+    def start(file_id: str, filter_rules=None) -> dict:
+        body = {"file_id": file_id}
+        if filter_rules is not None:
+            body["filter_rules"] = filter_rules
+        response = client.post("/api/analysis/start", json=body)
+        assert response.status_code == 200, response.text
+        return response.json()["data"]
+
+    return start
+
+@pytest.fixture
+def task_status(client):
+    def get_status(task_id: str) -> dict:
+        response = client.get(f"/api/analysis/tasks/{task_id}")
+        assert response.status_code == 200, response.text
+        return response.json()["data"]
+
+    return get_status
+
+@pytest.fixture
+def wait_task(task_status):
+    """等待任务进入指定状态（默认任一结束状态）并返回任务状态"""
+    def wait(task_id: str, statuses=_FINISHED, timeout: float = 60) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            info = task_status(task_id)
+            if info["status"] in statuses:
+                return info
+            assert time.monotonic() < deadline, f"任务 {task_id} 超时未进入 {statuses}: {info}"
+            time.sleep(0.02)
+
+    return wait
+
+class BlockingAnalysis:
+    """
+    替代analysis_process.execute_analysis：放行前停在分析开始处并响应取消，放行后执行实际分析
+
+    hold为停住的调用次数（之后的调用直接执行）；cooperative为False时模拟长时间不检查取消的批次。
+    """
+
+    def __init__(self, execute):
+        self._execute = execute
+        self.release = threading.Event()
+        self.started = []
+        self.hold = float("inf")
+        self.cooperative = True
+
+    def __call__(self, task_analyzer, file_path, progress_callback=None, file_id=None, cancel_token=None):
+        self.started.append(file_id)
+        call = len(self.started)
+        while call <= self.hold and not self.release.wait(0.01):
+            if self.cooperative and cancel_token is not None:
+                cancel_token.check()
+        return self._execute(task_analyzer, file_path, progress_callback=progress_callback,
+                             file_id=file_id, cancel_token=cancel_token)
+
+@pytest.fixture
+def blocking_analysis(monkeypatch):
+    blocker = BlockingAnalysis(analysis_process.execute_analysis)
+    monkeypatch.setattr(analysis_process, "execute_analysis", blocker)
+    yield blocker
+    blocker.release.set()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""分析工作进程：结果与进程内分析一致，取消时协作中止，超过ANALYSIS_KILL_GRACE未中止时强制终止"""
+
+import os
+import statistics
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.analysis_process import AnalysisProcess
+from app.services.analyzer import analyzer
+from app.services.cancellation import AnalysisCancelled, CancellationToken
+
+_VOLATILE_FIELDS = {"rule_stats", "json_backend", "filtered_records_details"}
+
+
+@pytest.fixture
+def worker():
+    process = AnalysisProcess()
+    yield process
+    process.shutdown()
+
+@pytest.fixture
+def stuck_file(tmp_path):
+    """没有写入方的命名管道：工作进程打开文件时一直阻塞，不会检查取消标志"""
+    if not hasattr(os, "mkfifo"):
+        pytest.skip("需要命名管道")
+    path = str(tmp_path / "stuck.xlsx")
+    os.mkfifo(path)
+    return path
+
+def test_result_matches_in_process(worker, chat_file):
+    expected = analyzer.snapshot().analyze_excel(chat_file)
+    progress = []
+    result = worker.run(analyzer.snapshot(), chat_file, progress_callback=lambda *args: progress.append(args))
+
+    assert result.model_dump(exclude=_VOLATILE_FIELDS) == expected.model_dump(exclude=_VOLATILE_FIELDS)
+    assert list(result._record_store) == list(expected._record_store)
+    assert result._row_source.file_path == chat_file
+    assert progress and progress[-1][0] > progress[0][0]
+    assert worker.alive and worker.kills == 0
+
+def test_cancel_stops_worker_between_batches(worker, make_cached_chat_file, chat_file):
+    path, _ = make_cached_chat_file(100_000, seed=7)
+    worker.run(analyzer.snapshot(), chat_file)
+    token = CancellationToken(None)
+    threading.Timer(1.0, token.cancel, args=("任务已被用户取消",)).start()
+
+    with pytest.raises(AnalysisCancelled) as excinfo:
+        worker.run(analyzer.snapshot(), path, cancel_token=token)
+
+    assert excinfo.value.reason == "任务已被用户取消"
+    assert 0 < excinfo.value.counters["total_records"] < 100_000
+    # 协作中止不需要终止进程，下一个任务继续使用
+    assert worker.alive and worker.kills == 0
+
+def test_timeout_in_worker(worker, make_cached_chat_file, chat_file):
+    path, _ = make_cached_chat_file(100_000, seed=7)
+    worker.run(analyzer.snapshot(), chat_file)
+    with pytest.raises(AnalysisCancelled) as excinfo:
+        worker.run(analyzer.snapshot(), path, cancel_token=CancellationToken(1))
+    assert excinfo.value.timed_out
+    assert 0 < excinfo.value.counters["total_records"] < 100_000
+    assert worker.kills == 0
+
+def test_worker_killed_after_grace(worker, stuck_file, chat_file, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_KILL_GRACE", 1)
+    worker.run(analyzer.snapshot(), chat_file)
+    pid = worker._process.pid
+
+    token = CancellationToken(None)
+    threading.Timer(0.5, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(AnalysisCancelled):
+        worker.run(analyzer.snapshot(), stuck_file, cancel_token=token)
+
+    elapsed = time.monotonic() - started
+    assert 1.5 <= elapsed < 5
+    assert worker.kills == 1 and not worker.alive
+
+    # 下一个任务启动新的工作进程
+    result = worker.run(analyzer.snapshot(), chat_file)
+    assert result.total_records == 2000
+    assert worker._process.pid != pid
+
+def test_isolated_api_task(client, chat_file, upload, start_task, wait_task, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_PROCESS_ISOLATION", True)
+    before = client.get("/api/analysis/stats").json()["data"]["worker_processes"]["tasks"]
+    task_id = start_task(upload(chat_file))["task_id"]
+    assert wait_task(task_id)["status"] == "completed"
+
+    stats = client.get("/api/analysis/stats").json()["data"]["worker_processes"]
+    assert stats["tasks"] == before + 1
+    assert stats["alive"] >= 1
+    response = client.get(f"/api/analysis/tasks/{task_id}/result")
+    assert response.json()["data"]["result"]["total_records"] == 2000
+
+def _health_latencies(client, seconds: float):
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        assert client.get("/health").status_code == 200
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    return latencies
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("isolated", [False, True])
+def test_health_latency_under_load(client, upload_large, start_task, wait_task, monkeypatch, isolated):
+    """分析200k行文件期间/health的延迟"""
+    monkeypatch.setattr(settings, "ANALYSIS_PROCESS_ISOLATION", isolated)
+    task_id = start_task(upload_large(200_000, seed=8), {"staff_filter": isolated})["task_id"]
+    wait_task(task_id, {"processing"})
+    latencies = _health_latencies(client, 5)
+    wait_task(task_id, timeout=600)
+
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    print(f"isolated={isolated}: {len(latencies)} requests, "
+          f"median {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""业务时钟：默认0-8点窗口在本地时间上与原规则一致，带时区的时间换算到业务时区，自定义时间窗口（含跨越午夜）"""
+
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.services.analyzer import analyzer
+from app.services.business_clock import BusinessClock
+
+
+def _original_rule(messages):
+    """原早晨消息规则：第一条0-8点的消息时间，时间无法解析时不再检查"""
+    try:
+        for message in messages:
+            if isinstance(message, dict) and 'time' in message:
+                time_str = message['time']
+                if time_str:
+                    dt = datetime.datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+                    if 0 <= dt.hour < 8:
+                        return dt
+    except Exception:
+        pass
+    return None
+
+@pytest.mark.parametrize("times", [
+    ["2024-05-01T07:59:59"],
+    ["2024-05-01T08:00:00"],
+    ["2024-05-01T00:00:00"],
+    ["2024-05-01T23:59:00", "2024-05-01T03:15:00"],
+    ["2024-05-01T12:00:00", "bogus", "2024-05-01T03:00:00"],
+    ["bogus", "2024-05-01T03:00:00"],
+    [5, "2024-05-01T03:00:00"],
+    ["", None, "2024-05-01T06:30:00"],
+    ["2024-05-01 05:00"],
+    [],
+])
+def test_default_window_matches_original_rule(times):
+    messages = [{"time": time_str} for time_str in times] + ["x", {"content": {}}]
+    task_analyzer = analyzer.snapshot()
+    _, first_match = task_analyzer._scan_early_morning(messages)
+    assert first_match == _original_rule(messages)
+
+def test_vectorized_hours_match_scalar_rule():
+    times = np.array([f"2024-05-{day:02d}T{hour:02d}:30:00" for day in (1, 2) for hour in range(24)] + ["bogus", ""],
+                     dtype=object)
+    clock = BusinessClock("Asia/Shanghai")
+    hours = clock.parse_hours(times)
+    assert hours.tolist() == [hour for _ in (1, 2) for hour in range(24)] + [-1, -1]
+    assert clock.window_mask(hours).tolist() == [0 <= hour < 8 for hour in hours.tolist()[:-2]] + [False, False]
+
+@pytest.mark.parametrize("time_str, timezone, hour", [
+    ("2024-05-01T23:30:00Z", "Asia/Shanghai", 7),
+    ("2024-05-01T01:00:00+00:00", "Asia/Shanghai", 9),
+    ("2024-05-01T07:00:00+08:00", "Asia/Shanghai", 7),
+    ("2024-05-01T07:00:00-05:00", "Asia/Shanghai", 20),
+    ("2024-05-01T12:00:00Z", "America/New_York", 8),
+    ("2024-05-01T07:00:00", "America/New_York", 7),  # 不带时区的时间视为本地时间
+    ("2024-05-01T23:30:00Z", "", 23),  # 业务时区为空时保持自带的偏移
+])
+def test_offsets_converted_to_business_timezone(time_str, timezone, hour):
+    clock = BusinessClock(timezone)
+    assert clock.parse(time_str).hour == hour
+    assert clock.parse_hours(np.array([time_str], dtype=object)).tolist() == [hour]
+
+@pytest.mark.parametrize("start_hour, end_hour, hours_in_window", [
+    (0, 8, range(0, 8)),
+    (6, 10, range(6, 10)),
+    (0, 24, range(24)),
+    (22, 6, [22, 23, 0, 1, 2, 3, 4, 5]),
+    (5, 5, []),
+])
+def test_custom_window(start_hour, end_hour, hours_in_window):
+    clock = BusinessClock("Asia/Shanghai", start_hour, end_hour)
+    expected = [hour in hours_in_window for hour in range(24)]
+    assert [clock.in_window(hour) for hour in range(24)] == expected
+    assert clock.window_mask(np.array(list(range(24)) + [-1], dtype=np.int16)).tolist() == expected + [False]
+
+@pytest.mark.parametrize("engine", ["columnar", "row"])
+def test_custom_window_in_analysis(tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(settings, "ANALYSIS_ENGINE", engine)
+    hours = [21, 22, 23, 0, 5, 6, 12]
+    path = str(tmp_path / "window.xlsx")
+    pd.DataFrame([{
+        "platform": "taobao", "date": "2024-05-01", "user_nick": f"u{hour}", "shop_name": "tineco", "users": None,
+        "messages": json.dumps([{"time": f"2024-05-01T{hour:02d}:10:00+08:00", "sender_nick": "买家1", "content": {}}]),
+    } for hour in hours]).to_excel(path, index=False)
+
+    task_analyzer = analyzer.snapshot()
+    task_analyzer.filter_rules["early_morning_filter"].update(start_hour=22, end_hour=6)
+    result = task_analyzer.analyze_excel(path)
+
+    assert result.early_morning_count == 4
+    records = list(result._record_store)
+    assert [record.record_index for record in records] == [1, 2, 3, 4]
+    assert {record.filter_reason for record in records} == {"早晨消息(22-6点)"}
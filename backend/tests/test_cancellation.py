@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""取消和超时：排队中和执行中的任务（MAX_CONCURRENT_ANALYSIS为1，第一个任务停住时后续任务排队）"""
+
+import threading
+import time
+
+from app.api.endpoints import analysis
+from app.core.config import settings
+from app.services.result_cache import result_cache
+
+OTHER_RULES = {"staff_filter": False}
+
+
+def _wait_released(timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while result_cache.get_stats()["in_flight"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+def _start_running(upload, start_task, wait_task, chat_file):
+    """开始一个停住的任务占用执行槽位"""
+    file_id = upload(chat_file)
+    running = start_task(file_id, OTHER_RULES)["task_id"]
+    wait_task(running, {"processing"})
+    return file_id, running
+
+def test_cancel_pending_task(client, chat_file, upload, start_task, wait_task, task_status, blocking_analysis):
+    file_id, running = _start_running(upload, start_task, wait_task, chat_file)
+    pending = start_task(file_id)["task_id"]
+    assert task_status(pending)["queue_position"] == 1
+
+    response = client.delete(f"/api/analysis/tasks/{pending}")
+    assert response.json()["data"]["status"] == "cancelled"
+    assert task_status(pending)["status"] == "cancelled"
+    assert pending not in analysis.cancel_tokens
+    assert pending not in analysis.task_cache_keys
+
+    # 相同的请求重新执行，不附加到已取消的任务
+    again = start_task(file_id)
+    assert "coalesced_with" not in again
+    assert task_status(again["task_id"])["queue_position"] == 1
+
+    blocking_analysis.release.set()
+    assert wait_task(running)["status"] == "completed"
+    assert wait_task(again["task_id"])["status"] == "completed"
+    assert blocking_analysis.started == [file_id, file_id]
+
+def test_cancel_pending_leader_hands_off(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    file_id, running = _start_running(upload, start_task, wait_task, chat_file)
+    leader = start_task(file_id)["task_id"]
+    follower = start_task(file_id)
+    assert follower["coalesced_with"] == leader
+
+    client.delete(f"/api/analysis/tasks/{leader}")
+    assert wait_task(follower["task_id"], {"pending"})["coalesced_with"] is None
+
+    blocking_analysis.release.set()
+    assert wait_task(running)["status"] == "completed"
+    assert wait_task(follower["task_id"])["status"] == "completed"
+    assert wait_task(leader)["status"] == "cancelled"
+    _wait_released()
+
+def test_cancel_running_task_frees_slot(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    blocking_analysis.hold = 1
+    file_id, running = _start_running(upload, start_task, wait_task, chat_file)
+    pending = start_task(file_id)["task_id"]
+
+    client.delete(f"/api/analysis/tasks/{running}")
+    info = wait_task(running)
+    assert info["status"] == "cancelled"
+    assert wait_task(pending)["status"] == "completed"
+    assert running not in analysis.cancel_tokens
+
+def test_running_task_times_out(client, chat_file, upload, start_task, wait_task, blocking_analysis, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_TIMEOUT", 1)
+    _, running = _start_running(upload, start_task, wait_task, chat_file)
+
+    info = wait_task(running)
+    assert info["status"] == "failed"
+    assert "超时" in info["error_message"]
+    _wait_released()
+
+def test_queue_wait_not_counted_towards_timeout(client, chat_file, upload, start_task, wait_task,
+                                                 blocking_analysis, monkeypatch):
+    blocking_analysis.hold = 1
+    file_id, running = _start_running(upload, start_task, wait_task, chat_file)
+
+    # 排队的任务等待超过超时时间后才开始，超时从开始执行时计算
+    monkeypatch.setattr(settings, "ANALYSIS_TIMEOUT", 1)
+    pending = start_task(file_id)["task_id"]
+    threading.Timer(1.5, blocking_analysis.release.set).start()
+
+    assert wait_task(running)["status"] == "completed"
+    assert wait_task(pending)["status"] == "completed"
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""相同分析请求合并：执行的任务取消或超时后，附加的任务接替执行"""
+
+import time
+
+from app.core.config import settings
+from app.services.result_cache import result_cache
+
+
+def _result(client, task_id):
+    response = client.get(f"/api/analysis/tasks/{task_id}/result")
+    assert response.status_code == 200, response.text
+    return response.json()["data"]["result"]
+
+def _wait_released(timeout: float = 10):
+    """等待执行的任务结束并解除进行中登记（取消接口返回时任务可能还未结束）"""
+    deadline = time.monotonic() + timeout
+    while result_cache.get_stats()["in_flight"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+def _start_coalesced(upload, start_task, wait_task, chat_file):
+    file_id = upload(chat_file)
+    leader = start_task(file_id)["task_id"]
+    wait_task(leader, {"processing"})
+    follower = start_task(file_id)
+    assert follower["coalesced_with"] == leader
+    return file_id, leader, follower["task_id"]
+
+def test_leader_cancelled_follower_completes(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    blocking_analysis.hold = 1
+    _, leader, follower = _start_coalesced(upload, start_task, wait_task, chat_file)
+
+    assert client.delete(f"/api/analysis/tasks/{leader}").status_code == 200
+    assert wait_task(leader)["status"] == "cancelled"
+
+    info = wait_task(follower)
+    assert info["status"] == "completed", info
+    assert info["coalesced_with"] is None
+    assert _result(client, follower)["total_records"] == 2000
+    assert len(blocking_analysis.started) == 2
+    _wait_released()
+
+def test_leader_timeout_follower_completes(client, chat_file, upload, start_task, wait_task,
+                                           blocking_analysis, monkeypatch):
+    blocking_analysis.hold = 1
+    monkeypatch.setattr(settings, "ANALYSIS_TIMEOUT", 1)
+    _, leader, follower = _start_coalesced(upload, start_task, wait_task, chat_file)
+
+    info = wait_task(leader)
+    assert info["status"] == "failed"
+    assert "超时" in info["error_message"]
+
+    assert wait_task(follower)["status"] == "completed"
+    assert _result(client, follower)["total_records"] == 2000
+
+def test_remaining_followers_wait_for_new_leader(client, chat_file, upload, start_task, wait_task,
+                                                 blocking_analysis):
+    file_id, leader, first = _start_coalesced(upload, start_task, wait_task, chat_file)
+    second = start_task(file_id)
+    assert second["coalesced_with"] == leader
+
+    client.delete(f"/api/analysis/tasks/{leader}")
+    wait_task(first, {"processing"})
+    info = wait_task(second["task_id"], {"pending"})
+    assert info["coalesced_with"] == first
+
+    blocking_analysis.release.set()
+    assert wait_task(first)["status"] == "completed"
+    assert wait_task(second["task_id"])["status"] == "completed"
+    assert len(blocking_analysis.started) == 2
+
+def test_cancelled_follower_is_not_promoted(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    _, leader, follower = _start_coalesced(upload, start_task, wait_task, chat_file)
+
+    client.delete(f"/api/analysis/tasks/{follower}")
+    client.delete(f"/api/analysis/tasks/{leader}")
+    assert wait_task(leader)["status"] == "cancelled"
+    assert wait_task(follower)["status"] == "cancelled"
+    _wait_released()
+    assert len(blocking_analysis.started) == 1
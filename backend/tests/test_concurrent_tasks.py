@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""并发分析：同时执行的任务使用各自的配置快照和结果缓冲，每个结果与单独分析的结果一致"""
+
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.api.endpoints import analysis
+from app.services.analyzer import analyzer
+from app.services.task_scheduler import AnalysisScheduler
+
+RULES = ["early_morning_filter", "staff_filter", "service_assistant_filter", "address_confirm_filter"]
+# 规则启用组合（None为不覆盖）
+OVERRIDES = [None] + [{rule: False} for rule in RULES] + [
+    {"early_morning_filter": False, "staff_filter": False},
+    {"service_assistant_filter": False, "address_confirm_filter": False},
+    dict.fromkeys(RULES, False),
+]
+_VOLATILE_FIELDS = {"rule_stats", "json_backend", "filtered_records_details"}
+
+
+def _reference(path, overrides):
+    result = analyzer.snapshot(overrides).analyze_excel(path)
+    return (
+        jsonable_encoder(result.model_dump(exclude=_VOLATILE_FIELDS)),
+        jsonable_encoder([record.model_dump(exclude={"raw_data"}) for record in result._record_store])
+    )
+
+@pytest.fixture(scope="module")
+def chat_files(make_chat_file):
+    return [make_chat_file(1500, seed) for seed in (11, 12)]
+
+@pytest.fixture(scope="module")
+def references(chat_files):
+    return {(path, index): _reference(path, overrides)
+            for path in chat_files for index, overrides in enumerate(OVERRIDES)}
+
+def test_overrides_take_effect(references, chat_files):
+    summary, details = references[(chat_files[0], RULES.index("staff_filter") + 1)]
+    assert summary["staff_involved_count"] == 0
+    assert all(record["filter_type"] != "staff_involvement" for record in details)
+    summary, details = references[(chat_files[0], len(OVERRIDES) - 1)]
+    assert summary["filtered_records"] == summary["parse_error_count"] + summary["empty_records_count"]
+
+def test_concurrent_snapshots_do_not_interfere(chat_files, references):
+    jobs = list(itertools.product(chat_files, range(len(OVERRIDES)))) * 2
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda job: _reference(job[0], OVERRIDES[job[1]]), jobs))
+    for job, result in zip(jobs, results):
+        assert result == references[job], job
+
+def test_overlapping_api_tasks(client, chat_files, references, upload, start_task, wait_task, monkeypatch):
+    monkeypatch.setattr(analysis, "scheduler", AnalysisScheduler(4, 100))
+    file_ids = {path: upload(path) for path in chat_files}
+
+    tasks = {}
+    for path, index in itertools.product(chat_files, range(len(OVERRIDES))):
+        tasks[start_task(file_ids[path], OVERRIDES[index])["task_id"]] = (path, index)
+
+    for task_id, job in tasks.items():
+        assert wait_task(task_id)["status"] == "completed"
+        result = client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"]
+        details = [{key: value for key, value in record.items() if key != "raw_data"}
+                   for record in result["filtered_records_details"]]
+        summary = {key: value for key, value in result.items() if key not in _VOLATILE_FIELDS}
+        assert (summary, details) == references[job], job
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""全文件校验：错误分页与逐行检查一致，索引保存在元数据存储中，分析时跳过已知无效的记录"""
+
+import os
+import time
+
+import pytest
+
+from app.services import analyzer as analyzer_module
+from app.services import deep_validator
+from app.services.analyzer import analyzer
+
+from conftest import make_chat_frame
+
+_VOLATILE_FIELDS = {"rule_stats", "json_backend", "filtered_records_details"}
+
+
+@pytest.fixture(scope="module")
+def invalid_file(tmp_path_factory):
+    """
+    包含各类messages错误的文件
+
+    Returns:
+        (文件路径, 按行号排列的(行号, 错误类别))
+    """
+    frame = make_chat_frame(600, seed=41)
+    for row in range(150, 600, 37):
+        frame.at[row, "messages"] = '{"not": "a list"}'
+    for row in range(160, 600, 53):
+        frame.at[row, "messages"] = 5
+    expected = []
+    for row, value in frame["messages"].items():
+        if value == "{bad json":
+            expected.append((row, "json_error"))
+        elif value == '{"not": "a list"}':
+            expected.append((row, "not_list"))
+        elif value == 5:
+            expected.append((row, "invalid_type"))
+    path = str(tmp_path_factory.mktemp("validation") / "invalid.xlsx")
+    frame.to_excel(path, index=False)
+    return path, expected
+
+@pytest.fixture(scope="module")
+def validated_file(client, invalid_file):
+    path, _ = invalid_file
+    with open(path, "rb") as f:
+        response = client.post("/api/upload/", params={"deep_validation": True},
+                               files={"file": (os.path.basename(path), f)})
+    file_id = response.json()["data"]["file_id"]
+    deadline = time.monotonic() + 60
+    while client.get(f"/api/upload/files/{file_id}/validation-errors").json()["data"]["status"] != "completed":
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return file_id
+
+def _all_errors(client, file_id, page_size, error_class=None):
+    errors, page = [], 1
+    while True:
+        params = {"page": page, "page_size": page_size}
+        if error_class:
+            params["error_class"] = error_class
+        data = client.get(f"/api/upload/files/{file_id}/validation-errors", params=params).json()["data"]
+        if not data["errors"]:
+            return errors, data
+        errors.extend(data["errors"])
+        page += 1
+
+def test_validation_error_pages(client, invalid_file, validated_file):
+    _, expected = invalid_file
+    errors, data = _all_errors(client, validated_file, 7)
+    assert [(error["record_index"], error["error_class"]) for error in errors] == expected
+    assert all(error["row"] == error["record_index"] + 2 and error["column"] == "messages" for error in errors)
+    assert data["total_count"] == data["total_errors"] == len(expected)
+    assert data["total_pages"] == (len(expected) + 6) // 7
+    assert data["checked_rows"] == data["total_rows"] == 600
+
+    for error_class in ("json_error", "not_list", "invalid_type", "no_such_class"):
+        errors, data = _all_errors(client, validated_file, 5, error_class)
+        assert [error["record_index"] for error in errors] == [row for row, name in expected if name == error_class]
+        assert data["total_count"] == data["error_counts"].get(error_class, 0)
+
+def test_index_survives_restart(client, invalid_file, validated_file, monkeypatch):
+    _, expected = invalid_file
+    before = _all_errors(client, validated_file, 50)
+    # 模拟服务重启：内存中的索引清空后从元数据存储读取
+    monkeypatch.setattr(deep_validator, "validation_indexes", {})
+    assert _all_errors(client, validated_file, 50) == before
+    assert deep_validator.get_skippable_rows(validated_file).tolist() == [row for row, _ in expected]
+
+def test_missing_index(client, chat_file, upload):
+    assert client.get("/api/upload/files/no-such-file/validation-errors").status_code == 404
+    assert client.get(f"/api/upload/files/{upload(chat_file)}/validation-errors").status_code == 404
+
+def test_analysis_skips_known_bad_rows(client, invalid_file, validated_file, start_task, wait_task, monkeypatch):
+    path, expected = invalid_file
+    masked = []
+    mask = analyzer_module._mask_known_bad_rows
+
+    def mask_known_bad_rows(frames, bad_rows):
+        masked.extend(bad_rows.tolist())
+        return mask(frames, bad_rows)
+
+    monkeypatch.setattr(analyzer_module, "_mask_known_bad_rows", mask_known_bad_rows)
+    monkeypatch.setattr(deep_validator, "validation_indexes", {})
+    task_id = start_task(validated_file)["task_id"]
+    assert wait_task(task_id)["status"] == "completed"
+
+    assert masked == [row for row, _ in expected]
+    result = client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"]
+    reference = analyzer.snapshot().analyze_excel(path).model_dump(mode="json", exclude=_VOLATILE_FIELDS)
+    assert {key: value for key, value in result.items() if key not in _VOLATILE_FIELDS} == reference
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""规则特征表：匹配位集和重叠统计与手工构造的记录一致，首个命中归因与分析时的规则优先级一致"""
+
+import time
+
+import numpy as np
+import pytest
+
+from app.services.feature_table import ROW_EMPTY, RowFeatureTable
+from app.services.rules import FILTER_RULE_SPECS
+
+RULES = [spec[0] for spec in FILTER_RULE_SPECS]
+EARLY, STAFF, ASSISTANT, ADDRESS = (1 << code for code in range(len(RULES)))
+ENABLED = {rule: {"enabled": True} for rule in RULES}
+
+# (小时掩码, 售后人员, 全部为服务助手消息, 含地址确认, 检查出错的规则位掩码)；None为空记录，"error"为解析错误
+ROWS = [
+    (1 << 7, "客服A", True, True, 0),
+    (1 << 2 | 1 << 20, "客服B", True, True, 0),
+    (1 << 3, "客服A", False, False, 0),
+    (1 << 12, None, True, True, 0),
+    (1 << 1, None, False, False, 0),
+    (1 << 12, "客服B", False, False, 0),
+    (1 << 5, None, False, True, EARLY),
+    None,
+    "error",
+    (1 << 12, None, False, False, 0),
+]
+
+
+@pytest.fixture
+def table():
+    """手工构造的特征表（分两批写入）"""
+    table = RowFeatureTable()
+    for first_row in (0, 6):
+        batch = ROWS[first_row:first_row + 6]
+        table.begin_frame(first_row, len(batch))
+        for row, features in enumerate(batch, first_row):
+            if features is None:
+                table.set_status(row, ROW_EMPTY)
+            elif features != "error":
+                hour_mask, staff_name, assistant, address, error_rules = features
+                table.set_row(row, hour_mask, staff_name, assistant, address, error_rules, 0)
+    table.freeze(ENABLED)
+    return table
+
+def test_rule_match_codes(table):
+    assert table.rule_match_codes(ENABLED).tolist() == [
+        EARLY | STAFF | ASSISTANT | ADDRESS,
+        EARLY | STAFF | ASSISTANT | ADDRESS,
+        EARLY | STAFF,
+        ASSISTANT | ADDRESS,
+        EARLY,
+        STAFF,
+        ADDRESS,  # 早晨消息规则检查出错，不算匹配
+        0, 0, 0,
+    ]
+    # 早晨时间窗口改为10-13点
+    window = {**ENABLED, "early_morning_filter": {"enabled": True, "start_hour": 10, "end_hour": 13}}
+    assert table.rule_match_codes(window).tolist()[:6] == [
+        STAFF | ASSISTANT | ADDRESS,
+        STAFF | ASSISTANT | ADDRESS,
+        STAFF,
+        EARLY | ASSISTANT | ADDRESS,
+        0,
+        EARLY | STAFF,
+    ]
+
+def test_rule_overlap(table):
+    overlap = table.rule_overlap(ENABLED)
+    early, staff, assistant, address = RULES
+    assert overlap["matrix"] == {
+        early: {early: 4, staff: 3, assistant: 2, address: 2},
+        staff: {early: 3, staff: 4, assistant: 2, address: 2},
+        assistant: {early: 2, staff: 2, assistant: 3, address: 3},
+        address: {early: 2, staff: 2, assistant: 3, address: 4},
+    }
+    assert overlap["all_rules"] == 2
+    assert overlap["exclusive_counts"] == {early: 1, staff: 1, assistant: 0, address: 1}
+    assert overlap["any_rule"] == 7
+
+def test_evaluate_attributes_first_hit(table):
+    counters = table.evaluate(ENABLED)
+    assert counters == {
+        "total_records": 10,
+        "empty_records_count": 1,
+        "parse_error_count": 2,
+        "early_morning_count": 4,
+        "staff_involved_count": 1,
+        "service_assistant_count": 1,
+        "address_confirm_count": 0,
+        "filtered_records": 9,
+    }
+    # 关闭早晨消息规则后，检查出错的记录由地址确认规则命中
+    counters = table.evaluate({**ENABLED, "early_morning_filter": {"enabled": False}})
+    assert counters["staff_involved_count"] == 4
+    assert counters["address_confirm_count"] == 1
+    assert counters["parse_error_count"] == 1
+
+@pytest.mark.benchmark
+def test_overlap_at_1m_rows():
+    """100万行特征表上的规则重叠统计和重新计算计数器的耗时"""
+    rows = 1_000_000
+    rng = np.random.default_rng(0)
+    hour_masks = (np.uint32(1) << rng.integers(0, 24, rows).astype(np.uint32))
+    staff_names = np.array([None, "客服A", "客服B"], dtype=object)[rng.integers(0, 3, rows) * (rng.random(rows) < 0.1)]
+    assistant = rng.random(rows) < 0.2
+    address = rng.random(rows) < 0.15
+
+    table = RowFeatureTable()
+    table.begin_frame(0, rows)
+    table.set_frame(np.arange(rows), np.empty(0, dtype=np.int64), hour_masks, staff_names, assistant, address)
+    table.freeze(ENABLED)
+
+    started = time.perf_counter()
+    overlap = table.rule_overlap(ENABLED)
+    overlap_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    table.evaluate(ENABLED)
+    evaluate_seconds = time.perf_counter() - started
+
+    matches = [(hour_masks & np.uint32(0xFF)) != 0, staff_names != None, assistant, address]  # noqa: E711
+    for i, rule_a in enumerate(RULES):
+        for j, rule_b in enumerate(RULES):
+            assert overlap["matrix"][rule_a][rule_b] == int(np.count_nonzero(matches[i] & matches[j]))
+    assert overlap["all_rules"] == int(np.count_nonzero(np.logical_and.reduce(matches)))
+    print(f"{rows} 行: 规则重叠 {overlap_seconds * 1000:.0f} ms, 重新计算计数器 {evaluate_seconds * 1000:.0f} ms")
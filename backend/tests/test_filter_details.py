@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""过滤详情分页和按记录ID查找：索引查询与线性扫描的结果一致"""
+
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.record_store import FilteredRecordStore
+
+FILTER_TYPES = ["early_morning", "staff_involvement", "service_assistant", "address_confirmation", "parse_error"]
+
+
+@pytest.fixture(scope="module")
+def completed_task(client, chat_file):
+    with open(chat_file, "rb") as f:
+        file_id = client.post("/api/upload/", files={"file": ("details.xlsx", f)}).json()["data"]["file_id"]
+    task_id = client.post("/api/analysis/start", json={"file_id": file_id}).json()["data"]["task_id"]
+    deadline = time.monotonic() + 60
+    while client.get(f"/api/analysis/tasks/{task_id}").json()["data"]["status"] != "completed":
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    details = client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"]["filtered_records_details"]
+    return task_id, details
+
+def test_filter_details_pages_match_linear_scan(client, completed_task, chat_file):
+    task_id, details = completed_task
+    source = pd.read_excel(chat_file)
+    filter_types = {record["filter_type"] for record in details} | {"no_such_type"}
+
+    for filter_type in filter_types:
+        expected = [{key: value for key, value in record.items() if key != "raw_data"}
+                    for record in details if record["filter_type"] == filter_type]
+        paged, page = [], 1
+        while True:
+            response = client.get(f"/api/analysis/tasks/{task_id}/filter-details/{filter_type}",
+                                  params={"page": page, "page_size": 37})
+            data = response.json()["data"]
+            assert data["total_count"] == len(expected)
+            if not data["records"]:
+                break
+            paged.extend(data["records"])
+            page += 1
+        assert data["total_pages"] == (len(expected) + 36) // 37
+        for record in paged:
+            # 当前页的原始数据从源文件按行号加载
+            assert record.pop("raw_data")["user_nick"] == source.at[record["record_index"], "user_nick"]
+        assert paged == expected
+
+def test_chat_record_lookup(client, completed_task):
+    task_id, details = completed_task
+    for record in random.Random(0).sample(details, 50):
+        response = client.get(f"/api/analysis/tasks/{task_id}/chat-record/{record['record_id']}")
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["filter_info"]["filter_type"] == record["filter_type"]
+        assert data["filter_info"]["filter_reason"] == record["filter_reason"]
+        assert data["raw_data"]["user_nick"] == f"u{record['record_index']}"
+
+    filtered = {record["record_index"] for record in details}
+    prefix = details[0]["record_id"][:-6]
+    kept = next(index for index in range(2000) if index not in filtered)
+    for record_id in (f"{prefix}{kept:06d}", f"{prefix}{kept}", f"{prefix}abc", "CHT_19990101_000001", "x"):
+        response = client.get(f"/api/analysis/tasks/{task_id}/chat-record/{record_id}")
+        assert response.status_code == 404, record_id
+
+def test_indexes_at_500k_records():
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, len(FILTER_TYPES), 500_000)
+    record_indexes = np.sort(rng.choice(2_000_000, 500_000, replace=False))
+
+    store = FilteredRecordStore("20240501")
+    for record_index, code in zip(record_indexes.tolist(), codes.tolist()):
+        store.append(FILTER_TYPES[code], "原因", record_index)
+    store.freeze()
+
+    for code, filter_type in enumerate(FILTER_TYPES):
+        assert np.array_equal(store.positions_of_type(filter_type), np.flatnonzero(codes == code))
+
+    started = time.perf_counter()
+    for page in range(1000):
+        positions = store.positions_of_type(FILTER_TYPES[page % len(FILTER_TYPES)])
+        records = store.records(positions[page * 50:(page + 1) * 50])
+        assert [record.record_index for record in records] == record_indexes[positions[page * 50:(page + 1) * 50]].tolist()
+    for position in rng.integers(0, 500_000, 1000).tolist():
+        assert store.position_of(store.record_id(int(record_indexes[position]))) == position
+    # 每次查询只与页大小有关：1000次分页和1000次查找远小于一次线性扫描的总耗时
+    assert time.perf_counter() - started < 5
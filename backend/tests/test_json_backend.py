@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""JSON解码后端：各后端的解码结果、失败位置和分析结果一致"""
+
+import json
+import time
+
+import pytest
+
+from app.core import json_backend
+from app.core.config import settings
+from app.core.json_backend import DecodeFailure, _create_decoder
+from app.services import analyzer as analyzer_module
+from app.services import columnar_engine
+from app.services.analyzer import analyzer
+from conftest import make_chat_frame
+
+BACKENDS = ["json"] + (["orjson"] if json_backend.orjson is not None else [])
+
+VALUES = [
+    '[{"time": "2024-05-01T07:59:00+08:00", "sender_nick": "客服A", "content": {"text": "你好"}}]',
+    '[]',
+    '{"a": 1}',
+    '[NaN, Infinity]',
+    '"\\ud800"',
+    '{bad json',
+    '',
+    '  [1, 2]  ',
+    '[1, 2',
+    'null',
+]
+
+
+def _decoded(decoder, value):
+    try:
+        return decoder.loads(value)
+    except Exception as e:
+        return type(e)
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_loads_matches_stdlib(backend):
+    decoder = _create_decoder(backend)
+    assert decoder.name == backend
+    reference = _create_decoder("json")
+    for value in VALUES:
+        # 按repr比较：NaN与自身不相等
+        assert repr(_decoded(decoder, value)) == repr(_decoded(reference, value)), value
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_decode_batch_marks_failures_in_place(backend):
+    decoded = _create_decoder(backend).decode_batch(VALUES)
+    assert len(decoded) == len(VALUES)
+    for value, item in zip(VALUES, decoded):
+        try:
+            expected = json.loads(value)
+        except ValueError:
+            assert isinstance(item, DecodeFailure)
+            assert isinstance(item.error, ValueError)
+        else:
+            assert repr(item) == repr(expected)
+
+def test_clean_batch_decodes_in_one_pass():
+    values = make_chat_frame(200)["messages"].dropna().tolist()
+    values = [value for value in values if value.startswith("[")]
+    assert _create_decoder("auto").decode_batch(values) == [json.loads(value) for value in values]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("engine", ["row", "columnar"])
+def test_analysis_result_independent_of_backend(chat_file, monkeypatch, backend, engine):
+    monkeypatch.setattr(settings, "ANALYSIS_ENGINE", engine)
+    reference = analyzer.snapshot().analyze_excel(chat_file)
+
+    decoder = _create_decoder(backend)
+    for module in (json_backend, analyzer_module, columnar_engine):
+        monkeypatch.setattr(module, "json_decoder", decoder)
+    result = analyzer.snapshot().analyze_excel(chat_file)
+
+    assert result.json_backend == backend
+    exclude = {"rule_stats", "json_backend", "filtered_records_details"}
+    assert result.model_dump(exclude=exclude) == reference.model_dump(exclude=exclude)
+    assert list(result._record_store) == list(reference._record_store)
+
+@pytest.mark.benchmark
+def test_backend_decode_speed():
+    """真实结构的messages值在各后端的解码耗时"""
+    values = [value for value in make_chat_frame(50_000, seed=5)["messages"].dropna() if value.startswith("[")]
+    timings = {}
+    for backend in BACKENDS:
+        decoder = _create_decoder(backend)
+        started = time.perf_counter()
+        decoder.decode_batch(values)
+        timings[backend] = time.perf_counter() - started
+        print(f"{backend}: {len(values) / timings[backend]:,.0f} values/s")
+    if "orjson" in timings:
+        assert timings["orjson"] < timings["json"]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""日志：逐行错误按任务采样限流并汇总省略条数，环形缓冲区保留最近的日志，/api/system/logs按级别和任务过滤"""
+
+import logging
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.logger import ErrorSampler, RingBufferHandler, TaskContextFilter, task_context
+
+
+class _Collector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+@pytest.fixture
+def collected():
+    """独立的日志器，记录写入列表"""
+    logger = logging.getLogger("tests.sampler")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    collector = _Collector()
+    logger.addHandler(collector)
+    yield logger, collector.records
+    logger.removeHandler(collector)
+
+def test_sampler_caps_burst(collected, monkeypatch):
+    logger, records = collected
+    monkeypatch.setattr(settings, "LOG_SAMPLE_FIRST", 5)
+    monkeypatch.setattr(settings, "LOG_SAMPLE_EVERY", 100)
+    monkeypatch.setattr(settings, "LOG_RATE_LIMIT", 1000)
+
+    sampler = ErrorSampler(logger)
+    for index in range(10_000):
+        sampler.log(logging.WARNING, "处理记录 %d 时出错", index)
+    # 前5条全部记录，之后每100条记录一条
+    assert [record.getMessage() for record in records[:6]] == [f"处理记录 {index} 时出错" for index in (0, 1, 2, 3, 4, 99)]
+    assert len(records) == 5 + 100
+    assert sampler.count == 10_000 and sampler.suppressed == 10_000 - 105
+
+    sampler.summary("解析错误")
+    assert records[-1].levelno == logging.WARNING
+    assert records[-1].getMessage() == "解析错误共 10000 条，省略了其中 9895 条的日志"
+
+    # 每个任务使用独立的采样器
+    ErrorSampler(logger).log(logging.WARNING, "另一个任务")
+    assert records[-1].getMessage() == "另一个任务"
+
+def test_sampler_rate_limit(collected, monkeypatch):
+    logger, records = collected
+    monkeypatch.setattr(settings, "LOG_SAMPLE_FIRST", 10_000)
+    monkeypatch.setattr(settings, "LOG_RATE_LIMIT", 50)
+
+    sampler = ErrorSampler(logger)
+    started = time.monotonic()
+    for index in range(10_000):
+        sampler.log(logging.ERROR, "记录 %d", index)
+    elapsed = time.monotonic() - started
+    assert 50 <= len(records) <= 50 + elapsed * 50 + 1
+    assert sampler.suppressed == 10_000 - len(records)
+
+    # 没有省略时不记录汇总
+    quiet = ErrorSampler(logger)
+    quiet.log(logging.ERROR, "一条")
+    quiet.summary("解析错误")
+    assert records[-1].getMessage() == "一条"
+
+def test_ring_buffer_evicts_oldest():
+    buffer = RingBufferHandler(5)
+    buffer.addFilter(TaskContextFilter())
+    logger = logging.getLogger("tests.ring_buffer")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(buffer)
+    try:
+        for index in range(8):
+            with task_context("t1" if index % 2 else None):
+                logger.info("消息 %d", index)
+    finally:
+        logger.removeHandler(buffer)
+
+    logs = buffer.get_logs()
+    assert [entry["message"] for entry in logs["logs"]] == [f"消息 {index}" for index in (7, 6, 5, 4, 3)]
+    assert logs["total"] == 5
+    assert [entry["message"] for entry in buffer.get_logs(task_id="t1")["logs"]] == ["消息 7", "消息 5", "消息 3"]
+
+def test_system_logs_endpoint(client):
+    logger = logging.getLogger("app.tests")
+    for task_id in ("log-task-1", "log-task-2"):
+        with task_context(task_id):
+            logger.info("%s 开始", task_id)
+            logger.warning("%s 警告", task_id)
+            logger.error("%s 出错", task_id)
+
+    deadline = time.monotonic() + 5
+    while True:
+        data = client.get("/api/system/logs", params={"task_id": "log-task-2"}).json()["data"]
+        if data["total"] == 3:
+            break
+        assert time.monotonic() < deadline, data
+        time.sleep(0.02)
+
+    assert set(data) == {"logs", "total"}
+    assert [entry["message"] for entry in data["logs"]] == ["log-task-2 出错", "log-task-2 警告", "log-task-2 开始"]
+    assert set(data["logs"][0]) == {"timestamp", "level", "logger", "task_id", "message"}
+
+    data = client.get("/api/system/logs", params={"level": "warning", "task_id": "log-task-1"}).json()["data"]
+    assert [(entry["level"], entry["message"]) for entry in data["logs"]] == [
+        ("ERROR", "log-task-1 出错"), ("WARNING", "log-task-1 警告")]
+    assert data["total"] == 2
+
+    data = client.get("/api/system/logs", params={"level": "ERROR", "limit": 1}).json()["data"]
+    assert len(data["logs"]) == 1 and data["total"] >= 2
+
+    assert client.get("/api/system/logs", params={"level": "LOUD"}).status_code == 400
+    assert client.get("/api/system/logs", params={"limit": 0}).status_code == 400
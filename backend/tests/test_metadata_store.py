@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""元数据存储：重启后上传文件、任务和结果仍可查询，未完成的任务标记为失败，非SQLite地址使用内存数据库"""
+
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import pytest
+
+from app.api.endpoints import analysis, upload as upload_endpoint
+from app.core.config import settings
+from app.models.schemas import AnalysisResult
+from app.services.metadata_store import MetadataStore
+
+
+def _task(task_id, status, **fields):
+    return {"task_id": task_id, "file_id": "file", "filename": "chat.xlsx", "status": status,
+            "created_time": datetime.now(), "progress": 0.0, **fields}
+
+def test_warm_start(client, chat_file, upload, start_task, wait_task, monkeypatch):
+    file_id = upload(chat_file)
+    task_id = start_task(file_id)["task_id"]
+    assert wait_task(task_id)["status"] == "completed"
+    before = client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"]
+    page = client.get(f"/api/analysis/tasks/{task_id}/filter-details/early_morning").json()["data"]
+
+    # 模拟服务重启：新的存储实例打开同一个数据库文件，进程内缓存清空
+    store = MetadataStore(settings.DATABASE_URL)
+    for module in (analysis, upload_endpoint):
+        monkeypatch.setattr(module, "metadata_store", store)
+    monkeypatch.setattr(analysis, "analysis_tasks", {})
+    monkeypatch.setattr(analysis, "finished_tasks", OrderedDict())
+    monkeypatch.setattr(upload_endpoint, "uploaded_files", {})
+
+    response = client.get(f"/api/upload/files/{file_id}")
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["file_id"] == file_id
+
+    task = client.get(f"/api/analysis/tasks/{task_id}").json()["data"]
+    assert task["status"] == "completed" and task["progress"] == 100.0
+    assert client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"] == before
+    assert client.get(f"/api/analysis/tasks/{task_id}/filter-details/early_morning").json()["data"] == page
+    assert task_id in {task["task_id"] for task in client.get("/api/analysis/tasks").json()["data"]["tasks"]}
+
+def test_recover_tasks_marks_unfinished_failed(tmp_path, monkeypatch):
+    store = MetadataStore(f"sqlite:///{tmp_path / 'metadata.db'}")
+    monkeypatch.setattr(analysis, "metadata_store", store)
+    for task_id, status in (("pending", "pending"), ("processing", "processing"), ("completed", "completed")):
+        store.save_task(_task(task_id, status))
+
+    analysis.recover_tasks()
+    for task_id in ("pending", "processing"):
+        task = store.get_task(task_id)
+        assert task["status"] == "failed"
+        assert task["error_message"] == "服务重启，任务已中断"
+        assert task["completed_time"] is not None
+    assert store.get_task("completed")["status"] == "completed"
+    assert store.get_task_stats()["status_counts"] == {"failed": 2, "completed": 1}
+
+def test_recover_tasks_leaves_queued_tasks_to_workers(tmp_path, monkeypatch):
+    store = MetadataStore(f"sqlite:///{tmp_path / 'metadata.db'}")
+    monkeypatch.setattr(analysis, "metadata_store", store)
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "sqlite")
+    store.save_task(_task("processing", "processing"))
+
+    analysis.recover_tasks()
+    assert store.get_task("processing")["status"] == "processing"
+
+@pytest.mark.parametrize("database_url", ["postgresql://user@localhost/chat", "sqlite:///:memory:"])
+def test_in_memory_fallback(database_url):
+    store = MetadataStore(database_url)
+    assert not store.persistent
+    file_id, task_id = uuid.uuid4().hex, uuid.uuid4().hex
+
+    store.save_file({"file_id": file_id, "filename": "chat.xlsx", "file_size": 10, "upload_time": datetime.now(),
+                     "status": "uploaded", "file_path": "/tmp/chat.xlsx", "validation_info": {"total_rows": 3}})
+    assert store.get_file(file_id)["validation_info"] == {"total_rows": 3}
+
+    result = AnalysisResult(total_records=3, filtered_records=1, valid_records=2, filter_rate=33.33)
+    result_id = store.save_result(uuid.uuid4().hex, result)
+    store.save_task(_task(task_id, "completed", result=store.load_result(result_id)))
+    assert store.get_task(task_id)["result_id"] == result_id
+    assert store.load_result(result_id).model_dump() == result.model_dump()
+
+    store.delete_task(task_id)
+    assert store.get_task(task_id) is None and not store.has_result(result_id)
+    assert store.get_storage_stats()["persistent"] is False
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""进度推送：SSE和WebSocket推送到结束状态后关闭，删除的任务推送deleted事件"""
+
+import json
+import threading
+import time
+
+import pytest
+
+
+def _sse_events(body: str):
+    """解析SSE响应为(事件名, 数据)列表，忽略心跳注释"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = [line for line in block.split("\n") if not line.startswith(":")]
+        if lines:
+            fields = dict(line.split(": ", 1) for line in lines)
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_sse_stream_ends_with_terminal_event(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    task_id = start_task(upload(chat_file))["task_id"]
+    wait_task(task_id, {"processing"})
+    # 测试客户端读取完整响应后才返回，由定时器放行分析
+    threading.Timer(0.5, blocking_analysis.release.set).start()
+
+    response = client.get(f"/api/analysis/tasks/{task_id}/events")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+
+    assert [name for name, _ in events] == ["progress"] * len(events)
+    assert events[0][1]["status"] == "processing"
+    assert events[-1][1]["status"] == "completed"
+    assert events[-1][1]["progress"] == 100.0
+    assert all(data["status"] != "completed" for _, data in events[:-1])
+    assert "result" not in events[-1][1]
+
+def test_sse_for_finished_and_missing_tasks(client, chat_file, upload, start_task, wait_task):
+    task_id = start_task(upload(chat_file))["task_id"]
+    wait_task(task_id)
+    events = _sse_events(client.get(f"/api/analysis/tasks/{task_id}/events").text)
+    assert len(events) == 1 and events[0][1]["status"] == "completed"
+
+    assert client.get("/api/analysis/tasks/no-such-task/events").status_code == 404
+
+def test_sse_reports_cancelled_pending_task(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    file_id = upload(chat_file)
+    running = start_task(file_id, {"staff_filter": False})["task_id"]
+    wait_task(running, {"processing"})
+    pending = start_task(file_id)["task_id"]
+    threading.Timer(0.3, client.delete, args=(f"/api/analysis/tasks/{pending}",)).start()
+
+    events = _sse_events(client.get(f"/api/analysis/tasks/{pending}/events").text)
+    assert events[0][1]["status"] == "pending"
+    assert events[0][1]["queue_position"] == 1
+    assert events[-1][1]["status"] == "cancelled"
+
+    blocking_analysis.release.set()
+    wait_task(running)
+
+def test_websocket_multiplexes_tasks(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    file_id = upload(chat_file)
+    first = start_task(file_id, {"staff_filter": False})["task_id"]
+    wait_task(first, {"processing"})
+    second = start_task(file_id)["task_id"]
+
+    final, deleted = {}, []
+    with client.websocket_connect("/api/analysis/ws") as websocket:
+        websocket.send_json({"subscribe": [first, second, "no-such-task"]})
+        blocking_analysis.release.set()
+        # 各任务的事件顺序不固定
+        while len(final) < 2 or not deleted:
+            message = websocket.receive_json()
+            if message["event"] == "deleted":
+                deleted.append(message["data"]["task_id"])
+            elif message["data"]["status"] in ("completed", "failed", "cancelled"):
+                assert message["data"]["task_id"] not in final
+                final[message["data"]["task_id"]] = message["data"]["status"]
+
+    assert final == {first: "completed", second: "completed"}
+    assert deleted == ["no-such-task"]
+
+def test_websocket_reports_deleted_task(client, chat_file, upload, start_task, wait_task, blocking_analysis):
+    file_id = upload(chat_file)
+    running = start_task(file_id, {"staff_filter": False})["task_id"]
+    wait_task(running, {"processing"})
+    pending = start_task(file_id)["task_id"]
+
+    with client.websocket_connect("/api/analysis/ws") as websocket:
+        websocket.send_json({"subscribe": [pending]})
+        assert websocket.receive_json()["data"]["status"] == "pending"
+        client.delete(f"/api/analysis/tasks/{pending}")
+        assert websocket.receive_json()["data"]["status"] == "cancelled"
+
+    blocking_analysis.release.set()
+    wait_task(running)
+
+@pytest.mark.benchmark
+def test_request_volume_against_polling(client, upload_large, start_task):
+    """20个标签页查看同一个任务：每秒轮询一次与SSE订阅的请求数和推送的更新数"""
+    file_id = upload_large(100_000, seed=9)
+    tabs = 20
+
+    task_id = start_task(file_id, {"staff_filter": False})["task_id"]
+    polls = 0
+    started = time.monotonic()
+    while True:
+        statuses = [client.get(f"/api/analysis/tasks/{task_id}").json()["data"]["status"] for _ in range(tabs)]
+        polls += tabs
+        if statuses[-1] in ("completed", "failed", "cancelled"):
+            break
+        time.sleep(1)
+    polling_seconds = time.monotonic() - started
+
+    task_id = start_task(file_id, {"address_confirm_filter": False})["task_id"]
+    results = []
+    streams = [threading.Thread(target=lambda: results.append(
+        _sse_events(client.get(f"/api/analysis/tasks/{task_id}/events").text))) for _ in range(tabs)]
+    started = time.monotonic()
+    for stream in streams:
+        stream.start()
+    for stream in streams:
+        stream.join()
+    sse_seconds = time.monotonic() - started
+
+    pushed = sum(len(events) for events in results)
+    print(f"轮询: {polls} 次请求（{polling_seconds:.1f}s）；SSE: {tabs} 次请求，推送 {pushed} 条更新（{sse_seconds:.1f}s）")
+    assert all(events[-1][1]["status"] == "completed" for events in results)
+    assert tabs < polls
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""过滤记录紧凑存储：还原的模型与直接创建的一致，分片合并与顺序追加一致，内存占用远小于模型列表"""
+
+import datetime
+import random
+import tracemalloc
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import FilteredRecord
+from app.services.record_store import FilteredRecordStore
+
+RECORD_DATE = "20240501"
+SHANGHAI = datetime.timezone(datetime.timedelta(hours=8))
+
+
+def _sample_records(count: int, seed: int = 0):
+    """生成(过滤类型, 原因, 行号, 详情)，覆盖各详情字段和无详情的记录"""
+    rng = random.Random(seed)
+    samples = []
+    for record_index in range(count):
+        r = rng.random()
+        if r < 0.3:
+            moment = datetime.datetime(2024, 5, 1, rng.randrange(8), rng.randrange(60), 0, rng.randrange(10 ** 6))
+            if rng.random() < 0.5:
+                moment = moment.replace(tzinfo=rng.choice([SHANGHAI, datetime.timezone.utc]))
+            samples.append(("early_morning", "早晨消息", record_index, {"timestamp": moment}))
+        elif r < 0.5:
+            samples.append(("staff_involved", "售后人员参与", record_index,
+                            {"staff_name": rng.choice(["客服A", "客服B", "tineco添可官方旗舰店:小李"])}))
+        elif r < 0.65:
+            samples.append(("address_confirm", "收货地址确认", record_index,
+                            {"address_content": rng.choice(["地址: 杭州", "", "请确认收货地址 " * rng.randrange(3)])}))
+        elif r < 0.75:
+            samples.append(("service_assistant", "全部是服务助手消息", record_index,
+                            {"service_message": rng.choice(["你好", "系统消息"])}))
+        elif r < 0.85:
+            samples.append(("parse_error", "JSON解析失败", record_index, {"error_message": f"位置 {record_index}"}))
+        else:
+            samples.append(("empty_record", "空消息记录", record_index, {}))
+    return samples
+
+def _model(record_date, filter_type, filter_reason, record_index, details):
+    return FilteredRecord(record_id=f"CHT_{record_date}_{record_index:06d}", filter_type=filter_type,
+                          filter_reason=filter_reason, record_index=record_index, **details)
+
+def _store(samples):
+    store = FilteredRecordStore(RECORD_DATE)
+    for filter_type, filter_reason, record_index, details in samples:
+        store.append(filter_type, filter_reason, record_index, **details)
+    return store
+
+def test_records_round_trip():
+    samples = _sample_records(2000)
+    store = _store(samples)
+    store.freeze()
+    assert len(store) == len(samples)
+    assert list(store) == [_model(RECORD_DATE, *sample) for sample in samples]
+
+def test_values_are_validated_like_the_model():
+    store = FilteredRecordStore(RECORD_DATE)
+    store.append("early_morning", "早晨消息", 1, timestamp="2024-05-01T07:00:00+08:00")
+    store.append("staff_involved", "售后人员参与", 2, staff_name=None)
+    with pytest.raises(ValidationError):
+        store.append("address_confirm", "收货地址确认", 3, address_content=42)
+    assert not store.accepts("address_content", 42)
+    assert store.accepts("timestamp", "2024-05-01T07:00:00")
+
+    records = list(store)
+    assert len(records) == 2
+    assert records[0].timestamp == datetime.datetime(2024, 5, 1, 7, tzinfo=SHANGHAI)
+    assert records[1].staff_name is None
+
+@pytest.mark.parametrize("freeze_shards", [False, True])
+def test_extend_matches_sequential_append(freeze_shards):
+    samples = _sample_records(3000, seed=1)
+    merged = FilteredRecordStore(RECORD_DATE)
+    for start in range(0, len(samples), 250):
+        # 各分片的类别和人员编码顺序不同，合并时重新映射
+        shard = _store(list(reversed(samples[start:start + 250])))
+        if freeze_shards:
+            shard.freeze()
+        merged.extend(shard)
+    merged.freeze()
+
+    expected = [record for start in range(0, len(samples), 250)
+                for record in _store(list(reversed(samples[start:start + 250])))]
+    assert list(merged) == expected
+
+def _allocated(build):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, kept
+
+def _compare_memory(count: int):
+    samples = _sample_records(count, seed=2)
+    models_bytes, _ = _allocated(lambda: [_model(RECORD_DATE, *sample) for sample in samples])
+
+    def build_store():
+        store = _store(samples)
+        store.freeze()
+        return store
+
+    store_bytes, store = _allocated(build_store)
+    return models_bytes, store_bytes, store
+
+def test_store_is_much_smaller_than_models():
+    models_bytes, store_bytes, store = _compare_memory(20_000)
+    assert store_bytes * 5 < models_bytes
+    assert store.nbytes() * 5 < models_bytes
+
+@pytest.mark.benchmark
+def test_memory_benchmark():
+    """50万条过滤记录的内存占用"""
+    models_bytes, store_bytes, store = _compare_memory(500_000)
+    print(f"FilteredRecord列表: {models_bytes / 2 ** 20:.1f} MB, "
+          f"紧凑存储: {store_bytes / 2 ** 20:.1f} MB（nbytes {store.nbytes() / 2 ** 20:.1f} MB）, "
+          f"减少 {models_bytes / store_bytes:.1f} 倍")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""列式/逐行引擎、流式读取和多进程分片的分析结果一致"""
+
+import os
+import random
+import time
+
+import pandas as pd
+import pytest
+
+from app.core.config import settings
+from app.services import worker_pool
+from app.services.analyzer import analyzer
+from conftest import make_chat_frame
+
+# 耗时统计和解码后端随运行环境变化，不参与比较
+_VOLATILE_FIELDS = {"rule_stats", "json_backend", "filtered_records_details"}
+
+# pandas默认按缺失值读取的字符串
+_NA_TOKENS = ["NA", "N/A", "#N/A", "null", "NULL", "None", "nan", "NaN", "-nan", "<NA>", "n/a", "1.#QNAN"]
+
+
+def _reset_worker_pool():
+    """关闭进程池，下次使用时按当前的ANALYSIS_WORKERS重新创建"""
+    if worker_pool._worker_pool is not None:
+        worker_pool._worker_pool.shutdown()
+        worker_pool._worker_pool = None
+
+def _analyze(path: str):
+    result = analyzer.snapshot().analyze_excel(path)
+    details = [record.model_dump() for record in result._record_store]
+    return result.model_dump(exclude=_VOLATILE_FIELDS), details
+
+@pytest.fixture(scope="module")
+def na_token_file(tmp_path_factory) -> str:
+    """messages、users、num列含缺失值字符串的文件，末尾一行只有缺失值字符串（pandas不当作空行忽略）"""
+    rng = random.Random(7)
+    frame = make_chat_frame(1999, seed=7)
+    for column in ("messages", "users", "num"):
+        rows = rng.sample(range(len(frame)), 150)
+        frame[column] = frame[column].astype(object)
+        frame.loc[rows, column] = [rng.choice(_NA_TOKENS) for _ in rows]
+    frame.loc[len(frame)] = [rng.choice(_NA_TOKENS) for _ in frame.columns]
+    path = str(tmp_path_factory.mktemp("data") / "chat_na_tokens.xlsx")
+    frame.to_excel(path, index=False)
+    return path
+
+@pytest.fixture(params=["chat_file", "na_token_file"])
+def source_file(request, tmp_path, monkeypatch):
+    path = request.getfixturevalue(request.param)
+    if request.param == "chat_file":
+        yield path
+        return
+    # 售后人员昵称与缺失值字符串相同：users列的缺失值字符串按空单元格读取时才不会被判为售后人员参与
+    monkeypatch.setattr(settings, "STAFF_CONFIG_PATH", str(tmp_path / "staff.json"))
+    old_list = analyzer.get_staff_list()
+    analyzer.update_staff_list(old_list + ["NA", "null"])
+    try:
+        yield path
+    finally:
+        analyzer.update_staff_list(old_list)
+
+@pytest.fixture
+def baseline(source_file, monkeypatch):
+    """逐行引擎、一次读取整个文件、单进程的结果"""
+    monkeypatch.setattr(settings, "ANALYSIS_ENGINE", "row")
+    monkeypatch.setattr(settings, "EXCEL_STREAMING", False)
+    monkeypatch.setattr(settings, "ANALYSIS_WORKERS", 1)
+    return _analyze(source_file)
+
+@pytest.mark.parametrize("engine", ["row", "columnar"])
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_results_match_baseline(source_file, baseline, monkeypatch, engine, streaming, workers):
+    monkeypatch.setattr(settings, "ANALYSIS_ENGINE", engine)
+    monkeypatch.setattr(settings, "EXCEL_STREAMING", streaming)
+    monkeypatch.setattr(settings, "ANALYSIS_WORKERS", workers)
+    monkeypatch.setattr(settings, "STREAMING_BATCH_ROWS", 300)
+
+    summary, details = _analyze(source_file)
+    assert summary == baseline[0]
+    assert details == baseline[1]
+    assert summary["total_records"] == 2000
+    assert summary["filtered_records"] == len(details)
+
+def test_sharded_rule_stats_match(chat_file, monkeypatch):
+    monkeypatch.setattr(settings, "STREAMING_BATCH_ROWS", 300)
+    single = analyzer.snapshot().analyze_excel(chat_file).rule_stats
+    monkeypatch.setattr(settings, "ANALYSIS_WORKERS", 2)
+    sharded = analyzer.snapshot().analyze_excel(chat_file).rule_stats
+
+    def hits(stats):
+        return {rule: (stat["evaluations"], stat["hits"]) for rule, stat in stats.items()}
+
+    assert hits(sharded) == hits(single)
+
+@pytest.mark.benchmark
+def test_sharded_speedup(make_cached_chat_file, monkeypatch):
+    """200k行文件按进程数分片的耗时（进程池首次启动不计入）"""
+    path, _ = make_cached_chat_file(200_000, seed=3)
+    cores = os.cpu_count() or 1
+    timings = {}
+    for workers in sorted({1, 2, 4, cores}):
+        if workers > cores:
+            continue
+        monkeypatch.setattr(settings, "ANALYSIS_WORKERS", workers)
+        _reset_worker_pool()
+        analyzer.snapshot().analyze_excel(path)
+        started = time.perf_counter()
+        analyzer.snapshot().analyze_excel(path)
+        timings[workers] = time.perf_counter() - started
+    _reset_worker_pool()
+
+    for workers, seconds in timings.items():
+        print(f"workers={workers}: {seconds:.2f}s, speedup {timings[1] / seconds:.2f}x")
+    if cores >= 2:
+        assert timings[2] < timings[1]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""售后人员匹配：精确昵称与子串/前缀特征，昵称中的正则元字符按字面匹配，批量与逐个匹配一致，更新名单不影响进行中的分析"""
+
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.analyzer import analyzer
+from app.services.staff_matcher import StaffMatcher
+
+METACHAR_NAMES = ["a.b", "客服(1)", "[vip]*", "x|y", "^start", "end$", "q+?", "\\d"]
+
+
+@pytest.mark.parametrize("user, expected", [
+    ("客服A", True),
+    ("客服A1", False),  # 精确昵称不按子串匹配
+    ("x客服A", False),
+    ("tineco添可官方旗舰店:k12", True),
+    ("店铺tineco添可官方旗舰店:k", True),
+    ("售后-小王", True),
+    ("小王售后-", False),  # 前缀只匹配开头
+    ("", False),
+])
+def test_exact_substring_and_prefix(user, expected):
+    matcher = StaffMatcher(["客服A"], substrings=["tineco添可官方旗舰店:k"], prefixes=["售后-"])
+    assert matcher.matches(user) is expected
+    assert matcher.match_array(np.array([user], dtype=object)).tolist() == [expected]
+
+@pytest.mark.parametrize("name", METACHAR_NAMES)
+def test_regex_metacharacters_are_literal(name):
+    exact = StaffMatcher([name])
+    assert exact.matches(name)
+    assert not exact.matches(name + "1")
+
+    for matcher in (StaffMatcher([], substrings=[name]), StaffMatcher([], prefixes=[name])):
+        assert matcher.matches(name) and matcher.matches(name + "尾")
+        # 按正则解释时才会匹配的用户名
+        for user in ("axb", "客服1", "v", "x", "y", "start", "end", "qq", "5", "ab"):
+            if user != name:
+                assert not matcher.matches(user), (name, user)
+    assert StaffMatcher([], substrings=[name]).matches("头" + name)
+    assert not StaffMatcher([], prefixes=[name]).matches("头" + name)
+
+def test_match_array_matches_scalar_path():
+    rng = random.Random(0)
+    pieces = METACHAR_NAMES + ["客服A", "tineco添可官方旗舰店:k", "售后-", "买家", "", " "]
+    users = ["".join(rng.sample(pieces, rng.randrange(0, 3))) for _ in range(5000)]
+    matcher = StaffMatcher(["客服A", "a.b", "x|y"], substrings=["tineco添可官方旗舰店:k", "(1)"],
+                           prefixes=["售后-", "[vip]*"])
+
+    mask = matcher.match_array(np.array(users, dtype=object))
+    assert mask.tolist() == [matcher.matches(user) for user in users]
+    assert 0 < mask.sum() < len(users)
+    assert matcher.first_match(users) == users[int(np.argmax(mask))]
+    assert matcher.match_array(np.array([], dtype=object)).tolist() == []
+    assert StaffMatcher([]).match_array(np.array(users, dtype=object)).sum() == 0
+
+@pytest.mark.parametrize("engine", ["columnar", "row"])
+def test_update_during_analysis(chat_file, tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(settings, "ANALYSIS_ENGINE", engine)
+    monkeypatch.setattr(settings, "STAFF_CONFIG_PATH", str(tmp_path / "staff.json"))
+    old_list, new_list = analyzer.get_staff_list(), ["客服Z"]
+    old_result = analyzer.snapshot().analyze_excel(chat_file)
+
+    task_analyzer = analyzer.snapshot()
+    updated = []
+
+    def update_once(progress, message=""):
+        # 分析开始后更新全局名单
+        if not updated:
+            analyzer.update_staff_list(new_list)
+            updated.append(progress)
+
+    try:
+        result = task_analyzer.analyze_excel(chat_file, progress_callback=update_once)
+        new_result = analyzer.snapshot().analyze_excel(chat_file)
+    finally:
+        analyzer.update_staff_list(old_list)
+
+    assert updated
+    assert result.staff_involved_count == old_result.staff_involved_count
+    assert list(result._record_store) == list(old_result._record_store)
+    assert new_result.staff_involved_count != old_result.staff_involved_count
+
+def test_snapshot_sees_consistent_list_and_matcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STAFF_CONFIG_PATH", str(tmp_path / "staff.json"))
+    old_list = analyzer.get_staff_list()
+    lists = [[f"客服{i}-{j}" for j in range(50)] for i in range(20)]
+    stop = threading.Event()
+    mismatches = []
+
+    def read():
+        while not stop.is_set():
+            snapshot = analyzer.snapshot()
+            if snapshot.staff_matcher.names != frozenset(snapshot.get_staff_list()):
+                mismatches.append(snapshot.get_staff_list())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for staff_list in lists * 5:
+            analyzer.update_staff_list(staff_list)
+    finally:
+        stop.set()
+        reader.join()
+        analyzer.update_staff_list(old_list)
+    assert not mismatches
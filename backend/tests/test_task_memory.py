@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""内存中的已结束任务数量有上限，淘汰的任务从元数据数据库读取"""
+
+from app.api.endpoints import analysis
+from app.core.config import settings
+
+
+def _finished_in_memory():
+    return [task_id for task_id, info in analysis.analysis_tasks.items()
+            if info["status"] in analysis._FINISHED_STATUSES]
+
+def test_finished_tasks_are_evicted_and_reloaded(client, chat_file, upload, start_task, wait_task, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_MEMORY_CACHE_SIZE", 2)
+    file_id = upload(chat_file)
+
+    task_ids = []
+    for rules in ({"staff_filter": False}, {"address_confirm_filter": False}, {"early_morning_filter": False}):
+        task_id = start_task(file_id, rules)["task_id"]
+        assert wait_task(task_id)["status"] == "completed"
+        task_ids.append(task_id)
+
+    assert len(_finished_in_memory()) <= 2
+    assert task_ids[0] not in analysis.analysis_tasks
+
+    # 淘汰的任务和结果从元数据数据库读取，并重新成为最近访问的任务
+    response = client.get(f"/api/analysis/tasks/{task_ids[0]}/result")
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["result"]["staff_involved_count"] == 0
+    assert task_ids[0] in analysis.analysis_tasks
+    assert len(_finished_in_memory()) <= 2
+
+    listed = {task["task_id"]: task for task in client.get("/api/analysis/tasks").json()["data"]["tasks"]}
+    assert all(listed[task_id]["status"] == "completed" for task_id in task_ids)
+
+    client.delete(f"/api/analysis/tasks/{task_ids[0]}")
+    assert task_ids[0] not in analysis.finished_tasks
+    assert client.get(f"/api/analysis/tasks/{task_ids[0]}").status_code == 404
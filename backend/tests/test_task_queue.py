@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""持久化任务队列：并发领取只有一个成功，租约过期后重新排队或失败，排队位置和预计时间，工作进程执行的任务通过接口可见"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.task_queue import SQLiteTaskQueue
+from app.services.task_scheduler import QueueFullError
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteTaskQueue(str(tmp_path / "queue.db"))
+
+@pytest.fixture
+def short_lease(monkeypatch):
+    monkeypatch.setattr(settings, "TASK_LEASE_SECONDS", 0.5)
+
+def _enqueue(queue, task_id, **kwargs):
+    return queue.enqueue(task_id, "file", "/nonexistent.xlsx", {"timeout": None}, **kwargs)
+
+def test_concurrent_claims_take_each_job_once(queue):
+    for round_index in range(20):
+        _enqueue(queue, f"job-{round_index}")
+        barrier = threading.Barrier(2)
+        claimed = []
+
+        def claim(worker_id):
+            barrier.wait()
+            claimed.append(queue.claim(worker_id))
+
+        claimers = [threading.Thread(target=claim, args=(f"w{i}",)) for i in range(2)]
+        for claimer in claimers:
+            claimer.start()
+        for claimer in claimers:
+            claimer.join()
+
+        jobs = [job for job in claimed if job is not None]
+        assert len(jobs) == 1 and jobs[0]["task_id"] == f"job-{round_index}"
+        assert queue.get(f"job-{round_index}")["worker_id"] == jobs[0]["worker_id"]
+
+def test_expired_lease_is_reclaimed(queue, short_lease):
+    _enqueue(queue, "job")
+    assert queue.claim("w1")["attempts"] == 1
+
+    # 续约期间其他工作进程领取不到任务
+    for _ in range(5):
+        time.sleep(0.2)
+        assert queue.heartbeat("job", "w1", progress=40.0) is False
+        assert queue.claim("w2") is None
+    assert queue.get("job")["progress"] == 40.0
+
+    time.sleep(0.7)
+    job = queue.claim("w2")
+    assert job["task_id"] == "job" and job["attempts"] == 2
+    # 原工作进程的租约已失效：心跳返回None，结果被丢弃
+    assert queue.heartbeat("job", "w1") is None
+    assert not queue.fail("job", "w1", "late")
+    assert queue.get("job")["status"] == "processing"
+
+def test_attempt_limit_marks_job_failed(queue, short_lease, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_MAX_ATTEMPTS", 2)
+    _enqueue(queue, "job")
+    for attempt in (1, 2):
+        assert queue.claim(f"w{attempt}")["attempts"] == attempt
+        time.sleep(0.7)
+
+    assert queue.requeue_expired() == 1
+    job = queue.get("job")
+    assert job["status"] == "failed"
+    assert job["error_message"] == "工作进程失联，任务已达最大重试次数"
+    assert queue.claim("w3") is None
+
+def test_queue_position_and_limit(queue, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_QUEUE_SIZE", 3)
+    assert _enqueue(queue, "large", priority=1) == 1
+    assert _enqueue(queue, "small", priority=0) == 1
+    assert _enqueue(queue, "small-2", priority=0) == 2
+    assert [queue.get_queue_info(task_id)["queue_position"] for task_id in ("small", "small-2", "large")] == [1, 2, 3]
+    with pytest.raises(QueueFullError):
+        _enqueue(queue, "rejected")
+    assert queue.get("rejected") is None
+    assert _enqueue(queue, "accepted", priority=1, bounded=False) == 4
+
+    assert queue.claim("w1")["task_id"] == "small"
+    assert queue.get_queue_info("small")["queue_position"] == 0
+    assert queue.get_queue_info("large")["queue_position"] == 2
+
+def test_eta_from_completed_jobs(queue):
+    _enqueue(queue, "done", estimated_rows=1000)
+    queue.claim("w1")
+    _enqueue(queue, "first", estimated_rows=500)
+    _enqueue(queue, "second", estimated_rows=300)
+    # 尚无已完成任务时不估算
+    assert queue.get_queue_info("second") == {"queue_position": 2, "eta_seconds": None}
+    queue.complete("done", "w1", SimpleNamespace(total_records=1000))
+
+    # 已完成任务1000行用时10秒：100行/秒
+    completed = queue.get("done")["completed_time"]
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE analysis_jobs SET started_time = ? WHERE task_id = 'done'",
+                     ((completed - timedelta(seconds=10)).isoformat(),))
+    assert queue.get_stats()["rows_per_second"] == 100.0
+    assert queue.get_queue_info("first") == {"queue_position": 1, "eta_seconds": 5.0}
+    assert queue.get_queue_info("second") == {"queue_position": 2, "eta_seconds": 8.0}
+
+    # 执行中任务的剩余时间计入排队任务的等待时间
+    queue.claim("w1")
+    assert queue.get_queue_info("first")["queue_position"] == 0
+    assert 4.5 <= queue.get_queue_info("first")["eta_seconds"] <= 5.0
+    assert queue.get_queue_info("second")["queue_position"] == 1
+    assert 7.5 <= queue.get_queue_info("second")["eta_seconds"] <= 8.0
+
+def test_worker_job_completes_through_api(client, chat_file, upload, start_task, wait_task, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "sqlite")
+    task_id = start_task(upload(chat_file))["task_id"]
+    assert wait_task(task_id, {"pending"})["status"] == "pending"
+
+    worker = subprocess.run([sys.executable, "-m", "app.worker", "--once", "--worker-id", "test-worker"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300)
+    assert worker.returncode == 0, worker.stderr
+
+    assert wait_task(task_id)["status"] == "completed"
+    result = client.get(f"/api/analysis/tasks/{task_id}/result").json()["data"]["result"]
+    assert result["total_records"] == 2000
+    assert client.get("/api/analysis/stats").json()["data"]["task_queue"]["status_counts"]["completed"] >= 1
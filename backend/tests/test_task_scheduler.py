@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""任务调度：排队任务数达到上限时返回429，小文件优先执行，报告的排队位置与执行顺序一致"""
+
+import os
+
+import pytest
+
+from app.api.endpoints import analysis
+from app.core.config import settings
+from app.services.task_queue import QueueWatcher, SQLiteTaskQueue
+from app.services.task_scheduler import AnalysisScheduler
+
+# 各任务使用不同的规则，不会附加到相同请求的任务上
+RULE_SETS = [{"staff_filter": False}, {"early_morning_filter": False},
+             {"service_assistant_filter": False}, {"address_confirm_filter": False}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue_backend(request, monkeypatch, tmp_path):
+    """内存调度器（第一个任务停住占用唯一的执行槽位）或没有工作进程的持久化队列，排队上限为2"""
+    monkeypatch.setattr(settings, "ANALYSIS_QUEUE_SIZE", 2)
+    if request.param == "memory":
+        monkeypatch.setattr(analysis, "scheduler", AnalysisScheduler(1, settings.ANALYSIS_QUEUE_SIZE))
+    else:
+        queue = SQLiteTaskQueue(str(tmp_path / "queue.db"))
+        monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "sqlite")
+        monkeypatch.setattr(analysis, "task_queue", queue)
+        monkeypatch.setattr(analysis, "queue_watcher", QueueWatcher(queue))
+    return request.param
+
+def test_full_queue_returns_429(client, chat_file, upload, start_task, wait_task, task_status,
+                                blocking_analysis, queue_backend):
+    file_id = upload(chat_file)
+    tasks = [start_task(file_id, RULE_SETS[0])["task_id"]]
+    if queue_backend == "memory":
+        wait_task(tasks[0], {"processing"})
+        tasks.append(start_task(file_id, RULE_SETS[1])["task_id"])
+    tasks.append(start_task(file_id, RULE_SETS[2])["task_id"])
+    assert task_status(tasks[-1])["queue_position"] == 2
+
+    task_count = len(client.get("/api/analysis/tasks").json()["data"]["tasks"])
+    response = client.post("/api/analysis/start", json={"file_id": file_id, "filter_rules": RULE_SETS[3]})
+    assert response.status_code == 429
+    assert "队列已满" in response.json()["detail"]
+    # 被拒绝的请求不留下任务记录
+    assert len(client.get("/api/analysis/tasks").json()["data"]["tasks"]) == task_count
+
+    for task_id in reversed(tasks):
+        client.delete(f"/api/analysis/tasks/{task_id}")
+    blocking_analysis.release.set()
+    for task_id in tasks:
+        assert wait_task(task_id)["status"] in ("completed", "cancelled")
+
+def test_small_files_run_first(client, make_chat_file, upload, start_task, wait_task, task_status,
+                               blocking_analysis, monkeypatch):
+    small, large = make_chat_file(300, seed=31), make_chat_file()
+    # 小文件阈值在两个文件大小之间
+    threshold = (os.path.getsize(small) + os.path.getsize(large)) / 2
+    monkeypatch.setattr(settings, "ANALYSIS_SMALL_FILE_MB", threshold / 1024 / 1024)
+    small_id, large_id = upload(small), upload(large)
+
+    running = start_task(large_id, RULE_SETS[0])["task_id"]
+    wait_task(running, {"processing"})
+    queued = [start_task(large_id, RULE_SETS[1]), start_task(large_id, RULE_SETS[2]), start_task(small_id)]
+    assert [task["queue_position"] for task in queued] == [1, 2, 1]
+    statuses = [task_status(task["task_id"]) for task in queued]
+    assert [status["queue_position"] for status in statuses] == [2, 3, 1]
+    assert [status["priority"] for status in statuses] == ["large", "large", "small"]
+
+    blocking_analysis.release.set()
+    for task in queued:
+        assert wait_task(task["task_id"])["status"] == "completed"
+    assert blocking_analysis.started == [large_id, small_id, large_id, large_id]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""规则调整试算：what-if接口的计数与按相同规则重新分析的结果一致，包括检查出错和详情无法保存的记录"""
+
+import copy
+import json
+import time
+
+import pandas as pd
+import pytest
+
+from app.services.analyzer import analyzer
+
+from conftest import SERVICE_ASSISTANT, make_chat_frame
+
+SUMMARY_FIELDS = {"total_records", "filtered_records", "valid_records", "filter_rate", "early_morning_count",
+                  "staff_involved_count", "service_assistant_count", "address_confirm_count",
+                  "parse_error_count", "empty_records_count"}
+UPDATES = [
+    {},
+    {"early_morning_filter": {"enabled": False}},
+    {"staff_filter": {"enabled": False}},
+    {"service_assistant_filter": {"enabled": False}},
+    {"address_confirm_filter": {"enabled": False}},
+    {"early_morning_filter": {"start_hour": 6, "end_hour": 13}},
+    {"early_morning_filter": {"end_hour": 5}, "staff_filter": {"enabled": False}},
+    {rule: {"enabled": False} for rule in ("early_morning_filter", "staff_filter",
+                                            "service_assistant_filter", "address_confirm_filter")},
+]
+
+
+def _row(messages, users=None):
+    return {"platform": "taobao", "date": "2024-05-01", "messages": json.dumps(messages, ensure_ascii=False),
+            "user_nick": "u", "shop_name": "tineco", "users": users, "num": 1}
+
+def _edge_rows():
+    """检查出错（服务助手消息内容不是字符串）、详情无法保存（地址不是字符串）和带时区的时间"""
+    assistant = {"sender_nick": SERVICE_ASSISTANT, "content": {"text": 3}}
+    address = {"sender_nick": "买家1", "content": {"summary": "请确认收货地址", "text": 3}}
+    rows = []
+    for time_str in ("2024-05-01T12:00:00", "2024-05-01T07:30:00", "2024-05-01T23:30:00Z", "2024-05-01T07:00:00+00:00"):
+        rows.append(_row([{**assistant, "time": time_str}]))
+        rows.append(_row([{**address, "time": time_str}]))
+        rows.append(_row([{**address, "time": time_str, "content": {"summary": "请确认收货地址", "text": {"a": 1}}}],
+                         users="客服A"))
+        rows.append(_row([{**assistant, "time": time_str}, {**address, "time": time_str}], users="客服B"))
+    return pd.DataFrame(rows * 5)
+
+@pytest.fixture(scope="module")
+def what_if_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("what_if") / "what_if.xlsx")
+    pd.concat([make_chat_frame(1500, seed=21), _edge_rows()], ignore_index=True).to_excel(path, index=False)
+    return path
+
+@pytest.fixture(scope="module")
+def completed_task(client, what_if_file):
+    with open(what_if_file, "rb") as f:
+        file_id = client.post("/api/upload/", files={"file": ("what_if.xlsx", f)}).json()["data"]["file_id"]
+    task_id = client.post("/api/analysis/start", json={"file_id": file_id}).json()["data"]["task_id"]
+    deadline = time.monotonic() + 60
+    while client.get(f"/api/analysis/tasks/{task_id}").json()["data"]["status"] != "completed":
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return task_id
+
+def _reanalyze(path, updates):
+    filter_rules = copy.deepcopy(analyzer.filter_rules)
+    for rule_id, rule_config in updates.items():
+        filter_rules[rule_id].update(rule_config)
+    task_analyzer = analyzer.snapshot()
+    task_analyzer.filter_rules = filter_rules
+    return filter_rules, task_analyzer.analyze_excel(path).model_dump(include=SUMMARY_FIELDS)
+
+@pytest.mark.parametrize("updates", UPDATES)
+def test_what_if_matches_reanalysis(client, completed_task, what_if_file, updates):
+    filter_rules, expected = _reanalyze(what_if_file, updates)
+    response = client.post(f"/api/analysis/tasks/{completed_task}/what-if", json=updates)
+    assert response.status_code == 200, response.text
+    data = response.json()["data"]
+
+    assert data["filter_rules"] == filter_rules
+    assert {key: data["result"][key] for key in SUMMARY_FIELDS} == expected
+    overlap = data["rule_overlap"]
+    assert overlap["exclusive_counts"].keys() <= overlap["matrix"].keys()
+
+def test_errored_and_invalid_details_count_as_parse_errors(client, completed_task):
+    def parse_errors(updates):
+        response = client.post(f"/api/analysis/tasks/{completed_task}/what-if", json=updates)
+        return response.json()["data"]["result"]["parse_error_count"]
+
+    baseline = parse_errors({})
+    # 服务助手检查出错、地址详情无法保存的记录只在规则启用且轮到该规则时计为解析错误
+    assert parse_errors({"service_assistant_filter": {"enabled": False}}) < baseline
+    assert parse_errors({"address_confirm_filter": {"enabled": False}}) < baseline
+    # 早晨消息规则先命中时不再检查后续规则
+    assert parse_errors({"early_morning_filter": {"start_hour": 0, "end_hour": 24}}) < baseline
+
+def test_what_if_errors(client, completed_task, chat_file, upload, start_task, wait_task, blocking_analysis):
+    response = client.post("/api/analysis/tasks/no-such-task/what-if", json={})
+    assert response.status_code == 404
+
+    for updates in ({"no_such_rule": {"enabled": False}}, {"early_morning_filter": {"end_hour": 25}},
+                    {"early_morning_filter": {"start_hour": "6"}}):
+        response = client.post(f"/api/analysis/tasks/{completed_task}/what-if", json=updates)
+        assert response.status_code == 400, updates
+
+    task_id = start_task(upload(chat_file))["task_id"]
+    wait_task(task_id, {"processing"})
+    response = client.post(f"/api/analysis/tasks/{task_id}/what-if", json={})
+    assert response.status_code == 409
+    blocking_analysis.release.set()
+    wait_task(task_id)
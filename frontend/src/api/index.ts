@@ -14,6 +14,15 @@ const getBaseURL = () => {
   return baseURL
 }
 
+// 获取进度推送地址（EventSource/WebSocket不经过axios，需要完整地址）
+const getStreamURL = (path: string, protocol: 'http' | 'ws' = 'http') => {
+  const url = new URL(getBaseURL() + path, window.location.href)
+  if (protocol === 'ws') {
+    url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:'
+  }
+  return url.toString()
+}
+
 // 创建axios实例
 const api = axios.create({
   baseURL: getBaseURL(),
@@ -92,8 +101,15 @@ export interface AnalysisTask {
   error_message?: string
   result?: AnalysisResult
   status_message?: string
+  queue_position?: number
+  eta_seconds?: number
 }
 
+// 进度推送的任务状态（不含分析结果）
+export type TaskProgressEvent = Omit<AnalysisTask, 'file_id' | 'filename' | 'created_time' | 'result'>
+
+export const FINISHED_STATUSES = ['completed', 'failed', 'cancelled']
+
 export interface FilterRule {
   rule_id: string
   name: string
@@ -189,6 +205,62 @@ export const analysisAPI = {
     return api.get<any, { success: boolean; message: string; data: AnalysisTask }>(`/analysis/tasks/${taskId}`)
   },
 
+  // 订阅任务进度（Server-Sent Events），任务结束或被删除后自动关闭，返回关闭函数
+  streamTaskProgress: (taskId: string, onProgress: (event: TaskProgressEvent) => void, onError?: () => void) => {
+    const source = new EventSource(getStreamURL(`/analysis/tasks/${taskId}/events`))
+    let finished = false
+    source.addEventListener('progress', (message) => {
+      const event: TaskProgressEvent = JSON.parse((message as MessageEvent).data)
+      if (FINISHED_STATUSES.includes(event.status)) {
+        finished = true
+        source.close()
+      }
+      onProgress(event)
+    })
+    source.addEventListener('deleted', () => {
+      finished = true
+      source.close()
+    })
+    source.onerror = () => {
+      // 服务端在任务结束后关闭连接，其他错误由EventSource自动重连
+      if (!finished && source.readyState === EventSource.CLOSED) {
+        onError?.()
+      }
+    }
+    return () => source.close()
+  },
+
+  // 在一个WebSocket连接上订阅多个任务的进度
+  connectTaskProgress: (onProgress: (event: TaskProgressEvent) => void, onClose?: () => void) => {
+    const socket = new WebSocket(getStreamURL('/analysis/ws', 'ws'))
+    const pending: string[] = []
+    socket.onopen = () => {
+      if (pending.length) {
+        socket.send(JSON.stringify({ subscribe: pending.splice(0) }))
+      }
+    }
+    socket.onmessage = (message) => {
+      const { event, data } = JSON.parse(message.data)
+      if (event === 'progress') {
+        onProgress(data)
+      }
+    }
+    socket.onclose = () => onClose?.()
+    return {
+      subscribe: (taskIds: string[]) => {
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(JSON.stringify({ subscribe: taskIds }))
+        } else {
+          pending.push(...taskIds)
+        }
+      },
+      close: () => {
+        socket.onclose = null
+        socket.close()
+      }
+    }
+  },
+
   // 获取任务列表
   getTasks: () => {
     return api.get<any, { success: boolean; message: string; data: { tasks: AnalysisTask[]; total: number } }>('/analysis/tasks')
@@ -315,8 +387,10 @@ export const systemAPI = {
   },
 
   // 获取系统日志
-  getLogs: () => {
-    return api.get<any, { success: boolean; message: string; data: { logs: any[]; total: number } }>('/system/logs')
+  getLogs: (params?: { level?: string; task_id?: string; limit?: number }) => {
+    return api.get<any, { success: boolean; message: string; data: { logs: any[]; total: number } }>('/system/logs', {
+      params
+    })
   }
 }
 